@@ -0,0 +1,53 @@
+# background_refill.py
+"""
+預生成池 (opener_pool、script_library) 共用的背景補充 task。
+
+子類別實作 refill_once()，並設定 refill_interval；
+start() 需在 startup 事件 (event loop 內) 呼叫，stop() 在 shutdown 時取消 task。
+單輪補充拋出例外時只記錄並計數，背景 task 不會因此停止。
+"""
+
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Optional
+
+
+class BackgroundRefill(ABC):
+    refill_interval: float = 10.0
+    refill_errors: int = 0
+    _task: Optional[asyncio.Task] = None
+
+    @abstractmethod
+    async def refill_once(self) -> bool:
+        """補充一份內容，有加入時回傳 True"""
+
+    async def _after_refill(self):
+        """每輪補充後的額外工作 (例如寫回檔案)，預設不做事"""
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refill_interval)
+            try:
+                await self.refill_once()
+                await self._after_refill()
+            except Exception as e:
+                self.refill_errors += 1
+                print(f"{type(self).__name__} 背景補充失敗: {e!r}")
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """在 event loop 中啟動背景補充 (需在 startup 事件呼叫)"""
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
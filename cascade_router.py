@@ -0,0 +1,106 @@
+# cascade_router.py
+"""
+偵測流程 (本地層 -> Plan A) 的延遲預算路由。
+
+LINE 回覆與網頁對等待時間的容忍度差很多，原本一律給 Plan A 20 秒。
+現在每個請求帶一個延遲預算 (各端點預設值或 X-Latency-Budget-Ms 標頭)：
+- 本地層跑完後，若剩餘預算不足以涵蓋最近 Plan A 延遲的 p95，直接略過 LLM；
+- 否則以剩餘預算作為 Plan A 的等待上限，逾時就先回傳本地層的最佳判斷，
+  並標記 provisional=True。Plan A 本身不受預算截斷 (async 路徑為背景 task，
+  LINE 同步路徑交給執行緒池)，仍以完整逾時跑完並寫入快取。
+各層延遲以滑動視窗記錄，門檻 (p95) 會隨實際負載自動調整。
+Plan A 延遲只由實際呼叫後端的 leader 記錄 (含逾時失敗)，每次呼叫一筆；
+等待逾時的請求與合併等待者不另外記錄，避免同一次呼叫重複計入或以較短的等待時間拉低 p95。
+"""
+
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, Optional
+
+from latency_stats import percentile, summarize_ms
+
+
+class LatencyTracker:
+    """各層最近 window 筆延遲 (秒) 與路由決策統計"""
+
+    def __init__(self, window: int = 200, min_samples: int = 5):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self.decisions = Counter()
+
+    def record(self, tier: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(tier)
+            if samples is None:
+                samples = self._samples[tier] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, tier: str, q: float) -> Optional[float]:
+        """樣本數不足 min_samples 時回傳 None (尚無法估計)"""
+        with self._lock:
+            samples = sorted(self._samples.get(tier, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return percentile(samples, q)
+
+    def decide(self, decision: str):
+        with self._lock:
+            self.decisions[decision] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            tiers = {tier: list(samples) for tier, samples in self._samples.items()}
+            decisions = dict(self.decisions)
+        summary = {}
+        for tier, samples in tiers.items():
+            if not samples:
+                continue
+            summary[tier] = {"samples": len(samples), **summarize_ms(samples, stats=("p50", "p95", "max"))}
+        return {"tiers": summary, "decisions": decisions}
+
+
+class Deadline:
+    """單一請求的延遲預算 (budget=None 表示不限)"""
+    __slots__ = ("budget", "started")
+
+    def __init__(self, budget: Optional[float]):
+        self.budget = budget
+        self.started = time.monotonic()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> Optional[float]:
+        if self.budget is None:
+            return None
+        return self.budget - self.elapsed()
+
+
+def plan_a_timeout(tracker: LatencyTracker, deadline: Deadline, max_timeout: float) -> Optional[float]:
+    """
+    決定 Plan A 的等待上限 (秒)；回傳 None 表示應略過 LLM 直接回傳暫定結果。
+    """
+    remaining = deadline.remaining()
+    if remaining is None:
+        tracker.decide("llm_full")
+        return max_timeout
+    p95 = tracker.percentile("plan_a", 0.95)
+    if remaining <= 0 or (p95 is not None and remaining < p95):
+        tracker.decide("skip_llm")
+        return None
+    tracker.decide("llm_with_deadline" if remaining < max_timeout else "llm_full")
+    return min(max_timeout, remaining)
+
+
+def parse_budget_header(value: Optional[str], default: Optional[float]) -> Optional[float]:
+    """X-Latency-Budget-Ms 標頭 (毫秒) 轉成秒；格式錯誤或未提供時使用預設值"""
+    if not value:
+        return default
+    try:
+        ms = float(value)
+    except ValueError:
+        return default
+    return ms / 1000 if ms > 0 else default
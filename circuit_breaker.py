@@ -0,0 +1,169 @@
+# circuit_breaker.py
+"""
+本地 LLM 後端 (每個 URL + 模型一組) 的斷路器。
+
+Ollama 掛掉或過載時，原本每個 Plan A 都要等滿 20 秒才回傳保底答案，
+詐騙模擬也要等 15–20 秒。斷路器以滑動視窗追蹤最近的失敗率與延遲：
+- closed：正常放行；最近 window 次中失敗 (含超過 slow_call_seconds 的慢呼叫)
+  比例達 failure_rate 時轉為 open。
+- open：直接拋出 CircuitOpenError，呼叫端立即回傳保底答案；
+  經過 open_seconds 後轉為 half_open。
+- half_open：只放行 half_open_trials 個試探請求；成功即恢復 closed，失敗再回到 open。
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from latency_stats import summarize_ms
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """斷路器開啟中，呼叫端應立即改用保底回覆"""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_call_seconds: Optional[float] = 15.0, open_seconds: float = 30.0, half_open_trials: int = 1):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_trials = half_open_trials
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)   # True = 失敗或過慢
+        self._latencies = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trials = 0
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+        self.last_error: Optional[str] = None
+
+    # --- 狀態轉換 (需持有 lock) ---
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._trials = 0
+        self.stats["opened"] += 1
+
+    def _close(self):
+        self.state = CLOSED
+        self._outcomes.clear()
+        self._trials = 0
+
+    def _enter(self):
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+                self._trials = 0
+            if self.state == OPEN or (self.state == HALF_OPEN and self._trials >= self.half_open_trials):
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(f"{self.name} 斷路器開啟中")
+            if self.state == HALF_OPEN:
+                self._trials += 1
+            self.stats["calls"] += 1
+
+    def _record(self, failed: bool, latency: Optional[float] = None, error: Optional[str] = None):
+        with self._lock:
+            if latency is not None:
+                self._latencies.append(latency)
+            if failed:
+                self.stats["failures"] += 1
+                self.last_error = error
+            if self.state == HALF_OPEN:
+                if failed:
+                    self._open()
+                else:
+                    self._close()
+                return
+            if self.state == OPEN:
+                return
+            self._outcomes.append(failed)
+            if len(self._outcomes) >= self.min_calls:
+                if sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+                    self._open()
+
+    def _release_trial(self):
+        with self._lock:
+            if self.state == HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    # --- 對外介面 ---
+    def allow(self) -> bool:
+        """不佔用試探名額的快速檢查 (排隊前先確認，開啟中就不必排隊)"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at < self.open_seconds:
+                self.stats["rejected"] += 1
+                return False
+            return True
+
+    @contextmanager
+    def call(self, slow_after: Optional[float] = None):
+        """
+        包住一次後端呼叫：例外記為失敗 (呼叫端取消除外)，
+        超過 slow_after (預設 slow_call_seconds) 的呼叫記為慢呼叫。
+        sync 與 async 函式中都可使用 (進出區塊本身不需 await)。
+        """
+        self._enter()
+        started = time.monotonic()
+        try:
+            yield
+        except (GeneratorExit, asyncio.CancelledError):
+            # 呼叫端中斷 (例如串流連線關閉) 不算後端失敗
+            self._release_trial()
+            raise
+        except BaseException as e:
+            self._record(True, time.monotonic() - started, f"{type(e).__name__}: {e}")
+            raise
+        latency = time.monotonic() - started
+        threshold = slow_after if slow_after is not None else self.slow_call_seconds
+        slow = threshold is not None and latency > threshold
+        if slow:
+            self.stats["slow_calls"] += 1
+        self._record(slow, latency, f"slow call {latency:.1f}s" if slow else None)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = list(self._latencies)
+            outcomes = list(self._outcomes)
+            state = self.state
+            if state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                state = HALF_OPEN
+            return {
+                **self.stats,
+                "state": state,
+                "failure_rate": round(sum(outcomes) / len(outcomes), 3) if outcomes else 0.0,
+                **summarize_ms(latencies, "latency_", ("p50", "p95"), empty=None, digits=1),
+                "open_for_s": round(time.monotonic() - self._opened_at, 1) if self.state == OPEN else None,
+                "last_error": self.last_error,
+            }
+
+
+class CircuitBreakerRegistry:
+    """依 (後端 URL, 模型) 取得共用的斷路器"""
+
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str, model: str) -> CircuitBreaker:
+        key = (url, model)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(key)
+                if breaker is None:
+                    breaker = self._breakers[key] = CircuitBreaker(f"{model}@{url}", **self.defaults)
+        return breaker
+
+    def snapshot(self) -> dict:
+        return {breaker.name: breaker.snapshot() for breaker in list(self._breakers.values())}
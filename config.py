@@ -14,11 +14,115 @@ LIVE_AI_MODEL = os.environ.get("LIVE_AI_MODEL", "llama3.1:8b")
 # 本地/後備 Ollama 實例的 URL
 OLLAMA_API_URL = os.environ.get("OLLAMA_API_URL", "http://127.0.0.1:11434/api/generate")
 OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.1:8b") # 用於生成腳本等
+# 同一個 Ollama 實例的 /api/chat (scammer-pro 對話用)，斷路器與排程器依此 URL 分組
+OLLAMA_CHAT_URL = OLLAMA_API_URL.replace("/generate", "/chat")
+
+# 共用 Ollama 連線池 (所有 async 路由共用同一個 httpx.AsyncClient)
+OLLAMA_MAX_CONNECTIONS = int(os.environ.get("OLLAMA_MAX_CONNECTIONS", "20"))
+OLLAMA_MAX_KEEPALIVE = int(os.environ.get("OLLAMA_MAX_KEEPALIVE", "10"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.environ.get("OLLAMA_KEEPALIVE_EXPIRY", "30"))
+# 模擬對話請求帶 keep_alive，讓模型與上一輪的 prompt 前綴快取常駐 (Ollama 預設 5 分鐘即卸載)
+OLLAMA_MODEL_KEEP_ALIVE = os.environ.get("OLLAMA_MODEL_KEEP_ALIVE", "30m")
+
+# --- 偵測規則資料檔 ---
+SAFE_DOMAINS_PATH = os.environ.get("SAFE_DOMAINS_PATH", "data/safe_domains.txt")
+KEYWORD_RULES_PATH = os.environ.get("KEYWORD_RULES_PATH", "data/keyword_rules.csv")
+# 同一類別命中規則的權重總和需達此門檻，Plan B 才會判定
+KEYWORD_MIN_WEIGHT = float(os.environ.get("KEYWORD_MIN_WEIGHT", "1.0"))
+
+# 策展答案 CSV (keyword, risk_score, scam_type, analysis)，與 baked_results.DEMO_ANSWERS 合併成快速答案索引
+CURATED_ANSWERS_PATH = os.environ.get("CURATED_ANSWERS_PATH", "data/curated_answers.csv")
+
+# --- Plan C 本地分類器 (python text_classifier.py train 產生模型檔) ---
+SCAM_CLASSIFIER_PATH = os.environ.get("SCAM_CLASSIFIER_PATH", "data/scam_classifier.json")
+# 與類別中心的相似度與領先第二名的差距都達門檻才直接回傳，否則交給 Plan A
+CLASSIFIER_MIN_SIMILARITY = float(os.environ.get("CLASSIFIER_MIN_SIMILARITY", "0.4"))
+CLASSIFIER_MIN_MARGIN = float(os.environ.get("CLASSIFIER_MIN_MARGIN", "0.05"))
+# 延遲預算不足時的暫定結果：最佳猜測的相似度達此門檻才標示類型，否則回傳「可疑訊息」
+CLASSIFIER_PROVISIONAL_MIN_SIMILARITY = float(os.environ.get("CLASSIFIER_PROVISIONAL_MIN_SIMILARITY", "0.2"))
+
+# --- 偵測結果快取 (Plan A 之前) ---
+DETECTION_CACHE_TTL = float(os.environ.get("DETECTION_CACHE_TTL", "3600"))
+DETECTION_CACHE_MAX_BYTES = int(os.environ.get("DETECTION_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+# SimHash 漢明距離門檻 (0 = 關閉近似重複查詢，最大 7)
+DETECTION_CACHE_NEAR_DISTANCE = int(os.environ.get("DETECTION_CACHE_NEAR_DISTANCE", "6"))
+
+# --- LLM 排程器：同時送往 Ollama 的請求上限 (依 GPU/CPU 可並行數設定，對應 OLLAMA_NUM_PARALLEL) ---
+LLM_MAX_INFLIGHT = int(os.environ.get("LLM_MAX_INFLIGHT", "2"))
+
+# --- LINE 開場白預生成池：每個模式/情境補到 TARGET 句 (上限 MAX)，LLM 閒置時每 INTERVAL 秒最多生成一句 ---
+OPENER_POOL_TARGET = int(os.environ.get("OPENER_POOL_TARGET", "5"))
+OPENER_POOL_MAX = int(os.environ.get("OPENER_POOL_MAX", "20"))
+OPENER_POOL_REFILL_INTERVAL = float(os.environ.get("OPENER_POOL_REFILL_INTERVAL", "10"))
+
+# --- 模擬腳本庫：依 (情境, 回合數) 預先生成並持久化，/generate_script 與 /preset_script 直接取用 ---
+SCRIPT_LIBRARY_PATH = os.environ.get("SCRIPT_LIBRARY_PATH", "data/script_library.json")
+# 背景固定補充的回合數 (其他回合數被請求過後也會加入補充名單)
+SCRIPT_LIBRARY_TURNS = [int(t) for t in os.environ.get("SCRIPT_LIBRARY_TURNS", "6").split(",") if t.strip()]
+SCRIPT_LIBRARY_TARGET = int(os.environ.get("SCRIPT_LIBRARY_TARGET", "10"))
+SCRIPT_LIBRARY_MAX = int(os.environ.get("SCRIPT_LIBRARY_MAX", "30"))
+SCRIPT_LIBRARY_MAX_AGE = float(os.environ.get("SCRIPT_LIBRARY_MAX_AGE", str(7 * 86400)))
+SCRIPT_LIBRARY_REFILL_INTERVAL = float(os.environ.get("SCRIPT_LIBRARY_REFILL_INTERVAL", "30"))
+
+# --- LLM 斷路器 (每個後端 URL + 模型)：最近 WINDOW 次呼叫中失敗/過慢比例達門檻即開啟 ---
+BREAKER_WINDOW = int(os.environ.get("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.environ.get("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.environ.get("BREAKER_SLOW_CALL_SECONDS", "15"))
+# 開啟後經過多少秒才放行半開試探請求
+BREAKER_OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+
+# --- 延遲預算 (秒)：剩餘預算不足以涵蓋 Plan A 的 p95 延遲時先回傳暫定結果 ---
+PLAN_A_TIMEOUT = float(os.environ.get("PLAN_A_TIMEOUT", "20"))
+WEB_DETECTION_BUDGET = float(os.environ.get("WEB_DETECTION_BUDGET", "20"))
+LINE_DETECTION_BUDGET = float(os.environ.get("LINE_DETECTION_BUDGET", "5"))
+
+# --- 批次分析 (/analyze/batch) ---
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "500"))
+# 批次中同時送往 detector-pro 的最大請求數
+BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", "4"))
+
+# --- 偵測紀錄庫 (SQLite) ---
+INCIDENT_DB_PATH = os.environ.get("INCIDENT_DB_PATH", "data/incidents.db")
+# 記憶體中最近紀錄視窗大小 (後台統計範圍) 與後台即時列表顯示筆數
+RECENT_LOGS_SIZE = int(os.environ.get("RECENT_LOGS_SIZE", "50"))
+ADMIN_FEED_SIZE = int(os.environ.get("ADMIN_FEED_SIZE", "50"))
+
+# --- 後台 AI 趨勢報告：最短重新生成間隔 (秒)，或累積多少筆新紀錄就提前更新 (提前更新仍至少間隔 MIN_GAP 秒) ---
+TREND_REPORT_INTERVAL = float(os.environ.get("TREND_REPORT_INTERVAL", "60"))
+TREND_REPORT_MIN_NEW_LOGS = int(os.environ.get("TREND_REPORT_MIN_NEW_LOGS", "5"))
+TREND_REPORT_MIN_GAP = float(os.environ.get("TREND_REPORT_MIN_GAP", "15"))
+
+# --- 165dashboard 上游代理 ---
+# 可指向替身上游服務；設定 FIXTURE_DIR 時改讀本地 JSON ({endpoint}_{date}.json 或 {endpoint}.json)
+DASHBOARD_165_BASE_URL = os.environ.get("DASHBOARD_165_BASE_URL", "https://165dashboard.tw/CIB_DWS_API/api/Dashboard")
+DASHBOARD_165_FRESH_TTL = float(os.environ.get("DASHBOARD_165_FRESH_TTL", "300"))
+# 上游更新失敗後多少秒內不再重試 (期間回傳舊資料)
+DASHBOARD_165_ERROR_BACKOFF = float(os.environ.get("DASHBOARD_165_ERROR_BACKOFF", "30"))
+DASHBOARD_165_FIXTURE_DIR = os.environ.get("DASHBOARD_165_FIXTURE_DIR") or None
+
+# --- 地圖資料 ---
+VILLAGE_COORDS_PATH = os.environ.get("VILLAGE_COORDS_PATH", "data/village_coordinates.csv")
+VILLAGE_SCAM_PATH = os.environ.get("VILLAGE_SCAM_PATH", "data/熱區地圖_clean.csv")
+SCAM_TYPES_PATH = os.environ.get("SCAM_TYPES_PATH", "data/scam_types.csv")
+HEATMAP_DISTRICTS_PATH = os.environ.get("HEATMAP_DISTRICTS_PATH", "data/heatmap_data.csv")
 
 # --- LINE Bot Settings ---
 # ⚠️ 在正式環境中，這些應該透過環境變數設定！
 LINE_CHANNEL_ACCESS_TOKEN = os.environ.get("LINE_CHANNEL_ACCESS_TOKEN", "u0kmXd6Pxz10i1mqZSmF5F8VrNqjVeodxRW/ZywFH+Tp6QJjHZ9H/zx63mVpAhq/P0ymkagvkxRaLjBDZnY+fsfcOn7DjwY1MAUWZHetzXe/AujFFE2HLcrIHIC0TysjI3phFPViVFy1XYb8MuIFYwdB04t89/1O/w1cDnyilFU=")
 LINE_CHANNEL_SECRET = os.environ.get("LINE_CHANNEL_SECRET", "22e4735405c5a12e476beea0c6f7a591")
+# LINE 事件背景處理 (Webhook 立即回 200，事件交給背景執行緒)
+LINE_WORKERS = int(os.environ.get("LINE_WORKERS", "4"))
+LINE_QUEUE_SIZE = int(os.environ.get("LINE_QUEUE_SIZE", "200"))
+# LINE 使用者 session：閒置秒數、最大人數、每人保留的對話則數
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", "1800"))
+SESSION_MAX = int(os.environ.get("SESSION_MAX", "10000"))
+SESSION_MAX_HISTORY = int(os.environ.get("SESSION_MAX_HISTORY", "20"))
+# 模擬對話的 prompt 預算 (粗估 token)：最近原文上限與滾動摘要上限
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "600"))
+CONTEXT_SUMMARY_TOKENS = int(os.environ.get("CONTEXT_SUMMARY_TOKENS", "200"))
+PROFILE_IDLE_TTL = float(os.environ.get("PROFILE_IDLE_TTL", "86400"))
+PROFILE_MAX = int(os.environ.get("PROFILE_MAX", "50000"))
 LINE_LIFF_URL = os.environ.get("LINE_LIFF_URL", "https://liff.line.me/2008549238-ONbaKA12")
 
 # --- Google Maps API Key ---
@@ -0,0 +1,2 @@
+# conftest.py
+# 讓 tests/ 可以直接 import 專案根目錄的模組 (pytest 會把此檔所在目錄加入 sys.path)
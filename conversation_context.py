@@ -0,0 +1,120 @@
+# conversation_context.py
+"""
+詐騙模擬對話 (LINE scamming / simulating、get_scammer_response、/chat_reply) 共用的對話上下文。
+
+原本 LINE 演練模式每一輪都把完整 history 送給 /api/chat，prompt 處理時間隨輪數成長；
+其他路徑則直接截斷成最近 5 句，前文全部遺失。現在每段對話維護：
+- system prompt (固定)
+- 滾動摘要：超出 token 預算的舊對話逐句壓縮成「誰：說了什麼」的摘要行，摘要本身也有上限；
+- 最近幾輪原文：總 token 數不超過 token_budget。
+超出預算時一次把最近原文折疊到 low_water 比例以下 (而非每輪滑動一句)，
+讓送出的前綴 (system + 摘要 + 較早的原文) 在多數輪次保持不變，
+Ollama 可重用上一輪的 prompt 前綴快取 (搭配 keep_alive 讓模型常駐)。
+同一段 history 重新建立會得到相同結果，因此無狀態的網頁端點也能共用。
+"""
+
+import sys
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+
+def estimate_tokens(text: str) -> int:
+    """粗估 token 數：CJK 等非 ASCII 字元約 1 字 1 token，ASCII 約 4 字 1 token"""
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4 + 1
+
+
+def normalize_turn(msg: Dict[str, str]) -> Dict[str, str]:
+    """同時接受 {"role", "content"} 與前端的 {"from", "text"} 格式"""
+    if "role" in msg:
+        return {"role": msg["role"], "content": msg.get("content", "")}
+    role = "user" if msg.get("from") == "user" else "assistant"
+    return {"role": role, "content": msg.get("text", "")}
+
+
+class ConversationContext:
+    """單一對話的 token 預算上下文 (system + 滾動摘要 + 最近原文)"""
+    __slots__ = ("token_budget", "summary_tokens", "low_water", "summary_line_chars",
+                 "recent", "_recent_tokens", "summary", "_summary_tokens", "folded")
+
+    def __init__(self, token_budget: int = 600, summary_tokens: int = 200, low_water: float = 0.5,
+                 summary_line_chars: int = 40, max_turns: int = 40):
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.low_water = low_water
+        self.summary_line_chars = summary_line_chars
+        self.recent: deque = deque(maxlen=max_turns)
+        self._recent_tokens = 0
+        self.summary: deque = deque()   # 摘要行 (最舊的在前)
+        self._summary_tokens = 0
+        self.folded = 0
+
+    @classmethod
+    def from_history(cls, history: Iterable[Dict[str, str]], **kwargs) -> "ConversationContext":
+        """由前端送來的完整 history 重建 (無狀態端點用)"""
+        context = cls(**kwargs)
+        for msg in history:
+            context.append(**normalize_turn(msg))
+        return context
+
+    def __len__(self) -> int:
+        return len(self.recent)
+
+    def append(self, role: str, content: str):
+        if len(self.recent) == self.recent.maxlen:
+            self._fold_one()
+        self.recent.append((role, content, estimate_tokens(content)))
+        self._recent_tokens += self.recent[-1][2]
+        if self._recent_tokens > self.token_budget:
+            # 一次折疊到 low_water 以下，前綴在接下來幾輪維持不變
+            target = self.token_budget * self.low_water
+            while len(self.recent) > 1 and self._recent_tokens > target:
+                self._fold_one()
+
+    def _fold_one(self):
+        role, content, tokens = self.recent.popleft()
+        self._recent_tokens -= tokens
+        speaker = "對方" if role == "user" else "我"
+        snippet = content if len(content) <= self.summary_line_chars else content[:self.summary_line_chars] + "…"
+        line = f"{speaker}：{snippet}"
+        line_tokens = estimate_tokens(line)
+        self.summary.append((line, line_tokens))
+        self._summary_tokens += line_tokens
+        while len(self.summary) > 1 and self._summary_tokens > self.summary_tokens:
+            self._summary_tokens -= self.summary.popleft()[1]
+        self.folded += 1
+
+    def summary_text(self) -> str:
+        return "\n".join(line for line, _ in self.summary)
+
+    def messages(self, system_prompt: str) -> List[Dict[str, str]]:
+        """組成 /api/chat 的 messages"""
+        messages = [{"role": "system", "content": system_prompt}]
+        if self.summary:
+            messages.append({"role": "system", "content": f"先前對話摘要：\n{self.summary_text()}"})
+        messages.extend({"role": role, "content": content} for role, content, _ in self.recent)
+        return messages
+
+    def transcript(self, user_label: str = "user", assistant_label: str = "scammer") -> str:
+        """組成 /api/generate prompt 用的逐行對話紀錄 (摘要 + 最近原文)"""
+        lines = []
+        if self.summary:
+            lines.append(f"(先前對話摘要)\n{self.summary_text()}")
+        for role, content, _ in self.recent:
+            lines.append(f"- {user_label if role == 'user' else assistant_label}: {content}")
+        return "\n".join(lines)
+
+    def prompt_tokens(self) -> int:
+        return self._recent_tokens + self._summary_tokens
+
+    def approx_bytes(self) -> int:
+        size = sys.getsizeof(self) + sys.getsizeof(self.recent) + sys.getsizeof(self.summary)
+        for role, content, _ in self.recent:
+            size += sys.getsizeof(content)
+        for line, _ in self.summary:
+            size += sys.getsizeof(line)
+        return size
+
+    def snapshot(self) -> Dict[str, Optional[int]]:
+        return {"recent_turns": len(self.recent), "recent_tokens": self._recent_tokens,
+                "summary_lines": len(self.summary), "summary_tokens": self._summary_tokens, "folded": self.folded}
@@ -0,0 +1,177 @@
+# crime_data.py
+"""
+/api/crime_data 的模擬案件點產生器 (NumPy 向量化)。
+
+原本每次請求都重新讀 CSV，並以 Python 迴圈對每一件案件呼叫 random，
+回傳的 list of dict 每次都不同，成本隨案件數線性成長。
+現在：
+- 以「日期 + 資料版本 (CSV 內容雜湊)」為種子，一次向量化產生所有點，
+  同一天、同一份資料的結果固定且可重現。
+- 結果快取，並以欄式 (columnar) 格式回傳：lat / lng / day / type / district 平行陣列，
+  type 與 district 為索引，對應 types / districts 名稱表。
+- 熱區圖可直接取用伺服器端依格子 (cell) 預先分箱的計數，不必在瀏覽器繪製原始點。
+"""
+
+import calendar
+import csv
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+_DEFAULT_TYPES = ["假投資", "假網拍"]
+
+
+def _encode(payload: dict) -> Tuple[bytes, bytes, str]:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    return body, gzip.compress(body, mtime=0), etag
+
+
+class CrimeDataset:
+    """模擬案件點；依日期與資料版本快取 (包含預先序列化的 JSON)"""
+
+    def __init__(self, types_path: str, districts_path: str, spread_deg: float = 0.05, cache_size: int = 8):
+        self.types_path = types_path
+        self.districts_path = districts_path
+        self.spread_deg = spread_deg
+        self.cache_size = cache_size
+        self._inputs = None
+        self._mtimes: Optional[Tuple[float, float]] = None
+        self._points: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._encoded: "OrderedDict[tuple, Tuple[bytes, bytes, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"generated": 0, "cache_hits": 0}
+
+    # --- 來源資料 ---
+    def _load_inputs(self):
+        """讀取詐騙類型與行政區 CSV；檔案 mtime 沒變時沿用上次結果"""
+        mtimes = (os.path.getmtime(self.types_path), os.path.getmtime(self.districts_path))
+        if self._inputs is not None and mtimes == self._mtimes:
+            return self._inputs
+        with open(self.types_path, mode="r", encoding="utf-8") as infile:
+            scam_types = [row["type"] for row in csv.DictReader(infile)]
+        if not scam_types:
+            scam_types = list(_DEFAULT_TYPES)
+        names, lat, lng, cases = [], [], [], []
+        with open(self.districts_path, mode="r", encoding="utf-8") as infile:
+            for row in csv.DictReader(infile):
+                names.append(row["district"])
+                lat.append(float(row["lat"]))
+                lng.append(float(row["lng"]))
+                cases.append(int(row["cases"]))
+        digest = hashlib.blake2b(json.dumps([scam_types, names, lat, lng, cases], ensure_ascii=False).encode("utf-8"), digest_size=8)
+        self._inputs = {
+            "version": digest.hexdigest(),
+            "types": scam_types,
+            "districts": names,
+            "lat": np.asarray(lat, dtype=np.float64),
+            "lng": np.asarray(lng, dtype=np.float64),
+            "cases": np.asarray(cases, dtype=np.int64).clip(min=0),
+        }
+        self._mtimes = mtimes
+        return self._inputs
+
+    # --- 產生 ---
+    def _generate(self, inputs: dict, date: datetime.date) -> dict:
+        seed = int.from_bytes(hashlib.blake2b(f"{date.isoformat()}:{inputs['version']}".encode(), digest_size=8).digest(), "big")
+        rng = np.random.default_rng(seed)
+        district = np.repeat(np.arange(len(inputs["districts"]), dtype=np.int32), inputs["cases"])
+        n = district.size
+        days_in_month = calendar.monthrange(date.year, date.month)[1]
+        return {
+            "lat": inputs["lat"][district] + (rng.random(n) - 0.5) * self.spread_deg,
+            "lng": inputs["lng"][district] + (rng.random(n) - 0.5) * self.spread_deg,
+            "day": rng.integers(1, min(30, days_in_month) + 1, size=n, dtype=np.int32),
+            "type": rng.integers(0, len(inputs["types"]), size=n, dtype=np.int32),
+            "district": district,
+        }
+
+    def _get_points(self, date: datetime.date) -> Tuple[dict, dict]:
+        inputs = self._load_inputs()
+        key = (date, inputs["version"])
+        with self._lock:
+            points = self._points.get(key)
+            if points is not None:
+                self._points.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return inputs, points
+        points = self._generate(inputs, date)
+        with self._lock:
+            self._points[key] = points
+            while len(self._points) > self.cache_size:
+                self._points.popitem(last=False)
+            self.stats["generated"] += 1
+        return inputs, points
+
+    def _cached_encode(self, key: tuple, build) -> Tuple[bytes, bytes, str]:
+        with self._lock:
+            encoded = self._encoded.get(key)
+            if encoded is not None:
+                self._encoded.move_to_end(key)
+                return encoded
+        encoded = _encode(build())
+        with self._lock:
+            self._encoded[key] = encoded
+            while len(self._encoded) > self.cache_size * 4:
+                self._encoded.popitem(last=False)
+        return encoded
+
+    # --- 輸出 ---
+    def points(self, date: datetime.date) -> Tuple[bytes, bytes, str]:
+        """欄式案件點：回傳 (JSON bytes, gzip bytes, ETag)"""
+        inputs, points = self._get_points(date)
+
+        def build():
+            return {
+                "month": date.strftime("%Y-%m"),
+                "version": inputs["version"],
+                "count": int(points["district"].size),
+                "types": inputs["types"],
+                "districts": inputs["districts"],
+                "lat": np.round(points["lat"], 5).tolist(),
+                "lng": np.round(points["lng"], 5).tolist(),
+                "day": points["day"].tolist(),
+                "type": points["type"].tolist(),
+                "district": points["district"].tolist(),
+            }
+
+        return self._cached_encode(("points", date, inputs["version"]), build)
+
+    def heatmap(self, date: datetime.date, cell_deg: float = 0.005, scam_type: Optional[int] = None) -> Tuple[bytes, bytes, str]:
+        """依 cell_deg 格子預先分箱的熱區計數 (格子中心座標 + 件數)"""
+        inputs, points = self._get_points(date)
+
+        def build():
+            lat, lng = points["lat"], points["lng"]
+            if scam_type is not None:
+                mask = points["type"] == scam_type
+                lat, lng = lat[mask], lng[mask]
+            cells = np.stack([np.floor(lat / cell_deg), np.floor(lng / cell_deg)], axis=1).astype(np.int64)
+            if cells.size:
+                unique, counts = np.unique(cells, axis=0, return_counts=True)
+            else:
+                unique, counts = np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64)
+            return {
+                "month": date.strftime("%Y-%m"),
+                "version": inputs["version"],
+                "cell_deg": cell_deg,
+                "lat": np.round((unique[:, 0] + 0.5) * cell_deg, 6).tolist(),
+                "lng": np.round((unique[:, 1] + 0.5) * cell_deg, 6).tolist(),
+                "count": counts.tolist(),
+            }
+
+        return self._cached_encode(("heatmap", date, inputs["version"], cell_deg, scam_type), build)
+
+    def type_names(self) -> List[str]:
+        return self._load_inputs()["types"]
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "cached_days": len(self._points), "cached_payloads": len(self._encoded),
+                "version": self._inputs["version"] if self._inputs else None}
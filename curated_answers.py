@@ -0,0 +1,97 @@
+# curated_answers.py
+"""
+預烘焙答案 (baked_results.DEMO_ANSWERS + 可選的策展答案 CSV) 的快速答案索引。
+
+- 所有觸發字串先經 normalize_text (全半形、大小寫、空白) 正規化，
+  再編進一個 Aho-Corasick 自動機；每則訊息只掃描一次，
+  成本與文字長度成正比，策展條目擴充到數千筆也不會線性比對。
+- 高風險答案只要訊息「包含」觸發字串即命中；
+  低風險答案 (risk_score < low_risk_below) 必須整則訊息就是觸發字串，
+  避免「hihi + 詐騙內容」被判成正常訊息。
+- 同時命中多筆時，取風險最高者，其次取觸發字串最長者。
+- 策展 CSV 欄位：keyword, risk_score, scam_type, analysis；同一觸發字串以 CSV 為準。
+"""
+
+import csv
+from typing import Dict, NamedTuple, Optional
+
+from keyword_engine import KeywordAutomaton
+from result_cache import normalize_text
+
+
+class CuratedAnswer(NamedTuple):
+    keyword: str          # 正規化後的觸發字串
+    trigger: str          # 原始觸發字串 (顯示用)
+    risk_score: int
+    scam_type: str
+    analysis: str
+
+
+def load_curated_answers(path: str) -> Dict[str, dict]:
+    """讀取策展答案 CSV，回傳與 DEMO_ANSWERS 相同格式的 dict"""
+    answers = {}
+    with open(path, mode="r", encoding="utf-8-sig") as infile:
+        for row in csv.DictReader(infile):
+            keyword = (row.get("keyword") or "").strip()
+            scam_type = (row.get("scam_type") or "").strip()
+            if not keyword or not scam_type:
+                continue
+            try:
+                risk_score = int(float(row.get("risk_score") or 0))
+            except ValueError:
+                continue
+            answers[keyword] = {"risk_score": risk_score, "scam_type": scam_type, "analysis": (row.get("analysis") or "").strip()}
+    return answers
+
+
+class CuratedAnswerIndex:
+    def __init__(self, answers: Dict[str, dict], low_risk_below: int = 50):
+        self.low_risk_below = low_risk_below
+        entries: Dict[str, CuratedAnswer] = {}
+        for trigger, answer in answers.items():
+            keyword = normalize_text(trigger)
+            if not keyword:
+                continue
+            entries[keyword] = CuratedAnswer(
+                keyword=keyword,
+                trigger=trigger,
+                risk_score=int(answer.get("risk_score", 0)),
+                scam_type=answer.get("scam_type", "可疑訊息"),
+                analysis=answer.get("analysis", ""),
+            )
+        self._exact = entries
+        self.automaton = KeywordAutomaton(list(entries.values()))
+        self.stats = {"lookups": 0, "hits": 0}
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def lookup(self, text: str) -> Optional[CuratedAnswer]:
+        """回傳命中的預烘焙答案，沒有則回傳 None"""
+        self.stats["lookups"] += 1
+        normalized = normalize_text(text)
+        best = self._exact.get(normalized)
+        for _, answer in self.automaton.scan(normalized):
+            if answer.risk_score < self.low_risk_below:
+                continue
+            if best is None or (answer.risk_score, len(answer.keyword)) > (best.risk_score, len(best.keyword)):
+                best = answer
+        if best is not None:
+            self.stats["hits"] += 1
+        return best
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "entries": len(self)}
+
+
+def build_answer_index(demo_answers: Dict[str, dict], curated_path: Optional[str] = None, low_risk_below: int = 50) -> CuratedAnswerIndex:
+    """合併 DEMO_ANSWERS 與策展 CSV (若存在) 建立索引"""
+    answers = dict(demo_answers)
+    if curated_path:
+        try:
+            answers.update(load_curated_answers(curated_path))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"策展答案載入失敗 ({curated_path}): {e}")
+    return CuratedAnswerIndex(answers, low_risk_below=low_risk_below)
@@ -0,0 +1,100 @@
+# domain_whitelist.py
+"""
+Plan S 白名單網域索引。
+
+- 網域清單從 data/safe_domains.txt 載入一次，存成 hashed suffix set。
+- 每個網址只需依 hostname 的 label 數逐一查表 (O(labels))，
+  與白名單大小無關，可擴充到數萬筆銀行 / 電信 / 政府網域。
+- 檔案 mtime 變動時自動重新載入 (熱更新)。
+"""
+
+import os
+import re
+import threading
+import time
+import urllib.parse
+from typing import Iterable, List, Optional
+
+URL_PATTERN = re.compile(r'https?://[^\s/$.?#].[^\s]*')
+
+
+def _normalize_domain(domain: str) -> str:
+    return domain.strip().lower().strip(".")
+
+
+class DomainWhitelist:
+    """以 suffix set 實作的白名單，支援檔案熱更新"""
+
+    def __init__(self, path: str, check_interval: float = 2.0, fallback: Iterable[str] = ()):
+        self.path = path
+        self.check_interval = check_interval
+        self._fallback = frozenset(_normalize_domain(d) for d in fallback if d.strip())
+        self._domains = self._fallback
+        self._mtime: Optional[float] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self) -> bool:
+        """重新讀取網域檔案，成功回傳 True；讀取失敗時保留原本的清單"""
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, mode="r", encoding="utf-8") as infile:
+                domains = set()
+                for line in infile:
+                    line = line.split("#", 1)[0]
+                    domain = _normalize_domain(line)
+                    if domain:
+                        domains.add(domain)
+        except Exception as e:
+            print(f"白名單載入失敗 ({self.path}): {e}")
+            return False
+        with self._lock:
+            self._domains = frozenset(domains) or self._fallback
+            self._mtime = mtime
+        print(f"--- 白名單已載入 {len(self._domains)} 個網域 ---")
+        return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def __len__(self) -> int:
+        return len(self._domains)
+
+    def match_hostname(self, hostname: str) -> Optional[str]:
+        """回傳命中的白名單網域 (hostname 本身或其上層網域)，未命中回傳 None"""
+        self._maybe_reload()
+        domains = self._domains
+        labels = _normalize_domain(hostname).split(".")
+        for i in range(len(labels)):
+            suffix = ".".join(labels[i:])
+            if suffix in domains:
+                return suffix
+        return None
+
+    def match_text(self, text: str) -> Optional[str]:
+        """掃描文字中的網址，回傳第一個命中的白名單網域"""
+        for url in find_urls(text):
+            try:
+                hostname = urllib.parse.urlparse(url).hostname
+            except Exception as e:
+                print(f"URL 解析錯誤: {e}")
+                continue
+            if hostname:
+                matched = self.match_hostname(hostname)
+                if matched:
+                    return matched
+        return None
+
+
+def find_urls(text: str) -> List[str]:
+    return URL_PATTERN.findall(text)
@@ -0,0 +1,225 @@
+# incident_store.py
+"""
+持久化的偵測紀錄 (SQLite, WAL 模式)。
+
+- append-only：add() 只把紀錄放進佇列，由背景執行緒批次寫入，
+  不佔用請求路徑的時間。
+- 以完整時間戳 (epoch 秒) 儲存，並對時間、來源、詐騙類型、風險建立索引。
+- query() 以 id 做 keyset 分頁 (cursor)，一律依 id 由新到舊掃描、湊滿一頁即停止：
+  - ts 隨寫入遞增，時間範圍先以 ts 索引換成 id 範圍 (各一次索引查找)，不必依 ts 取出後再排序；
+  - 風險區間不走 risk 索引 (區間內 id 無序，需整批排序)，改沿 id 掃描過濾；單一風險值仍走 (risk, id) 索引。
+"""
+
+import datetime
+import json
+import queue
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS incidents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    source TEXT NOT NULL,
+    text TEXT NOT NULL,
+    scam_type TEXT,
+    risk INTEGER,
+    district TEXT,
+    job TEXT,
+    user_profile TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_incidents_ts ON incidents (ts);
+CREATE INDEX IF NOT EXISTS idx_incidents_source ON incidents (source, id);
+CREATE INDEX IF NOT EXISTS idx_incidents_type ON incidents (scam_type, id);
+CREATE INDEX IF NOT EXISTS idx_incidents_risk ON incidents (risk, id);
+"""
+
+_COLUMNS = "id, ts, source, text, scam_type, risk, user_profile"
+
+# 多執行緒呼叫 add() 時，寫入順序與 ts 可能有些微交錯；換算 id 範圍時放寬這麼多秒，再以 ts 精確過濾
+TS_ORDER_SLACK = 1.0
+
+
+def _as_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def row_to_log(row) -> dict:
+    """將資料列轉回與 RECENT_LOGS 相同格式的 dict"""
+    ts = row[1]
+    dt = datetime.datetime.fromtimestamp(ts)
+    return {
+        "id": row[0],
+        "time": dt.strftime("%H:%M:%S"),
+        "timestamp": dt.isoformat(timespec="seconds"),
+        "source": row[2],
+        "text": row[3],
+        "type": row[4] if row[4] is not None else "N/A",
+        "risk": row[5] if row[5] is not None else 0,
+        "user_profile": json.loads(row[6]) if row[6] else {},
+    }
+
+
+class IncidentStore:
+    def __init__(self, path: str, batch_size: int = 200, flush_interval: float = 0.5, max_pending: int = 10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self._local = threading.local()
+        self.stats = {"written": 0, "dropped": 0, "batches": 0, "write_errors": 0}
+
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        conn.close()
+
+        self._writer = threading.Thread(target=self._write_loop, name="incident-writer", daemon=True)
+        self._writer.start()
+
+    # --- 寫入 (背景批次) ---
+    def add(self, log_entry: dict, ts: float):
+        """把一筆紀錄排入寫入佇列 (不阻塞)"""
+        profile = log_entry.get("user_profile") or {}
+        row = (
+            ts,
+            log_entry.get("source", ""),
+            log_entry.get("text", ""),
+            log_entry.get("type"),
+            _as_int(log_entry.get("risk")),
+            profile.get("district"),
+            profile.get("job"),
+            json.dumps(profile, ensure_ascii=False) if profile else None,
+        )
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            batch = []
+            item = self._queue.get()
+            if item is None:
+                break
+            batch.append(item)
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._flush(conn, batch)
+            if stop:
+                break
+        conn.close()
+
+    def _flush(self, conn, batch: List[tuple]):
+        try:
+            conn.executemany(
+                "INSERT INTO incidents (ts, source, text, scam_type, risk, district, job, user_profile) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+            conn.commit()
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+        except Exception as e:
+            print(f"❌ 偵測紀錄寫入失敗 ({len(batch)} 筆): {e}")
+            self.stats["write_errors"] += 1
+            self.stats["dropped"] += len(batch)
+
+    def close(self, timeout: float = 5.0):
+        """送出結束訊號並等待尚未寫入的紀錄寫完"""
+        self._queue.put(None)
+        self._writer.join(timeout=timeout)
+
+    # --- 查詢 ---
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def _first_id_since(self, ts: float) -> Optional[int]:
+        """第一筆 ts >= 指定時間的 id (沒有時回傳 None)"""
+        row = self._reader().execute("SELECT id FROM incidents WHERE ts >= ? ORDER BY ts LIMIT 1", (ts,)).fetchone()
+        return row[0] if row else None
+
+    def query(self, limit: int = 50, cursor: Optional[int] = None, source: Optional[str] = None,
+              scam_type: Optional[str] = None, min_risk: Optional[int] = None, max_risk: Optional[int] = None,
+              since: Optional[float] = None, until: Optional[float] = None, q: Optional[str] = None) -> dict:
+        """
+        依新到舊回傳紀錄；cursor 為上一頁最後一筆的 id。
+        回傳 {"logs": [...], "next_cursor": id 或 None}
+        """
+        clauses, params = [], []
+        # 時間範圍換成 id 範圍；ts 條件加上 + 前綴，避免 SQLite 改走 ts 索引再排序
+        if since is not None:
+            low_id = self._first_id_since(since - TS_ORDER_SLACK)
+            if low_id is None:
+                return {"logs": [], "next_cursor": None}
+            clauses.append("id >= ? AND +ts >= ?")
+            params.extend((low_id, since))
+        if until is not None:
+            high_id = self._first_id_since(until + TS_ORDER_SLACK)
+            clauses.append("+ts < ?")
+            params.append(until)
+            if high_id is not None:
+                clauses.append("id < ?")
+                params.append(high_id)
+        if cursor is not None:
+            clauses.append("id < ?")
+            params.append(cursor)
+        if source:
+            clauses.append("source = ?")
+            params.append(source)
+        if scam_type:
+            clauses.append("scam_type = ?")
+            params.append(scam_type)
+        if min_risk is not None and min_risk == max_risk:
+            clauses.append("risk = ?")
+            params.append(min_risk)
+        else:
+            if min_risk is not None:
+                clauses.append("+risk >= ?")
+                params.append(min_risk)
+            if max_risk is not None:
+                clauses.append("+risk <= ?")
+                params.append(max_risk)
+        if q:
+            clauses.append("text LIKE ?")
+            params.append(f"%{q}%")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        limit = max(1, min(limit, 500))
+        rows = self._reader().execute(
+            f"SELECT {_COLUMNS} FROM incidents {where} ORDER BY id DESC LIMIT ?", (*params, limit + 1)
+        ).fetchall()
+        logs = [row_to_log(r) for r in rows[:limit]]
+        next_cursor = logs[-1]["id"] if len(rows) > limit else None
+        return {"logs": logs, "next_cursor": next_cursor}
+
+    def recent(self, limit: int) -> List[dict]:
+        return self.query(limit=limit)["logs"]
+
+    def count(self) -> int:
+        return self._reader().execute("SELECT COUNT(*) FROM incidents").fetchone()[0]
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "pending": self._queue.qsize(), "path": self.path}
@@ -0,0 +1,131 @@
+# keyword_engine.py
+"""
+Plan B 關鍵字規則引擎 (Aho-Corasick 多模式比對)。
+
+- 規則從 data/keyword_rules.csv 載入 (欄位：keyword, scam_type, weight, risk_score)，
+  啟動時建成一個 Aho-Corasick 自動機。
+- 每則訊息只掃描一次，即可取得所有命中的關鍵字與類別，
+  成本與文字長度成正比，不會隨規則數量線性增加。
+- 英文關鍵字不分大小寫。
+"""
+
+import csv
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class KeywordRule(NamedTuple):
+    keyword: str
+    scam_type: str
+    weight: float
+    risk_score: int
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 自動機：一次掃描回傳所有命中的規則"""
+
+    def __init__(self, rules: List[KeywordRule]):
+        self.rules = rules
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        for rule_id, rule in enumerate(rules):
+            self._insert(rule.keyword.lower(), rule_id)
+        self._build_fail_links()
+
+    def _insert(self, word: str, rule_id: int):
+        node = 0
+        for ch in word:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(rule_id)
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())  # 第一層節點的 fail 指向 root
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(ch, 0)
+                # 合併 fail 節點的輸出，掃描時就不必再沿 fail 鏈回溯
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def scan(self, text: str) -> List[Tuple[int, KeywordRule]]:
+        """回傳 [(結束位置, 規則), ...]，依出現順序排列"""
+        hits = []
+        goto, fail, out, rules = self._goto, self._fail, self._out, self.rules
+        node = 0
+        for pos, ch in enumerate(text.lower()):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                for rule_id in out[node]:
+                    hits.append((pos, rules[rule_id]))
+        return hits
+
+
+class KeywordRuleEngine:
+    """依命中規則的權重總和判斷詐騙類型"""
+
+    def __init__(self, rules: List[KeywordRule], min_weight: float = 1.0):
+        self.min_weight = min_weight
+        self.automaton = KeywordAutomaton(rules)
+        # 類別的先後順序 (權重相同時，以規則檔中先出現的類別為準)
+        self._type_order = {}
+        for rule in rules:
+            self._type_order.setdefault(rule.scam_type, len(self._type_order))
+
+    def __len__(self) -> int:
+        return len(self.automaton.rules)
+
+    def classify(self, text: str) -> Optional[dict]:
+        """
+        回傳 {"scam_type", "risk_score", "keywords", "weight"}；
+        沒有任何類別的權重達到門檻時回傳 None。
+        """
+        by_type: Dict[str, dict] = {}
+        for _, rule in self.automaton.scan(text):
+            entry = by_type.setdefault(rule.scam_type, {"weight": 0.0, "risk_score": 0, "keywords": []})
+            if rule.keyword in entry["keywords"]:
+                continue
+            entry["keywords"].append(rule.keyword)
+            entry["weight"] += rule.weight
+            entry["risk_score"] = max(entry["risk_score"], rule.risk_score)
+
+        candidates = [(t, e) for t, e in by_type.items() if e["weight"] >= self.min_weight]
+        if not candidates:
+            return None
+        scam_type, entry = min(candidates, key=lambda item: (-item[1]["weight"], self._type_order[item[0]]))
+        return {"scam_type": scam_type, **entry}
+
+
+def load_keyword_rules(path: str) -> List[KeywordRule]:
+    """讀取規則 CSV；weight / risk_score 欄位可省略 (預設 1.0 / 95)"""
+    rules = []
+    with open(path, mode="r", encoding="utf-8-sig") as infile:
+        reader = csv.DictReader(infile)
+        for row in reader:
+            keyword = (row.get("keyword") or "").strip()
+            scam_type = (row.get("scam_type") or "").strip()
+            if not keyword or not scam_type:
+                continue
+            try:
+                rules.append(KeywordRule(
+                    keyword=keyword,
+                    scam_type=scam_type,
+                    weight=float(row.get("weight") or 1.0),
+                    risk_score=int(float(row.get("risk_score") or 95)),
+                ))
+            except ValueError:
+                continue
+    return rules
@@ -0,0 +1,35 @@
+# latency_stats.py
+"""
+排程器、工作池、斷路器與延遲路由共用的延遲樣本統計。
+
+各模組以 deque(maxlen=...) 保存最近的樣本 (秒)，snapshot 時排序後取平均 / 分位數 / 最大值，
+統一換算成毫秒輸出。
+"""
+
+from typing import Dict, Iterable, Optional, Sequence
+
+
+def percentile(ordered: Sequence[float], q: float) -> float:
+    """已排序樣本的 q 分位數 (最近秩次法，呼叫端須確認樣本非空)"""
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def summarize_ms(samples: Iterable[float], prefix: str = "", stats: Sequence[str] = ("avg", "p95", "max"),
+                 empty: Optional[float] = 0.0, digits: int = 2) -> Dict[str, Optional[float]]:
+    """
+    將秒數樣本整理成 {f"{prefix}{stat}_ms": 毫秒}；stat 可為 avg、max 或 p50 / p95 等分位數。
+    沒有樣本時各欄位皆為 empty。
+    """
+    ordered = sorted(samples)
+    summary = {}
+    for stat in stats:
+        if not ordered:
+            value = empty
+        elif stat == "avg":
+            value = round(sum(ordered) / len(ordered) * 1000, digits)
+        elif stat == "max":
+            value = round(ordered[-1] * 1000, digits)
+        else:
+            value = round(percentile(ordered, int(stat[1:]) / 100) * 1000, digits)
+        summary[f"{prefix}{stat}_ms"] = value
+    return summary
@@ -0,0 +1,66 @@
+# live_feed.py
+"""
+後台即時推播 (SSE) 的 fan-out。
+
+- add_log 可能在 event loop 或 LINE 背景執行緒中被呼叫，
+  publish() 一律透過 call_soon_threadsafe 交回 event loop 分發。
+- 每個訂閱者有自己的有上限佇列；跟不上的慢速連線不會拖慢其他人，
+  佇列滿時清空並改送一次 resync，讓該客戶端重新取得完整快照。
+"""
+
+import asyncio
+from typing import Optional, Set, Tuple
+
+
+class Subscriber:
+    def __init__(self, maxsize: int):
+        self.queue: "asyncio.Queue[Tuple[str, Optional[dict]]]" = asyncio.Queue(maxsize=maxsize)
+        self.resyncs = 0
+
+    def offer(self, item: Tuple[str, Optional[dict]]):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # 慢速客戶端：丟掉積壓的事件，改送一次完整快照
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(("resync", None))
+            self.resyncs += 1
+
+    async def get(self) -> Tuple[str, Optional[dict]]:
+        return await self.queue.get()
+
+
+class LiveFeed:
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: Set[Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats = {"published": 0, "resyncs": 0}
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def subscribe(self) -> Subscriber:
+        sub = Subscriber(self.queue_size)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self._subscribers.discard(sub)
+        self.stats["resyncs"] += sub.resyncs
+
+    def publish(self, event: str, data: dict):
+        """可從任何執行緒呼叫"""
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self._subscribers:
+            return
+        loop.call_soon_threadsafe(self._fanout, (event, data))
+
+    def _fanout(self, item: Tuple[str, Optional[dict]]):
+        self.stats["published"] += 1
+        for sub in list(self._subscribers):
+            sub.offer(item)
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "subscribers": len(self._subscribers), "queue_size": self.queue_size}
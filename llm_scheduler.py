@@ -0,0 +1,211 @@
+# llm_scheduler.py
+"""
+所有 Ollama 呼叫共用的優先權排程器 / 並行上限。
+
+detector-pro、scammer-pro 與 OLLAMA_MODEL 都跑在同一台機器上，
+原本各路徑 (LINE 查證、網頁 /analyze、詐騙模擬、腳本生成、後台報告) 各自發送請求，
+一波 60 秒的腳本生成就能把真正受害者的查證擠到後面。
+
+- 全域同時執行數上限 (max_inflight，對應 GPU/CPU 可並行的 slot 數)。
+- 依類別排隊，嚴格優先權：LINE 查證 > 網頁查證 > 互動模擬 > 批次查證 > 後台/背景。
+- 每個類別的佇列有上限，滿了或等待超過 max_wait 立即拋出 LLMOverloaded，
+  呼叫端沿用原本的保底回覆 (load shedding)。
+- async 路由與 LINE 背景執行緒共用同一個排程器；
+  以 threading.Lock 保護狀態，async 等待者透過 call_soon_threadsafe 喚醒。
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, NamedTuple, Optional
+
+from latency_stats import summarize_ms
+
+
+class LLMOverloaded(Exception):
+    """排隊已滿或等待逾時，呼叫端應改用保底回覆"""
+
+
+class PriorityClass(NamedTuple):
+    name: str
+    priority: int      # 數字越小越優先
+    max_queue: int
+    max_wait: float    # 秒
+
+
+# 預設類別 (依優先權排序)
+LINE_DETECT = "line_detect"
+WEB_DETECT = "web_detect"
+SIMULATION = "simulation"
+BATCH_DETECT = "batch_detect"
+BACKGROUND = "background"
+
+DEFAULT_CLASSES = (
+    PriorityClass(LINE_DETECT, 0, max_queue=50, max_wait=10.0),
+    PriorityClass(WEB_DETECT, 1, max_queue=50, max_wait=10.0),
+    PriorityClass(SIMULATION, 2, max_queue=20, max_wait=15.0),
+    PriorityClass(BATCH_DETECT, 3, max_queue=20, max_wait=30.0),
+    PriorityClass(BACKGROUND, 4, max_queue=5, max_wait=30.0),
+)
+
+
+class _Waiter:
+    __slots__ = ("granted", "cancelled", "event", "loop", "future", "enqueued_at")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.granted = False
+        self.cancelled = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.enqueued_at = time.monotonic()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class _ClassStats:
+    __slots__ = ("admitted", "shed_full", "shed_timeout", "waits")
+
+    def __init__(self):
+        self.admitted = 0
+        self.shed_full = 0
+        self.shed_timeout = 0
+        self.waits = deque(maxlen=500)
+
+
+class LLMScheduler:
+    def __init__(self, max_inflight: int = 2, classes=DEFAULT_CLASSES):
+        self.max_inflight = max_inflight
+        self.classes: Dict[str, PriorityClass] = {c.name: c for c in classes}
+        self._order = sorted(self.classes.values(), key=lambda c: c.priority)
+        self._queues: Dict[str, deque] = {c.name: deque() for c in classes}
+        self._stats: Dict[str, _ClassStats] = {c.name: _ClassStats() for c in classes}
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    # --- 核心 ---
+    def _try_enter(self, cls: PriorityClass, waiter_factory):
+        """可立即執行時回傳 None，否則回傳已排入佇列的 waiter"""
+        with self._lock:
+            stats = self._stats[cls.name]
+            # 有更高 (或同等) 優先權的人在排隊時不插隊
+            ahead = any(self._queues[c.name] for c in self._order if c.priority <= cls.priority)
+            if self._inflight < self.max_inflight and not ahead:
+                self._inflight += 1
+                stats.admitted += 1
+                stats.waits.append(0.0)
+                return None
+            queue = self._queues[cls.name]
+            if len(queue) >= cls.max_queue:
+                stats.shed_full += 1
+                raise LLMOverloaded(f"LLM 佇列已滿 ({cls.name})")
+            waiter = waiter_factory()
+            queue.append(waiter)
+            return waiter
+
+    def _abandon(self, cls: PriorityClass, waiter: _Waiter, timed_out: bool = True) -> bool:
+        """放棄等待：若尚未取得執行權就從佇列移除並回傳 True"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            waiter.cancelled = True
+            try:
+                self._queues[cls.name].remove(waiter)
+            except ValueError:
+                pass
+            if timed_out:
+                self._stats[cls.name].shed_timeout += 1
+            return True
+
+    def _release(self):
+        with self._lock:
+            self._inflight -= 1
+            while self._inflight < self.max_inflight:
+                waiter, name = self._next_waiter()
+                if waiter is None:
+                    break
+                waiter.granted = True
+                self._inflight += 1
+                stats = self._stats[name]
+                stats.admitted += 1
+                stats.waits.append(time.monotonic() - waiter.enqueued_at)
+                waiter.wake()
+
+    def _next_waiter(self):
+        for cls in self._order:
+            queue = self._queues[cls.name]
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.cancelled:
+                    return waiter, cls.name
+        return None, None
+
+    # --- 對外介面 ---
+    @contextmanager
+    def slot_sync(self, name: str, timeout: Optional[float] = None):
+        """同步 (執行緒) 版本：取得執行權後才進入 with 區塊"""
+        cls = self.classes[name]
+        waiter = self._try_enter(cls, _Waiter)
+        if waiter is not None:
+            wait = cls.max_wait if timeout is None else min(timeout, cls.max_wait)
+            if not waiter.event.wait(wait) and self._abandon(cls, waiter):
+                raise LLMOverloaded(f"LLM 排隊逾時 ({name})")
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def slot(self, name: str, timeout: Optional[float] = None):
+        """async 版本：取得執行權後才進入 async with 區塊"""
+        cls = self.classes[name]
+        loop = asyncio.get_running_loop()
+        waiter = self._try_enter(cls, lambda: _Waiter(loop))
+        if waiter is not None:
+            wait = cls.max_wait if timeout is None else min(timeout, cls.max_wait)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), wait)
+            except asyncio.TimeoutError:
+                # 逾時的同時剛好取得執行權時照常執行
+                if self._abandon(cls, waiter):
+                    raise LLMOverloaded(f"LLM 排隊逾時 ({name})")
+            except asyncio.CancelledError:
+                # 呼叫端被取消：若已取得執行權就立刻歸還
+                if not self._abandon(cls, waiter, timed_out=False):
+                    self._release()
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def idle(self) -> bool:
+        """目前沒有執行中或排隊中的 LLM 呼叫 (背景預生成工作用)"""
+        with self._lock:
+            return self._inflight == 0 and not any(self._queues.values())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            classes = {}
+            for cls in self._order:
+                stats = self._stats[cls.name]
+                classes[cls.name] = {
+                    "priority": cls.priority,
+                    "queued": sum(1 for w in self._queues[cls.name] if not w.cancelled),
+                    "max_queue": cls.max_queue,
+                    "admitted": stats.admitted,
+                    "shed_queue_full": stats.shed_full,
+                    "shed_wait_timeout": stats.shed_timeout,
+                    **summarize_ms(stats.waits, "wait_"),
+                }
+            return {"inflight": self._inflight, "max_inflight": self.max_inflight, "classes": classes}
@@ -0,0 +1,176 @@
+# log_stats.py
+"""
+最近偵測紀錄的視窗 (取代單純的 deque) 與增量統計。
+
+後台每 3 秒 / 10 秒輪詢一次統計 API；原本每次都要複製整個 log、
+重建 Counter。改成在寫入 (appendleft) 與淘汰最舊紀錄時同步加減計數，
+API 只回傳依版本號快取的快照，成本與視窗大小無關。
+"""
+
+import threading
+import time
+from collections import Counter, deque
+from itertools import islice
+from typing import Iterable, List, Optional
+
+# 互動模擬產生的紀錄：不計入真實案件統計，後台風險顯示為 N/A
+SIMULATION_SOURCES = frozenset(["LINE(演練)", "LINE(詐騙模式)"])
+
+
+def is_blocked(log: dict) -> bool:
+    """風險 > 80 視為 AI 攔截"""
+    risk = log.get("risk")
+    return isinstance(risk, (int, float)) and not isinstance(risk, bool) and risk > 80
+
+
+def admin_view(log: dict) -> dict:
+    """後台顯示用：模擬資料的風險指數顯示為 N/A"""
+    if log.get("source") in SIMULATION_SOURCES:
+        return {**log, "risk": "N/A"}
+    return log
+
+
+def _top(counter: Counter, k: int) -> dict:
+    top = counter.most_common(k)
+    return {"labels": [label for label, _ in top], "data": [count for _, count in top]}
+
+
+class LogWindow:
+    def __init__(self, maxlen: int = 50, feed_size: int = 50, top_k: int = 5):
+        self.maxlen = maxlen
+        self.feed_size = feed_size
+        self.top_k = top_k
+        self._logs = deque()
+        self._lock = threading.Lock()
+        self.version = 0
+        # 版本號在程序重啟後從 0 重新開始；epoch 讓客戶端與 ETag 能分辨不同程序的版本號
+        self.epoch = format(time.time_ns() // 1_000_000, "x")
+        self.total_added = 0
+        self.blocked = 0
+        self.type_counts = Counter()
+        self.district_counts = Counter()
+        self.job_counts = Counter()
+        self._admin_cache = (-1, None)
+        self._analytics_cache = (-1, None)
+
+    # --- 寫入 ---
+    def appendleft(self, log: dict) -> Optional[dict]:
+        """加入最新一筆紀錄 (並標上 seq = 新版本號)，回傳被淘汰的最舊紀錄 (若有)"""
+        with self._lock:
+            evicted = None
+            if len(self._logs) >= self.maxlen:
+                evicted = self._logs.pop()
+                self._apply(evicted, -1)
+            self.version += 1
+            log["seq"] = self.version
+            self._logs.appendleft(log)
+            self._apply(log, 1)
+            self.total_added += 1
+            return evicted
+
+    def extend(self, logs: Iterable[dict]):
+        """
+        預載較舊的紀錄 (新到舊，啟動時從紀錄庫載入用)，超出容量的部分忽略。
+        只能在視窗為空時呼叫；預載的紀錄由舊到新標上遞增的 seq，
+        客戶端以 since=0 呼叫 delta_since 時也會拿到這些紀錄。
+        """
+        with self._lock:
+            if self._logs:
+                raise ValueError("LogWindow.extend 只能用於空的視窗")
+            loaded = list(islice(logs, self.maxlen))
+            for log in reversed(loaded):
+                self.version += 1
+                log["seq"] = self.version
+                self._logs.appendleft(log)
+                self._apply(log, 1)
+
+    def _apply(self, log: dict, sign: int):
+        if is_blocked(log):
+            self.blocked += sign
+        if log.get("source") in SIMULATION_SOURCES:
+            return
+        scam_type = log.get("type")
+        if scam_type and scam_type != "N/A":
+            self._bump(self.type_counts, scam_type, sign)
+        profile = log.get("user_profile") or {}
+        if profile.get("district"):
+            self._bump(self.district_counts, profile["district"], sign)
+        if profile.get("job"):
+            self._bump(self.job_counts, profile["job"], sign)
+
+    @staticmethod
+    def _bump(counter: Counter, key: str, sign: int):
+        counter[key] += sign
+        if counter[key] <= 0:
+            del counter[key]
+
+    # --- 讀取 ---
+    def __len__(self) -> int:
+        return len(self._logs)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._logs))
+
+    def __getitem__(self, index: int) -> dict:
+        return self._logs[index]
+
+    def recent(self, n: int) -> List[dict]:
+        with self._lock:
+            return list(islice(self._logs, n))
+
+    def admin_stats(self) -> dict:
+        """/api/admin_stats 的快照 (同一版本只計算一次)"""
+        with self._lock:
+            version, cached = self._admin_cache
+            if version == self.version:
+                return cached
+            cached = {
+                "version": self.version,
+                "logs": [admin_view(log) for log in islice(self._logs, self.feed_size)],
+                "total_cases": 401 + len(self._logs),
+                "ai_blocked": 1230 + self.blocked,
+            }
+            self._admin_cache = (self.version, cached)
+            return cached
+
+    def delta_since(self, since: int) -> dict:
+        """
+        回傳 seq > since 的新紀錄 (新到舊) 與目前統計。
+        若中間的紀錄已被淘汰 (落後太多)，或 since 比目前版本還新 (程序已重啟)，
+        reset=True 並回傳完整列表。
+        """
+        with self._lock:
+            new_logs = []
+            reached = False
+            for log in self._logs:
+                if log.get("seq", 0) <= since:
+                    reached = True
+                    break
+                new_logs.append(log)
+            oldest_seq = self._logs[-1].get("seq", 0) if self._logs else 0
+            reset = since > self.version or (not reached and since < oldest_seq - 1)
+            if reset:
+                new_logs = list(self._logs)
+            return {
+                "version": self.version,
+                "epoch": self.epoch,
+                "reset": reset,
+                "logs": [admin_view(log) for log in new_logs[:self.feed_size]],
+                "total_cases": 401 + len(self._logs),
+                "ai_blocked": 1230 + self.blocked,
+            }
+
+    def dashboard_analytics(self) -> dict:
+        """/api/admin/dashboard_analytics 的快照 (同一版本只計算一次)"""
+        with self._lock:
+            version, cached = self._analytics_cache
+            if version == self.version:
+                return cached
+            cached = {
+                "scam_type_stats": _top(self.type_counts, self.top_k),
+                "district_stats": _top(self.district_counts, self.top_k),
+                "job_stats": _top(self.job_counts, self.top_k),
+            }
+            self._analytics_cache = (self.version, cached)
+            return cached
@@ -1,25 +1,27 @@
 # main.py (混合式戰術 + 互動模擬 + 資料視覺化 + LINE Bot + 政府後台 最終整合版)
 
-import httpx
+import asyncio
 import json
 import random
 import csv
 import os
 import datetime
-import re
-import urllib.parse
 import secrets
-import requests
+import time
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from typing import Optional, List, Dict
-from collections import deque
+from collections import deque, Counter
 
 # --- FastAPI 相關匯入 ---
 from fastapi import FastAPI, Request, Header, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, Response
 from pydantic import BaseModel
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from requests.exceptions import Timeout as RequestsTimeout
+from httpx import TimeoutException as HttpxTimeout
 
 # --- LINE Bot 相關匯入 ---
 from linebot import LineBotApi, WebhookHandler
@@ -33,18 +35,58 @@ from linebot.models import (
 # 1. 全域設定與常數 (Configuration)
 # ==========================================
 from config import (
-    OLLAMA_API_URL, OLLAMA_MODEL,
+    OLLAMA_API_URL, OLLAMA_CHAT_URL, OLLAMA_MODEL,
     LIVE_AI_URL, LIVE_AI_MODEL,
     LINE_CHANNEL_ACCESS_TOKEN, LINE_CHANNEL_SECRET,
     ADMIN_USERNAME, ADMIN_PASSWORD,
     GOOGLE_MAPS_API_KEY,
-    ALLOWED_ORIGINS, BANNED_SAFETY_TERMS
+    ALLOWED_ORIGINS, BANNED_SAFETY_TERMS,
+    SAFE_DOMAINS_PATH, KEYWORD_RULES_PATH, KEYWORD_MIN_WEIGHT, CURATED_ANSWERS_PATH,
+    SCAM_CLASSIFIER_PATH, CLASSIFIER_MIN_SIMILARITY, CLASSIFIER_MIN_MARGIN, CLASSIFIER_PROVISIONAL_MIN_SIMILARITY,
+    DETECTION_CACHE_TTL, DETECTION_CACHE_MAX_BYTES, DETECTION_CACHE_NEAR_DISTANCE,
+    PLAN_A_TIMEOUT, WEB_DETECTION_BUDGET, LINE_DETECTION_BUDGET, LLM_MAX_INFLIGHT,
+    BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_FAILURE_RATE, BREAKER_SLOW_CALL_SECONDS, BREAKER_OPEN_SECONDS,
+    BATCH_MAX_ITEMS, BATCH_LLM_CONCURRENCY,
+    LINE_WORKERS, LINE_QUEUE_SIZE,
+    SESSION_IDLE_TTL, SESSION_MAX, SESSION_MAX_HISTORY, PROFILE_IDLE_TTL, PROFILE_MAX,
+    CONTEXT_TOKEN_BUDGET, CONTEXT_SUMMARY_TOKENS, OLLAMA_MODEL_KEEP_ALIVE,
+    OPENER_POOL_TARGET, OPENER_POOL_MAX, OPENER_POOL_REFILL_INTERVAL,
+    SCRIPT_LIBRARY_PATH, SCRIPT_LIBRARY_TURNS, SCRIPT_LIBRARY_TARGET, SCRIPT_LIBRARY_MAX, SCRIPT_LIBRARY_MAX_AGE,
+    SCRIPT_LIBRARY_REFILL_INTERVAL,
+    INCIDENT_DB_PATH, RECENT_LOGS_SIZE, ADMIN_FEED_SIZE,
+    TREND_REPORT_INTERVAL, TREND_REPORT_MIN_NEW_LOGS, TREND_REPORT_MIN_GAP,
+    DASHBOARD_165_BASE_URL, DASHBOARD_165_FRESH_TTL, DASHBOARD_165_FIXTURE_DIR, DASHBOARD_165_ERROR_BACKOFF,
+    VILLAGE_COORDS_PATH, VILLAGE_SCAM_PATH, SCAM_TYPES_PATH, HEATMAP_DISTRICTS_PATH
 )
 
 # 【ETXRA】指定我們用 Modelfile 建立的專用詐騙模型
 SCAMMER_MODEL = "scammer-pro" # 攻擊方：高創意、話術多
 DETECTOR_MODEL = "detector-pro" # 防守方：低創意、邏輯強、JSON格式穩
 
+from ollama_client import get_async_client, get_sync_session, close_clients, iter_ollama_stream, partial_json_string
+from domain_whitelist import DomainWhitelist
+from keyword_engine import KeywordRuleEngine, load_keyword_rules
+from text_classifier import load_classifier
+from curated_answers import build_answer_index
+from result_cache import DetectionCache, normalize_text, text_key
+from singleflight import SingleFlight, StreamProgress
+from llm_scheduler import LLMScheduler, LLMOverloaded, LINE_DETECT, WEB_DETECT, SIMULATION, BATCH_DETECT, BACKGROUND
+from conversation_context import ConversationContext
+from opener_pool import OpenerPool
+from script_library import ScriptLibrary, validate_script
+from circuit_breaker import CircuitBreakerRegistry, CircuitOpenError
+from cascade_router import LatencyTracker, Deadline, plan_a_timeout, parse_budget_header
+from worker_pool import BoundedWorkerPool
+from session_store import SessionStore, UserSession, UserProfile
+from incident_store import IncidentStore
+from log_stats import LogWindow, admin_view
+from live_feed import LiveFeed
+from trend_report import TrendReporter
+from upstream_proxy import UpstreamProxy
+from village_data import VillageDataset
+from spatial_index import CATEGORIES as VILLAGE_CATEGORIES
+from crime_data import CrimeDataset
+
 # ==========================================
 # 2. 資料初始化 (Data Initialization)
 # ==========================================
@@ -63,38 +105,129 @@ try:
 except Exception:
     PRESET_SCRIPTS = []
 
+# --- 載入 Plan S 白名單 (檔案變動時自動重新載入) ---
+SAFE_DOMAINS = DomainWhitelist(SAFE_DOMAINS_PATH, fallback=["gov.tw"])
+
+# --- 建立 Plan B 關鍵字自動機 (Aho-Corasick) ---
+try:
+    KEYWORD_ENGINE = KeywordRuleEngine(load_keyword_rules(KEYWORD_RULES_PATH), min_weight=KEYWORD_MIN_WEIGHT)
+    print(f"--- Plan B 規則已載入 {len(KEYWORD_ENGINE)} 條 ---")
+except Exception as e:
+    print(f"警告：關鍵字規則載入失敗 ({e})，Plan B 將停用")
+    KEYWORD_ENGINE = KeywordRuleEngine([])
+
+# --- 預烘焙答案索引 (DEMO_ANSWERS + 策展 CSV) ---
+BAKED_ANSWERS = build_answer_index(DEMO_ANSWERS, CURATED_ANSWERS_PATH)
+print(f"--- 預烘焙答案已載入 {len(BAKED_ANSWERS)} 筆 ---")
+
+# --- 載入 Plan C 本地分類器 (模型檔不存在時略過) ---
+SCAM_CLASSIFIER = load_classifier(SCAM_CLASSIFIER_PATH, min_similarity=CLASSIFIER_MIN_SIMILARITY, min_margin=CLASSIFIER_MIN_MARGIN)
+
+# --- Plan A 結果快取 (轉傳的相同/相似訊息不必重跑 detector-pro) ---
+DETECTION_CACHE = DetectionCache(
+    ttl=DETECTION_CACHE_TTL,
+    max_bytes=DETECTION_CACHE_MAX_BYTES,
+    max_distance=DETECTION_CACHE_NEAR_DISTANCE,
+)
+
+# --- Plan A 並行合併 (Web 與 LINE 共用) ---
+DETECTOR_FLIGHTS = SingleFlight()
+# /analyze/stream 的串流 leader 進度 (依 flight key)，同一訊息的其他 SSE 連線共用同一份 token
+PLAN_A_PROGRESS: Dict[str, StreamProgress] = {}
+# LINE 查證的 Plan A 在此執行：請求端只等到延遲預算為止，呼叫本身以完整 PLAN_A_TIMEOUT 跑完並寫入快取
+PLAN_A_EXECUTOR = ThreadPoolExecutor(max_workers=LINE_WORKERS, thread_name_prefix="plan-a")
+# 所有 Ollama 呼叫共用的優先權排程器 (LINE 查證 > 網頁查證 > 互動模擬 > 背景)
+LLM_SCHEDULER = LLMScheduler(max_inflight=LLM_MAX_INFLIGHT)
+
+# 每個 (後端 URL, 模型) 一組斷路器：後端故障時立即回傳保底答案，不再每個請求都等滿逾時
+LLM_BREAKERS = CircuitBreakerRegistry(
+    window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS, failure_rate=BREAKER_FAILURE_RATE,
+    slow_call_seconds=BREAKER_SLOW_CALL_SECONDS, open_seconds=BREAKER_OPEN_SECONDS,
+)
+
+@contextmanager
+def llm_slot_sync(priority: str, url: str, model: str, timeout: Optional[float] = None, slow_after: Optional[float] = None):
+    """同步 LLM 呼叫：先檢查斷路器 (開啟中不必排隊)，再取得排程器執行權"""
+    breaker = LLM_BREAKERS.get(url, model)
+    if not breaker.allow():
+        raise CircuitOpenError(f"{breaker.name} 斷路器開啟中")
+    with LLM_SCHEDULER.slot_sync(priority, timeout=timeout):
+        with breaker.call(slow_after):
+            yield
+
+@asynccontextmanager
+async def llm_slot(priority: str, url: str, model: str, timeout: Optional[float] = None, slow_after: Optional[float] = None):
+    """async 版本的 llm_slot_sync"""
+    breaker = LLM_BREAKERS.get(url, model)
+    if not breaker.allow():
+        raise CircuitOpenError(f"{breaker.name} 斷路器開啟中")
+    async with LLM_SCHEDULER.slot(priority, timeout=timeout):
+        with breaker.call(slow_after):
+            yield
+
+# 各層延遲與路由決策 (延遲預算路由用)
+DETECTION_LATENCY = LatencyTracker()
+
 # --- 初始化 狀態與 Log 系統 ---
-RECENT_LOGS = deque(maxlen=50)
+# 最近紀錄視窗：寫入時同步更新統計，後台 API 直接回傳快照
+RECENT_LOGS = LogWindow(maxlen=RECENT_LOGS_SIZE, feed_size=ADMIN_FEED_SIZE)
 LINE_MESSAGES = deque(maxlen=50)
 
+# 165dashboard 上游代理快取 (KPI / 縣市詐騙數據)
+DASHBOARD_PROXY = UpstreamProxy(DASHBOARD_165_BASE_URL, fresh_ttl=DASHBOARD_165_FRESH_TTL, fixture_dir=DASHBOARD_165_FIXTURE_DIR,
+                                error_backoff=DASHBOARD_165_ERROR_BACKOFF)
+
+# 里別熱區資料：啟動時合併一次並預先序列化 / 壓縮，來源檔案變動時自動重建
+VILLAGE_DATA = VillageDataset(VILLAGE_COORDS_PATH, VILLAGE_SCAM_PATH)
+
+# 模擬案件點：依日期 + 資料版本固定種子，向量化產生後快取
+CRIME_DATA = CrimeDataset(SCAM_TYPES_PATH, HEATMAP_DISTRICTS_PATH)
+
+# 後台即時推播 (SSE)：每筆新紀錄推送給所有已連線的後台畫面
+ADMIN_FEED = LiveFeed(queue_size=100)
+
+# 持久化紀錄庫 (SQLite WAL)；重啟後以最近的紀錄預先填入 RECENT_LOGS
+try:
+    INCIDENT_STORE = IncidentStore(INCIDENT_DB_PATH)
+    RECENT_LOGS.extend(INCIDENT_STORE.recent(RECENT_LOGS.maxlen))
+except Exception as e:
+    print(f"警告：無法開啟偵測紀錄庫 ({e})，紀錄僅保留於記憶體")
+    INCIDENT_STORE = None
+
 # 【新增】使用者狀態機 (記錄誰正在跟詐騙集團對話)
-# 格式: { "user_id": { "status": "simulating", "history": [], "turns": 0 } }
-USER_STATES = {}
+# 值為 UserSession(status, context, turns)；閒置過久或超過上限會自動淘汰
+USER_STATES = SessionStore("user_states", idle_ttl=SESSION_IDLE_TTL, max_sessions=SESSION_MAX)
 
 # 【新增】模擬使用者個資 (給後台分析用)
-USER_PROFILES = {} 
+USER_PROFILES = SessionStore("user_profiles", idle_ttl=PROFILE_IDLE_TTL, max_sessions=PROFILE_MAX)
+
+def start_user_session(user_id: str, status: str) -> UserSession:
+    """建立 (或覆蓋) 使用者的模式狀態"""
+    session = UserSession(status, max_history=SESSION_MAX_HISTORY,
+                          token_budget=CONTEXT_TOKEN_BUDGET, summary_tokens=CONTEXT_SUMMARY_TOKENS)
+    USER_STATES.set(user_id, session)
+    return session
+
+def _random_user_profile() -> UserProfile:
+    jobs = ["工程師", "大學生", "退休人員", "服務業", "公務員"]
+    districts = ["東區", "北區", "香山區"]
+    ages = [22, 25, 30, 35, 45, 55, 65]
+    return UserProfile(age=random.choice(ages), job=random.choice(jobs), district=random.choice(districts))
 
 def get_or_create_user_profile(user_id):
     """為每個 LINE 使用者隨機分配一個身分 (Demo 用)"""
-    if user_id not in USER_PROFILES:
-        jobs = ["工程師", "大學生", "退休人員", "服務業", "公務員"]
-        districts = ["東區", "北區", "香山區"]
-        ages = [22, 25, 30, 35, 45, 55, 65]
-        USER_PROFILES[user_id] = {
-            "age": random.choice(ages),
-            "job": random.choice(jobs),
-            "district": random.choice(districts),
-        }
-    return USER_PROFILES[user_id]
+    return USER_PROFILES.get_or_create(user_id, _random_user_profile).as_dict()
 
 def add_log(source: str, text: str, result: dict, user_id: str = None):
-    """新增一筆偵測紀錄，並關聯使用者資料"""
+    """新增一筆偵測紀錄，並關聯使用者資料 (同時排入持久化紀錄庫)"""
     user_info = {}
     if user_id:
         user_info = get_or_create_user_profile(user_id)
 
+    now = datetime.datetime.now()
     log_entry = {
-        "time": datetime.datetime.now().strftime("%H:%M:%S"),
+        "time": now.strftime("%H:%M:%S"),
+        "timestamp": now.isoformat(timespec="seconds"),
         "source": source,
         "text": text,
         "type": result.get("scam_type", "N/A"),
@@ -102,6 +235,15 @@ def add_log(source: str, text: str, result: dict, user_id: str = None):
         "user_profile": user_info # 存入個資
     }
     RECENT_LOGS.appendleft(log_entry)
+    ADMIN_FEED.publish("log", {
+        "log": admin_view(log_entry),
+        "version": log_entry["seq"],
+        "total_cases": 401 + len(RECENT_LOGS),
+        "ai_blocked": 1230 + RECENT_LOGS.blocked,
+        "analytics": RECENT_LOGS.dashboard_analytics(),
+    })
+    if INCIDENT_STORE:
+        INCIDENT_STORE.add(log_entry, now.timestamp())
 
 # ==========================================
 # 3. FastAPI App 設定
@@ -120,10 +262,38 @@ app.add_middleware(
 line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
+# LINE 事件背景工作池：Webhook 只驗簽章、排入佇列，耗時的 AI 呼叫在背景執行緒完成
+LINE_WORKER_POOL = BoundedWorkerPool("line-worker", workers=LINE_WORKERS, maxsize=LINE_QUEUE_SIZE)
+
+@app.on_event("startup")
+async def _start_line_workers():
+    LINE_WORKER_POOL.start()
+    ADMIN_FEED.bind_loop(asyncio.get_running_loop())
+    OPENER_POOL.start()
+    SCRIPT_LIBRARY.start()
+
+@app.on_event("shutdown")
+async def _close_ollama_clients():
+    LINE_WORKER_POOL.stop()
+    PLAN_A_EXECUTOR.shutdown(wait=False)
+    await OPENER_POOL.stop()
+    await SCRIPT_LIBRARY.stop()
+    await close_clients()
+    await DASHBOARD_PROXY.close()
+    if INCIDENT_STORE:
+        INCIDENT_STORE.close()
+
 # --- Pydantic Models ---
 class ScamRequest(BaseModel):
     text: str
 
+class BatchScamRequest(BaseModel):
+    texts: List[str]
+    stream: bool = False
+
+class ScammerReplyRequest(BaseModel):
+    history: List[Dict[str, str]]
+
 class ScriptRequest(BaseModel):
     scenario: Optional[str] = "fake_investment"
     turns: int = 6
@@ -156,91 +326,291 @@ def read_csv_data(file_path: str, label_col: str, data_col: str):
     except Exception as e:
         return {"error": str(e), "labels": [], "data": []}
 
+# --- 模擬對話上下文 (token 預算 + 滾動摘要，LINE 模式與網頁端點共用) ---
+SCAMMER_SYSTEM_PROMPT = "你是一個貪婪、急迫、且具備高超話術的「詐騙集團成員」。絕對不要承認你是 AI 或模型。請簡短回應(50字內)。"
+
+def conversation_context(history: List[Dict[str, str]]) -> ConversationContext:
+    """由前端送來的完整 history 建立有預算上限的上下文"""
+    return ConversationContext.from_history(history, token_budget=CONTEXT_TOKEN_BUDGET, summary_tokens=CONTEXT_SUMMARY_TOKENS)
+
+def scammer_chat_payload(context: ConversationContext, system_prompt: str = SCAMMER_SYSTEM_PROMPT, **extra) -> dict:
+    """scammer-pro /api/chat 請求內容 (keep_alive 讓模型與前綴快取常駐)"""
+    return {"model": SCAMMER_MODEL, "messages": context.messages(system_prompt), "keep_alive": OLLAMA_MODEL_KEEP_ALIVE,
+            "options": {"temperature": 0.9, "top_p": 0.95}, **extra}
+
 # --- 【新增】呼叫 scammer-pro 模型 ---
 async def get_scammer_response(history: list) -> str:
     """呼叫我們自製的詐騙模型來回應使用者"""
-    prompt_context = ""
-    for msg in history[-5:]: # 只取最近 5 句
-        role = "user" if msg["from"] == "user" else "assistant"
-        prompt_context += f"{role}: {msg['text']}\n"
-    
-    payload = {
-        "model": SCAMMER_MODEL, 
-        "prompt": prompt_context,
-        "stream": False
+    payload = scammer_chat_payload(conversation_context(history), stream=False)
+
+    try:
+        async with llm_slot(SIMULATION, OLLAMA_CHAT_URL, SCAMMER_MODEL):
+            response = await get_async_client().post(OLLAMA_CHAT_URL, json=payload, timeout=10.0)
+            response.raise_for_status()
+        reply = response.json().get("message", {}).get("content", "").strip()
+        return reply if reply else "機會不等人，快點加入我們！"
+    except Exception as e:
+        print(f"Scammer AI Error: {e}")
+        return "名額有限，請盡快下載我們的 App 開始獲利。"
+
+# --- LINE 模式切換的開場白預生成池 (鍵為「模式:情境」) ---
+SCAMMING_OPENER_PROMPT = "你是一個剛加上好友的詐騙集團成員，請生成一句問候語作為開場白，誘騙對方上鉤。簡短(30字內)。"
+SIMULATION_OPENER = "您好，我是王牌投顧張老師。最近有一檔主力護盤的飆股，想不想了解一下？"
+
+def _opener_fallbacks() -> Dict[str, List[str]]:
+    """每個池的備用開場白 (池空時立即使用)；演練模式每組預設腳本各一個情境"""
+    fallbacks = {"scamming:default": ["您好，我們這裡是 XX 投顧，請問對投資有興趣嗎？"]}
+    presets = [p for p in PRESET_SCRIPTS if isinstance(p, dict) and p.get("script")]
+    for preset in presets:
+        fallbacks[f"simulating:{preset['id']}"] = [SIMULATION_OPENER, preset["script"][0]["text"]]
+    if not presets:
+        fallbacks["simulating:default"] = [SIMULATION_OPENER]
+    return fallbacks
+
+def _opener_prompt(key: str) -> str:
+    mode, scenario = key.split(":", 1)
+    if mode == "scamming":
+        return SCAMMING_OPENER_PROMPT
+    preset = next((p for p in PRESET_SCRIPTS if isinstance(p, dict) and p.get("id") == scenario), None)
+    persona = preset.get("persona") if preset else "你是自稱投顧老師的假投資詐騙者。"
+    return f"{persona}\n請生成一句私訊的開場白，誘騙對方回應。繁體中文，簡短(40字內)，只輸出開場白本身。"
+
+async def _generate_opener(key: str) -> str:
+    """以 BACKGROUND 優先權生成一句開場白 (供 OPENER_POOL 背景補充)"""
+    payload = {"model": SCAMMER_MODEL, "messages": [{"role": "system", "content": _opener_prompt(key)}],
+               "stream": False, "keep_alive": OLLAMA_MODEL_KEEP_ALIVE, "options": {"temperature": 0.95}}
+    async with llm_slot(BACKGROUND, OLLAMA_CHAT_URL, SCAMMER_MODEL):
+        res = await get_async_client().post(OLLAMA_CHAT_URL, json=payload, timeout=15.0)
+        res.raise_for_status()
+    return res.json().get("message", {}).get("content", "").strip().strip('"「」')
+
+OPENER_POOL = OpenerPool(
+    _generate_opener, _opener_fallbacks(), is_idle=LLM_SCHEDULER.idle,
+    target_size=OPENER_POOL_TARGET, max_size=OPENER_POOL_MAX, refill_interval=OPENER_POOL_REFILL_INTERVAL,
+)
+
+def _plan_s_whitelist(user_text: str) -> Optional[dict]:
+    """Plan S: 白名單網域檢查，命中回傳安全結果，否則回傳 None"""
+    safe_domain = SAFE_DOMAINS.match_text(user_text)
+    if safe_domain:
+        print(f"--- Plan S (白名單) 命中！網域: {safe_domain} ---")
+        return {"risk_score": 0, "scam_type": "正常訊息", "analysis": f"偵測到官方或常見服務網域「{safe_domain}」，經判定為安全訊息。", "source": "Plan S: Whitelist"}
+    return None
+
+def _baked_answer(user_text: str) -> Optional[dict]:
+    """預烘焙答案：命中策展的觸發字串時直接回傳事先準備好的結果"""
+    answer = BAKED_ANSWERS.lookup(user_text)
+    if answer:
+        print(f"--- 預烘焙答案命中！觸發：{answer.trigger} ---")
+        return {"risk_score": answer.risk_score, "scam_type": answer.scam_type, "analysis": answer.analysis, "source": "Plan B: Baked Answer"}
+    return None
+
+def _plan_b_keywords(user_text: str) -> Optional[dict]:
+    """Plan B: 關鍵字規則，命中回傳高風險結果，否則回傳 None"""
+    print("--- 切換至 Plan B (關鍵字規則) 檢查... ---")
+    match = KEYWORD_ENGINE.classify(user_text)
+    if match:
+        scam_type = match["scam_type"]
+        print(f"--- Plan B 命中！類型：{scam_type} ---")
+        return {"risk_score": match["risk_score"], "scam_type": scam_type, "analysis": f"偵測到高風險關鍵字（如：{'、'.join(match['keywords'])}），這極有可能是{scam_type}。", "source": "Plan B: Keyword Rule"}
+    return None
+
+def _plan_c_classifier(user_text: str) -> Optional[dict]:
+    """Plan C: 本地 n-gram 分類器，只有與已知詐騙話術高度相似時才回傳，否則回傳 None"""
+    if SCAM_CLASSIFIER is None:
+        return None
+    match = SCAM_CLASSIFIER.classify(user_text)
+    if match:
+        scam_type = match["scam_type"]
+        print(f"--- Plan C 命中！類型：{scam_type} (相似度 {match['similarity']}) ---")
+        risk_score = min(95, round(60 + 70 * match["similarity"]))
+        return {"risk_score": risk_score, "scam_type": scam_type, "analysis": f"訊息內容與已知的「{scam_type}」話術高度相似，請提高警覺，可撥打 165 反詐騙專線查證。", "source": "Plan C: Local Classifier"}
+    return None
+
+def _run_local_tiers(user_text: str) -> Optional[dict]:
+    """依序執行不需呼叫 LLM 的本地層 (Plan S -> 預烘焙答案 -> Plan B -> Plan C)；白名單命中時不會被預烘焙答案蓋過"""
+    return _plan_s_whitelist(user_text) or _baked_answer(user_text) or _plan_b_keywords(user_text) or _plan_c_classifier(user_text)
+
+def _detector_payload(user_text: str) -> dict:
+    return {"model": DETECTOR_MODEL, "prompt": user_text, "format": "json", "stream": False, "options": {"temperature": 0.1}}
+
+def _parse_detector_response(data: dict) -> dict:
+    """將 detector-pro 的回應轉成統一的偵測結果格式"""
+    ai_json = json.loads(data.get("response", "{}"))
+    return {
+        "risk_score": ai_json.get("risk_score", 0),
+        "scam_type": ai_json.get("scam_type", "可疑訊息"),
+        "analysis": ai_json.get("analysis", "AI 無法提供具體分析"),
+        "source": f"Plan A: Live ({DETECTOR_MODEL})"
     }
 
-    async with httpx.AsyncClient(timeout=10.0) as client: 
-        try:
-            # 注意: 此處的 OLLAMA_API_URL 在 config.py 中指向 /api/generate
-            # 新的聊天式互動建議使用 /api/chat
-            response = await client.post(OLLAMA_API_URL.replace("/generate", "/chat"), json=payload)
-            reply = response.json().get("response", "").strip()
-            return reply if reply else "機會不等人，快點加入我們！"
-        except Exception as e:
-            print(f"Scammer AI Error: {e}")
-            return "名額有限，請盡快下載我們的 App 開始獲利。"
+def _detector_fallback() -> dict:
+    return {"risk_score": 50, "scam_type": "可疑訊息", "analysis": "AI 系統暫時忙碌，建議您先撥打 165 反詐騙專線查證。", "source": "Fallback-Error"}
 
-def run_detection_pipeline_sync(user_text: str) -> dict:
+def _plan_a_sync(user_text: str) -> dict:
     """
-    執行同步的詐騙偵測流程 (白名單 -> 關鍵字 -> AI)，並回傳結果。
-    此函式為 Web 和 LINE Bot 的共用核心邏輯。
+    Plan A: 呼叫 detector-pro (同步)，成功時寫入快取。
+    一律以完整 PLAN_A_TIMEOUT 呼叫，不受個別請求的延遲預算截斷，
+    因此斷路器只會看到後端真正的逾時 / 錯誤。
     """
-    # Plan S: Whitelist (Robust Version)
-    safe_domains = [
-        "gov.tw", "twm5g.co", "twm.tw", "taiwanmobile.com", "cht.tw", "cht.com.tw",
-        "fetnet.net", "shopee.tw", "shp.ee", "momoshop.com.tw", "pchome.com.tw",
-        "ctbc.tw", "ctbcbank.com", "esun.co", "esunbank.com.tw", "cathaybk.com.tw",
-        "taishinbank.com.tw", "line.me", "family.com.tw", "7-11.com.tw",
-    ]
-    urls_found = re.findall(r'https?://[^\s/$.?#].[^\s]*', user_text)
-    for url in urls_found:
-        try:
-            hostname = urllib.parse.urlparse(url).hostname
-            if hostname:
-                hostname = hostname.lower()
-                for safe_domain in safe_domains:
-                    if hostname == safe_domain or hostname.endswith('.' + safe_domain):
-                        print(f"--- Plan S (白名單) 命中！網域: {safe_domain} ---")
-                        return {"risk_score": 0, "scam_type": "正常訊息", "analysis": f"偵測到官方或常見服務網域「{safe_domain}」，經判定為安全訊息。", "source": "Plan S: Whitelist"}
-        except Exception as e:
-            print(f"URL 解析錯誤: {e}")
-
-    # Plan B: Keyword Rules
-    print("--- 切換至 Plan B (關鍵字規則) 檢查... ---")
-    keywords_map = [
-        (["飆股", "保證獲利", "老師帶單", "內線消息", "申購"], "假投資詐騙"),
-        (["解除分期", "重複扣款", "訂單錯誤", "批發商"], "網路購物詐騙"),
-        (["援交", "購買點數", "Gash", "Apple Card", "經理"], "色情應召詐財詐騙"),
-        (["寄禮物", "海關扣留", "戰地軍官", "沒錢買機票"], "假交友（徵婚詐財）詐騙"),
-        (["老公", "老婆", "親愛的", "我們以後的家", "加密貨幣平台"], "假交友（投資詐財）詐騙")
-    ]
-    for keywords, scam_type in keywords_map:
-        if any(kw in user_text for kw in keywords):
-            print(f"--- Plan B 命中！類型：{scam_type} ---")
-            return {"risk_score": 95, "scam_type": scam_type, "analysis": f"偵測到高風險關鍵字（如：{'、'.join([k for k in keywords if k in user_text])}），這極有可能是{scam_type}。", "source": "Plan B: Keyword Rule"}
+    started = None
+    try:
+        print(f"--- 嘗試 Plan A (模型: {DETECTOR_MODEL})... ---")
+        with llm_slot_sync(LINE_DETECT, OLLAMA_API_URL, DETECTOR_MODEL):
+            started = time.monotonic()
+            response = get_sync_session().post(OLLAMA_API_URL, json=_detector_payload(user_text), timeout=PLAN_A_TIMEOUT)
+            response.raise_for_status()
+        result = _parse_detector_response(response.json())
+        DETECTION_LATENCY.record("plan_a", time.monotonic() - started)
+        DETECTION_CACHE.put(user_text, result)
+        return result
+    except (RequestsTimeout, LLMOverloaded, CircuitOpenError) as e:
+        if isinstance(e, RequestsTimeout) and started is not None:
+            DETECTION_LATENCY.record("plan_a", time.monotonic() - started)
+        print(f"--- Plan A 逾時或忙碌 ({e})，啟動保底機制 ---")
+        return _detector_fallback()
+    except Exception as e:
+        print(f"--- Plan A 失敗 ({e})，啟動保底機制 ---")
+        return _detector_fallback()
 
-    # Plan A: Call detector-pro AI
+async def _plan_a_async(user_text: str, priority: str = WEB_DETECT) -> dict:
+    """Plan A: 呼叫 detector-pro (非同步)，成功時寫入快取"""
+    started = None
     try:
         print(f"--- 嘗試 Plan A (模型: {DETECTOR_MODEL})... ---")
-        payload = {"model": DETECTOR_MODEL, "prompt": user_text, "format": "json", "stream": False, "options": {"temperature": 0.1}}
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=20)
-        response.raise_for_status()
-        
-        ai_raw_response = response.json().get("response", "{}")
-        ai_json = json.loads(ai_raw_response)
-        
-        return {
-            "risk_score": ai_json.get("risk_score", 0),
-            "scam_type": ai_json.get("scam_type", "可疑訊息"),
-            "analysis": ai_json.get("analysis", "AI 無法提供具體分析"),
-            "source": f"Plan A: Live ({DETECTOR_MODEL})"
-        }
+        async with llm_slot(priority, OLLAMA_API_URL, DETECTOR_MODEL):
+            started = time.monotonic()
+            response = await get_async_client().post(OLLAMA_API_URL, json=_detector_payload(user_text), timeout=PLAN_A_TIMEOUT)
+            response.raise_for_status()
+        result = _parse_detector_response(response.json())
+        DETECTION_LATENCY.record("plan_a", time.monotonic() - started)
+        DETECTION_CACHE.put(user_text, result)
+        return result
     except Exception as e:
+        if isinstance(e, HttpxTimeout) and started is not None:
+            DETECTION_LATENCY.record("plan_a", time.monotonic() - started)
         print(f"--- Plan A 失敗 ({e})，啟動保底機制 ---")
-        return {"risk_score": 50, "scam_type": "可疑訊息", "analysis": "AI 系統暫時忙碌，建議您先撥打 165 反詐騙專線查證。", "source": "Fallback-Error"}
+        return _detector_fallback()
+
+async def _plan_a_stream_async(user_text: str, flight_key: str, progress: StreamProgress) -> dict:
+    """Plan A 串流版 (/analyze/stream 的 leader)：analysis 欄位邊生成邊寫入 progress，完成後寫入快取"""
+    started = None
+    progress.started = True
+
+    async def consume() -> str:
+        nonlocal started
+        buffer = ""
+        async with llm_slot(WEB_DETECT, OLLAMA_API_URL, DETECTOR_MODEL):
+            started = time.monotonic()
+            async for chunk in iter_ollama_stream(OLLAMA_API_URL, _detector_payload(user_text), timeout=PLAN_A_TIMEOUT):
+                buffer += chunk.get("response", "")
+                analysis = partial_json_string(buffer, "analysis")
+                if len(analysis) > len(progress.text):
+                    progress.update(analysis)
+        return buffer
 
+    try:
+        print(f"--- 嘗試 Plan A 串流 (模型: {DETECTOR_MODEL})... ---")
+        # httpx 的 timeout 只限制單次讀取，整段串流另外以 PLAN_A_TIMEOUT 為上限
+        result = _parse_detector_response({"response": await asyncio.wait_for(consume(), PLAN_A_TIMEOUT)})
+        DETECTION_LATENCY.record("plan_a", time.monotonic() - started)
+        DETECTION_CACHE.put(user_text, result)
+        return result
+    except Exception as e:
+        if isinstance(e, (HttpxTimeout, asyncio.TimeoutError)) and started is not None:
+            DETECTION_LATENCY.record("plan_a", time.monotonic() - started)
+        print(f"--- Plan A 串流失敗 ({e})，啟動保底機制 ---")
+        return _detector_fallback()
+    finally:
+        if PLAN_A_PROGRESS.get(flight_key) is progress:
+            del PLAN_A_PROGRESS[flight_key]
+
+def _deadline_exceeded(user_text: str) -> dict:
+    """等不到 Plan A：回傳暫定結果 (延遲樣本由背景跑完的 leader 記錄，這裡只計入路由決策)"""
+    DETECTION_LATENCY.decide("deadline_exceeded")
+    return _provisional_result(user_text)
+
+def _provisional_result(user_text: str) -> dict:
+    """延遲預算不足時的暫定結果：採用本地分類器的最佳猜測 (不套用門檻)"""
+    guess = SCAM_CLASSIFIER.best_guess(user_text) if SCAM_CLASSIFIER else None
+    if guess and guess["similarity"] >= CLASSIFIER_PROVISIONAL_MIN_SIMILARITY:
+        scam_type = guess["scam_type"]
+        risk_score = min(80, round(40 + 100 * guess["similarity"]))
+        analysis = f"AI 深度分析尚未完成，初步比對與「{scam_type}」話術有部分相似，請先提高警覺，可撥打 165 反詐騙專線查證。"
+    else:
+        scam_type, risk_score = "可疑訊息", 50
+        analysis = "AI 深度分析尚未完成，目前無法確定是否為詐騙，請勿轉帳或提供個資，可撥打 165 反詐騙專線查證。"
+    return {"risk_score": risk_score, "scam_type": scam_type, "analysis": analysis, "source": "Provisional: Local Tiers", "provisional": True}
+
+def _resolve_without_llm(user_text: str) -> Optional[dict]:
+    """不呼叫 LLM 就能得到的答案 (Plan S / Plan B / 快取)，沒有則回傳 None"""
+    local_result = _run_local_tiers(user_text)
+    if local_result:
+        return local_result
+    cached = DETECTION_CACHE.get(user_text)
+    if cached:
+        print("--- 快取命中，略過 Plan A ---")
+        return cached
+    return None
+
+def _timed_local_result(user_text: str) -> Optional[dict]:
+    started = time.monotonic()
+    result = _resolve_without_llm(user_text)
+    DETECTION_LATENCY.record("local", time.monotonic() - started)
+    return result
+
+def run_detection_pipeline_sync(user_text: str, budget: Optional[float] = None) -> dict:
+    """
+    執行同步的詐騙偵測流程 (白名單 -> 關鍵字 -> AI)，並回傳結果。
+    LINE Bot (同步 handler) 使用此版本；Web 端請使用 run_detection_pipeline_async。
+    budget 為延遲預算 (秒)：不足以等待 Plan A 時回傳 provisional 的暫定結果。
+    """
+    deadline = Deadline(budget)
+    quick_result = _timed_local_result(user_text)
+    if quick_result:
+        return quick_result
+
+    timeout = plan_a_timeout(DETECTION_LATENCY, deadline, PLAN_A_TIMEOUT)
+    if timeout is None:
+        return _provisional_result(user_text)
+    # 相同訊息同時湧入時，只送出一次 Plan A，其餘請求共用結果；
+    # Plan A 在 PLAN_A_EXECUTOR 中執行，超過預算時先回傳暫定結果，Plan A 繼續完成並寫入快取
+    flight_key = text_key(normalize_text(user_text))
+    try:
+        return dict(DETECTOR_FLIGHTS.do(flight_key, lambda: _plan_a_sync(user_text), timeout=timeout, executor=PLAN_A_EXECUTOR))
+    except FutureTimeoutError:
+        return _deadline_exceeded(user_text)
+
+async def run_detection_pipeline_async(user_text: str, budget: Optional[float] = None) -> dict:
+    """
+    非同步版本的偵測流程，Plan A 透過共用的 AsyncClient 呼叫，不會卡住 event loop。
+    超過延遲預算時先回傳暫定結果，Plan A 繼續在背景完成並寫入快取。
+    """
+    deadline = Deadline(budget)
+    quick_result = _timed_local_result(user_text)
+    if quick_result:
+        return quick_result
+
+    timeout = plan_a_timeout(DETECTION_LATENCY, deadline, PLAN_A_TIMEOUT)
+    if timeout is None:
+        return _provisional_result(user_text)
+    try:
+        return await _plan_a_coalesced_async(user_text, timeout)
+    except asyncio.TimeoutError:
+        return _deadline_exceeded(user_text)
+
+async def _plan_a_coalesced_async(user_text: str, timeout: Optional[float] = None, priority: str = WEB_DETECT) -> dict:
+    flight_key = text_key(normalize_text(user_text))
+    return dict(await DETECTOR_FLIGHTS.do_async(flight_key, lambda: _plan_a_async(user_text, priority), timeout=timeout))
+
+
+
+def _sse_event(event: str, data) -> str:
+    """組成一則 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
+def _sse_response(generator) -> StreamingResponse:
+    return StreamingResponse(generator, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # ==========================================
 # 5. API Endpoints (Core Logic)
@@ -251,11 +621,30 @@ def run_detection_pipeline_sync(user_text: str) -> dict:
 async def callback(request: Request, x_line_signature: str = Header(None)):
     body = await request.body()
     try:
-        handler.handle(body.decode("utf-8"), x_line_signature)
+        # 只驗證簽章並解析事件，立即回 200，避免 LINE 逾時重送
+        events = handler.parser.parse(body.decode("utf-8"), x_line_signature)
     except InvalidSignatureError:
         raise HTTPException(status_code=400, detail="Invalid signature")
+    for event in events:
+        # 同一使用者的事件固定由同一個執行緒依序處理 (模式切換 / 退出不會與進行中的回合互相超車)
+        LINE_WORKER_POOL.submit(_dispatch_line_event, event, key=getattr(event.source, "user_id", None))
     return "OK"
 
+def _dispatch_line_event(event):
+    """在背景執行緒中處理單一 LINE 事件"""
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+        handle_message(event)
+
+@app.get("/debug/sessions")
+async def session_stats():
+    """LINE 使用者 session / 個資暫存區的大小、記憶體與淘汰統計"""
+    return {"user_states": USER_STATES.snapshot(), "user_profiles": USER_PROFILES.snapshot()}
+
+@app.get("/debug/line_queue")
+async def line_queue_stats():
+    """LINE 背景佇列深度、等待時間與丟棄統計"""
+    return LINE_WORKER_POOL.snapshot()
+
 @handler.add(MessageEvent, message=TextMessage)
 def handle_message(event):
     user_id = event.source.user_id
@@ -267,67 +656,60 @@ def handle_message(event):
 
     # 模式切換：詐騙模式
     if user_text_lower == "scammer":
-        USER_STATES[user_id] = {"status": "scamming", "history": []}
-        try:
-            messages_payload = [{"role": "system", "content": "你是一個剛加上好友的詐騙集團成員，請生成一句問候語作為開場白，誘騙對方上鉤。簡短(30字內)。"}]
-            res = requests.post("http://127.0.0.1:11434/api/chat", json={"model": SCAMMER_MODEL, "messages": messages_payload, "stream": False, "options": {"temperature": 0.95}}, timeout=15)
-            res.raise_for_status()
-            opener = res.json().get("message", {}).get("content", "").strip() or "哈囉，最近過得好嗎？"
-        except Exception as e:
-            print(f"❌ AI 開場白生成錯誤: {e}")
-            opener = "您好，我們這裡是 XX 投顧，請問對投資有興趣嗎？"
-        USER_STATES[user_id]["history"].append({"role": "assistant", "content": opener})
+        session = start_user_session(user_id, "scamming")
+        # 開場白由背景預先生成，模式切換不必等待 LLM
+        opener, _ = OPENER_POOL.take("scamming:default")
+        session.context.append("assistant", opener)
         line_bot_api.reply_message(event.reply_token, TextSendMessage(text=f"👿 已進入 AI 詐騙模式 👿\n你可以開始與他對話了，試著識破他！\n\n{opener}", quick_reply=create_exit_quick_reply()))
         return
 
     # 模式切換：查證模式
     if user_text_lower == "detection":
-        USER_STATES[user_id] = {"status": "detecting", "history": []}
+        start_user_session(user_id, "detecting")
         line_bot_api.reply_message(event.reply_token, TextSendMessage(text="✅ 已進入 AI 智慧查證模式 ✅\n請直接傳送您想要分析的文字訊息給我。", quick_reply=create_exit_quick_reply()))
         return
         
     # 模式切換：模擬演練模式
     if user_text == "開始模擬" or user_text == "防詐演練":
-        USER_STATES[user_id] = {"status": "simulating", "history": [], "turns": 0}
-        opener = "您好，我是王牌投顧張老師。最近有一檔主力護盤的飆股，想不想了解一下？"
-        USER_STATES[user_id]["history"].append({"from": "assistant", "text": opener})
+        session = start_user_session(user_id, "simulating")
+        opener, _ = OPENER_POOL.take(random.choice(OPENER_POOL.keys("simulating:")))
+        session.context.append("assistant", opener)
         line_bot_api.reply_message(event.reply_token, TextSendMessage(text=f"🎭 【防詐演練啟動】\n情境：假投資詐騙\n任務：請嘗試回應他！\n\n{opener}", quick_reply=create_exit_quick_reply()))
         return
 
     # 指令：退出模式
     if user_text in ["退出", "結束"]:
-        if user_id in USER_STATES:
-            del USER_STATES[user_id]
+        if USER_STATES.pop(user_id) is not None:
             line_bot_api.reply_message(event.reply_token, TextSendMessage(text="✅ 已結束目前模式，回到正常偵測功能。"))
         else:
             line_bot_api.reply_message(event.reply_token, TextSendMessage(text="您目前不在任何特殊模式中。"))
         return
 
     # --- 情境 2: 如果不是指令，則根據當前模式處理訊息 ---
-    if user_id in USER_STATES:
-        state = USER_STATES[user_id]
-        status = state.get("status")
+    state = USER_STATES.get(user_id)
+    if state is not None:
+        status = state.status
 
         # 2A. 在詐騙模式中對話
         if status == "scamming":
             add_log("LINE(詐騙模式)", f"用戶回應：{user_text}", {"scam_type": "互動模擬(詐騙)", "risk_score": 0}, user_id)
-            state["history"].append({"role": "user", "content": user_text})
-            messages_payload = [{"role": "system", "content": "你是一個貪婪、急迫、且具備高超話術的「詐騙集團成員」。絕對不要承認你是 AI 或模型。請簡短回應(50字內)。"}]
-            messages_payload.extend(state["history"][-5:])
+            state.context.append("user", user_text)
+            payload = scammer_chat_payload(state.context, stream=False)
             try:
-                res = requests.post("http://127.0.0.1:11434/api/chat", json={"model": SCAMMER_MODEL, "messages": messages_payload, "stream": False, "options": {"temperature": 0.9, "top_p": 0.95}}, timeout=20)
-                res.raise_for_status()
+                with llm_slot_sync(SIMULATION, OLLAMA_CHAT_URL, SCAMMER_MODEL):
+                    res = get_sync_session().post(OLLAMA_CHAT_URL, json=payload, timeout=20)
+                    res.raise_for_status()
                 scammer_reply = res.json().get("message", {}).get("content", "").strip() or "趕快操作，不要浪費時間！"
             except Exception as e:
                 print(f"❌ AI 生成錯誤 (scamming): {e}")
                 scammer_reply = "系統忙線中...但我跟你說，這檔股票真的不能錯過。"
-            state["history"].append({"role": "assistant", "content": scammer_reply})
+            state.context.append("assistant", scammer_reply)
             line_bot_api.reply_message(event.reply_token, TextSendMessage(text=f"{scammer_reply}", quick_reply=create_exit_quick_reply()))
             return
 
         # 2B. 在查證模式中分析文字
         elif status == "detecting":
-            analysis_result = run_detection_pipeline_sync(user_text)
+            analysis_result = run_detection_pipeline_sync(user_text, budget=LINE_DETECTION_BUDGET)
             add_log("LINE(一鍵查證)", user_text, analysis_result, user_id)
             reply_msg = (
                 f"🚨【AI 防詐警示】\n"
@@ -342,23 +724,23 @@ def handle_message(event):
         # 2C. 在演練模式中對話
         elif status == "simulating":
             add_log("LINE(演練)", f"用戶回擊：{user_text}", {"scam_type": "互動模擬", "risk_score": 0}, user_id)
-            state["history"].append({"from": "user", "text": user_text})
-            state["turns"] += 1
-            if state["turns"] >= 10:
-                del USER_STATES[user_id]
+            state.context.append("user", user_text)
+            state.turns += 1
+            if state.turns >= 10:
+                USER_STATES.pop(user_id)
                 line_bot_api.reply_message(event.reply_token, TextSendMessage(text="🛑 演練結束！您堅持了很久，沒有輕易上當，做得好！"))
                 return
-            messages_payload = [{"role": "system", "content": "你是一個貪婪、急迫、且具備高超話術的「詐騙集團成員」。絕對不要承認你是 AI。請簡短回應(50字內)。"}]
-            for msg in state["history"]:
-                messages_payload.append({"role": "user" if msg["from"] == "user" else "assistant", "content": msg["text"]})
+            system_prompt = "你是一個貪婪、急迫、且具備高超話術的「詐騙集團成員」。絕對不要承認你是 AI。請簡短回應(50字內)。"
+            payload = scammer_chat_payload(state.context, system_prompt, stream=False)
             try:
-                res = requests.post("http://127.0.0.1:11434/api/chat", json={"model": SCAMMER_MODEL, "messages": messages_payload, "stream": False, "options": {"temperature": 0.9, "top_p": 0.95}}, timeout=20)
-                res.raise_for_status()
+                with llm_slot_sync(SIMULATION, OLLAMA_CHAT_URL, SCAMMER_MODEL):
+                    res = get_sync_session().post(OLLAMA_CHAT_URL, json=payload, timeout=20)
+                    res.raise_for_status()
                 scammer_reply = res.json().get("message", {}).get("content", "").strip() or "趕快操作，不要浪費時間！"
             except Exception as e:
                 print(f"❌ AI 生成錯誤 (simulating): {e}")
                 scammer_reply = "系統忙線中...但我跟你說，這檔股票真的不能錯過。"
-            state["history"].append({"from": "assistant", "text": scammer_reply})
+            state.context.append("assistant", scammer_reply)
             line_bot_api.reply_message(event.reply_token, TextSendMessage(text=f"{scammer_reply}", quick_reply=create_exit_quick_reply()))
             return
 
@@ -372,12 +754,121 @@ def handle_message(event):
 
 
 @app.post("/analyze")
-async def analyze_scam(request: ScamRequest):
+async def analyze_scam(request: ScamRequest, x_latency_budget_ms: Optional[str] = Header(None)):
     user_text = request.text.strip()
-    # 【核心改動】Web 端也呼叫統一的偵測核心
-    final_answer = run_detection_pipeline_sync(user_text)
+    # 【核心改動】Web 端也呼叫統一的偵測核心 (非同步版本，不阻塞 event loop)
+    # 呼叫端可用 X-Latency-Budget-Ms 標頭指定可等待的時間
+    budget = parse_budget_header(x_latency_budget_ms, WEB_DETECTION_BUDGET)
+    final_answer = await run_detection_pipeline_async(user_text, budget=budget)
     add_log(source="Web", text=user_text, result=final_answer)
     return final_answer
+
+@app.post("/analyze/stream")
+async def analyze_scam_stream(request: ScamRequest, x_latency_budget_ms: Optional[str] = Header(None)):
+    """
+    /analyze 的 SSE 版本：Plan A 生成時即時送出 `token` 事件
+    (delta 為 analysis 欄位新增的文字)，最後送出 `result` 事件 (完整偵測結果)。
+    Plan S / Plan B / 快取命中時直接送出 `result`。
+    與 /analyze 相同走延遲預算路由與 Plan A 並行合併：同一訊息同時只有一個串流 leader，
+    其他連線 (含 /analyze 與 LINE) 共用結果，串流連線還會收到 leader 已生成的 token。
+    """
+    user_text = request.text.strip()
+    deadline = Deadline(parse_budget_header(x_latency_budget_ms, WEB_DETECTION_BUDGET))
+
+    async def event_stream():
+        result = _timed_local_result(user_text)
+        timeout = plan_a_timeout(DETECTION_LATENCY, deadline, PLAN_A_TIMEOUT) if result is None else None
+        if result is None and timeout is None:
+            result = _provisional_result(user_text)
+        if result is None:
+            flight_key = text_key(normalize_text(user_text))
+            progress = PLAN_A_PROGRESS.setdefault(flight_key, StreamProgress())
+            flight = asyncio.ensure_future(DETECTOR_FLIGHTS.do_async(
+                flight_key, lambda: _plan_a_stream_async(user_text, flight_key, progress), timeout=timeout))
+            try:
+                shown = 0
+                async for text in progress.follow(flight):
+                    yield _sse_event("token", {"delta": text[shown:]})
+                    shown = len(text)
+                result = dict(await flight)
+            except asyncio.TimeoutError:
+                result = _deadline_exceeded(user_text)
+            finally:
+                flight.cancel()   # 只取消這個連線的等待，共用的 Plan A 受 shield 保護
+                # 同一 key 已有其他 leader (非串流) 時，這份 progress 不會被使用
+                if not progress.started and PLAN_A_PROGRESS.get(flight_key) is progress:
+                    del PLAN_A_PROGRESS[flight_key]
+        add_log(source="Web", text=user_text, result=result)
+        yield _sse_event("result", result)
+
+    return _sse_response(event_stream())
+
+
+def _log_batch(items: List[dict]):
+    """整批只寫一筆後台紀錄：風險取最高的一則，內容為摘要"""
+    if not items:
+        return
+    worst = max(items, key=lambda item: item.get("risk_score", 0))
+    flagged = sum(1 for item in items if item.get("risk_score", 0) > 80)
+    add_log(source="Web(批次)", text=f"[批次 {len(items)} 則，高風險 {flagged} 則] {worst['text']}", result=worst)
+
+
+@app.post("/analyze/batch")
+async def analyze_batch(request: BatchScamRequest):
+    """
+    批次分析 (例如受害者匯出的聊天紀錄)。
+    Plan S / Plan B / 快取在程序內直接完成，只有剩下的訊息才送 detector-pro，
+    並以 BATCH_LLM_CONCURRENCY 限制同時呼叫數，排程優先權低於即時查證與互動模擬。
+    後台紀錄每批只寫一筆摘要，不逐則灌入最近紀錄與 KPI。
+    stream=true 時以 NDJSON 依完成順序回傳，否則依輸入順序一次回傳。
+    """
+    texts = [t.strip() for t in request.texts]
+    if len(texts) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"一次最多 {BATCH_MAX_ITEMS} 則訊息")
+
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def analyze_one(index: int, text: str) -> dict:
+        started = time.perf_counter()
+        result = _resolve_without_llm(text)
+        if result is None:
+            async with semaphore:
+                result = await _plan_a_coalesced_async(text, priority=BATCH_DETECT)
+        return {
+            "index": index,
+            "text": text,
+            **result,
+            "tier": result.get("source"),
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    tasks = [asyncio.create_task(analyze_one(i, t)) for i, t in enumerate(texts)]
+
+    if request.stream:
+        async def ndjson_stream():
+            done = []
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    item = await finished
+                    done.append(item)
+                    yield json.dumps(item, ensure_ascii=False) + "\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+                _log_batch(done)
+        return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*tasks)
+    _log_batch(results)
+    tier_counts = Counter(item["tier"] for item in results)
+    return {
+        "results": results,
+        "count": len(results),
+        "tier_counts": dict(tier_counts),
+        "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
 # ==========================================
 # 6. 政府後台 API (Admin)
 # ==========================================
@@ -406,99 +897,137 @@ async def admin_page(username: str = Depends(get_current_user)):
 
 @app.get("/api/admin_stats")
 async def api_admin_stats(username: str = Depends(get_current_user)):
-    """回傳即時監控數據 (受保護)，並對日誌進行預處理"""
-    processed_logs = []
-    for log in RECENT_LOGS:
-        new_log = log.copy()
-        # 對於模擬資料，將風險指數設為 N/A
-        if new_log['source'] in ["LINE(詐騙模式)", "LINE(演練)"]:
-            new_log['risk'] = 'N/A'
-        processed_logs.append(new_log)
-        
-    return {
-        "logs": processed_logs,
-        "total_cases": 401 + len(RECENT_LOGS),
-        "ai_blocked": 1230 + len([l for l in RECENT_LOGS if isinstance(l.get('risk'), int) and l['risk'] > 80])
-    }
+    """回傳即時監控數據 (受保護)；統計在 add_log 時已增量更新，這裡只取快照"""
+    return RECENT_LOGS.admin_stats()
 
-# 【新增】AI 趨勢總結與使用者分析 API
-@app.get("/api/admin/analysis")
-async def api_admin_analysis(username: str = Depends(get_current_user)):
+@app.get("/api/admin_stats/stream")
+async def api_admin_stats_stream(request: Request, username: str = Depends(get_current_user)):
     """
-    1. 統計使用者輪廓與詐騙類型的關係
-    2. 用 LLM 讀取最近的報案 Log，總結出趨勢
+    後台即時推播 (SSE，受保護)：連線時先送 `snapshot`，之後每筆新紀錄送 `log`
+    (含最新 KPI 與圖表統計)。客戶端跟不上時會再收到一次 `snapshot`。
+    """
+    sub = ADMIN_FEED.subscribe()
+
+    def snapshot_event() -> str:
+        return _sse_event("snapshot", {**RECENT_LOGS.admin_stats(), "analytics": RECENT_LOGS.dashboard_analytics()})
+
+    async def event_stream():
+        try:
+            yield snapshot_event()
+            while not await request.is_disconnected():
+                try:
+                    event, data = await asyncio.wait_for(sub.get(), timeout=15.0)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield snapshot_event() if event == "resync" else _sse_event(event, data)
+        finally:
+            ADMIN_FEED.unsubscribe(sub)
+
+    return _sse_response(event_stream())
+
+@app.get("/api/admin_stats/delta")
+async def api_admin_stats_delta(since: int = 0, if_none_match: Optional[str] = Header(None), username: str = Depends(get_current_user)):
+    """
+    給仍採輪詢的客戶端：只回傳 version > since 的新紀錄。
+    ETag 為程序 epoch + 目前版本號 (重啟後不會誤判為未變動)，資料沒有變動時回傳 304。
     """
+    etag = f'"{RECENT_LOGS.epoch}-{RECENT_LOGS.version}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(RECENT_LOGS.delta_since(since), headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def _parse_time_param(value: Optional[str]) -> Optional[float]:
+    """將 ISO 日期/時間字串轉成 epoch 秒 (查詢參數用)"""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"時間格式錯誤: {value}")
+
+@app.get("/api/admin/logs")
+async def api_admin_logs(
+    limit: int = 50,
+    cursor: Optional[int] = None,
+    source: Optional[str] = None,
+    scam_type: Optional[str] = None,
+    min_risk: Optional[int] = None,
+    max_risk: Optional[int] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    q: Optional[str] = None,
+    username: str = Depends(get_current_user),
+):
+    """
+    查詢完整的偵測紀錄 (受保護)，依新到舊分頁。
+    下一頁請帶入回傳的 next_cursor；since / until 為 ISO 時間 (例如 2025-04-01 或 2025-04-01T08:00:00)。
+    """
+    if not INCIDENT_STORE:
+        raise HTTPException(status_code=503, detail="偵測紀錄庫未啟用")
+    return await asyncio.to_thread(
+        INCIDENT_STORE.query,
+        limit=limit, cursor=cursor, source=source, scam_type=scam_type,
+        min_risk=min_risk, max_risk=max_risk,
+        since=_parse_time_param(since), until=_parse_time_param(until), q=q,
+    )
+
+# 【新增】AI 趨勢總結與使用者分析 API
+async def _generate_trend_report() -> str:
+    """用 LLM 讀取最近的報案 Log，總結出趨勢 (失敗時拋出例外，保留上一份報告)"""
+    recent_texts = [f"[{log['type']}] {log['text']}" for log in RECENT_LOGS.recent(30) if log['source'] != "LINE(演練)"]
+    if not recent_texts:
+        return "目前數據量不足，無法分析趨勢。"
+    logs_str = "\n".join(recent_texts[:10])
+    prompt = f"""
+<|begin_of_text|><|start_header_id|>system<|end_header_id|>
+你是一個警政數據分析 AI。請閱讀以下民眾回報的詐騙訊息，並總結出「3 個」目前最流行的詐騙關鍵字或手法。請用列點方式回答，簡潔有力。
+<|eot_id|><|start_header_id|>user<|end_header_id|>
+{logs_str}
+<|eot_id|><|start_header_id|>assistant<|end_header_id|>
+"""
+    payload = {"model": LIVE_AI_MODEL, "prompt": prompt, "stream": False}
+    async with llm_slot(BACKGROUND, OLLAMA_API_URL, LIVE_AI_MODEL):
+        res = await get_async_client().post(OLLAMA_API_URL, json=payload, timeout=10.0)
+        res.raise_for_status()
+    return res.json().get("response", "分析失敗")
+
+TREND_REPORTER = TrendReporter(_generate_trend_report, interval=TREND_REPORT_INTERVAL, min_new_logs=TREND_REPORT_MIN_NEW_LOGS,
+                               min_gap=TREND_REPORT_MIN_GAP)
+_ANALYSIS_STATS_CACHE = {"version": -1, "stats": None}
+
+def _profile_risk_stats() -> dict:
+    """統計使用者輪廓 (地區 / 職業) 的回報次數，依紀錄版本快取"""
+    if _ANALYSIS_STATS_CACHE["version"] == RECENT_LOGS.version:
+        return _ANALYSIS_STATS_CACHE["stats"]
+    version = RECENT_LOGS.version
     stats = {"district_risk": {}, "job_risk": {}}
-    
-    recent_texts = []
     for log in RECENT_LOGS:
-        if log['source'] != "LINE(演練)":
-            recent_texts.append(f"[{log['type']}] {log['text']}")
-        
         # 統計個資風險
         if "user_profile" in log and log["user_profile"]:
             dist = log["user_profile"].get("district", "未知")
             job = log["user_profile"].get("job", "未知")
             stats["district_risk"][dist] = stats["district_risk"].get(dist, 0) + 1
             stats["job_risk"][job] = stats["job_risk"].get(job, 0) + 1
+    _ANALYSIS_STATS_CACHE.update(version=version, stats=stats)
+    return stats
 
-    # 呼叫 AI 總結趨勢
-    trend_report = "目前數據量不足，無法分析趨勢。"
-    if recent_texts:
-        logs_str = "\n".join(recent_texts[:10])
-        prompt = f"""
-<|begin_of_text|><|start_header_id|>system<|end_header_id|>
-你是一個警政數據分析 AI。請閱讀以下民眾回報的詐騙訊息，並總結出「3 個」目前最流行的詐騙關鍵字或手法。請用列點方式回答，簡潔有力。
-<|eot_id|><|start_header_id|>user<|end_header_id|>
-{logs_str}
-<|eot_id|><|start_header_id|>assistant<|end_header_id|>
-"""
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                payload = {"model": LIVE_AI_MODEL, "prompt": prompt, "stream": False}
-                res = await client.post(OLLAMA_API_URL, json=payload)
-                trend_report = res.json().get("response", "分析失敗")
-        except:
-            trend_report = "AI 分析忙碌中..."
-
+@app.get("/api/admin/analysis")
+async def api_admin_analysis(username: str = Depends(get_current_user)):
+    """
+    1. 統計使用者輪廓與詐騙類型的關係
+    2. 回傳最新一份 AI 趨勢報告 (背景依紀錄版本更新，附報告產生時間與經過秒數)
+    """
+    TREND_REPORTER.maybe_refresh(RECENT_LOGS.version)
     return {
-        "stats": stats,
-        "trend_report": trend_report
+        "stats": _profile_risk_stats(),
+        **TREND_REPORTER.view(pending_text="AI 趨勢報告生成中，請稍後重新整理。"),
     }
 
 @app.get("/api/admin/dashboard_analytics")
 async def api_dashboard_analytics(username: str = Depends(get_current_user)):
-    """為儀表板計算並回傳統計數據"""
-    from collections import Counter
-    
-    # 過濾掉模擬資料，只分析真實案件
-    real_logs = [log for log in RECENT_LOGS if log.get("source") not in ["LINE(演練)", "LINE(詐騙模式)"]]
-    
-    # 1. 詐騙類型統計
-    scam_type_counts = Counter(log['type'] for log in real_logs if log.get('type') and log.get('type') != 'N/A')
-    
-    # 2. 使用者輪廓統計
-    district_counts = Counter()
-    job_counts = Counter()
-    
-    for log in real_logs:
-        profile = log.get("user_profile")
-        if profile:
-            if profile.get("district"):
-                district_counts[profile["district"]] += 1
-            if profile.get("job"):
-                job_counts[profile["job"]] += 1
-                
-    # 排序結果，讓圖表更好看
-    top_scam_types = dict(scam_type_counts.most_common(5))
-    top_districts = dict(district_counts.most_common(5))
-    top_jobs = dict(job_counts.most_common(5))
-    
-    return {
-        "scam_type_stats": {"labels": list(top_scam_types.keys()), "data": list(top_scam_types.values())},
-        "district_stats": {"labels": list(top_districts.keys()), "data": list(top_districts.values())},
-        "job_stats": {"labels": list(top_jobs.keys()), "data": list(top_jobs.values())},
-    }
+    """為儀表板回傳統計數據 (真實案件的詐騙類型 / 地區 / 職業前 5 名，已增量維護)"""
+    return RECENT_LOGS.dashboard_analytics()
 
 
 # ==========================================
@@ -506,11 +1035,39 @@ async def api_dashboard_analytics(username: str = Depends(get_current_user)):
 # ==========================================
 # ... (以下為原本的資料視覺化與靜態頁面路由，皆保持不變) ...
 
+# --- 165dashboard 上游代理 (共用快取層) ---
+def _unwrap_body(data):
+    return data.get("body") or data.get("Body") or data
+
+def _normalize_city_list(body):
+    """Normalize common wrapper shapes to return a plain list when possible"""
+    if isinstance(body, list):
+        return body
+
+    if isinstance(body, dict):
+        # common keys that might contain the array
+        for key in ("Data", "data", "Items", "items", "Result", "result", "Cities", "cities", "Body", "body", "TopFive"):
+            val = body.get(key)
+            if isinstance(val, list):
+                return val
+
+        # sometimes API returns object keyed by numeric strings -> convert values
+        # e.g. { "0": {...}, "1": {...} }
+        numeric_values = [v for k, v in body.items() if k.isdigit() and isinstance(v, dict)]
+        if numeric_values:
+            return numeric_values
+
+    # fallback: return body as-is (front-end will handle non-array)
+    return body
+
+async def _fetch_fraud_method_ranking(date: str):
+    return await DASHBOARD_PROXY.get("GetDailyFraudMethodRanking", date, "date={ts}&sort=case")
+
 @app.get("/api/kpi_data")
 async def api_kpi_data(date: Optional[str] = None):
     """Return lightweight KPI summary used by the frontend.
     Behaviour:
-    - Try to fetch live KPI from the external 165dashboard (same endpoint used by `/api/kpi_live`).
+    - Try to fetch live KPI from the external 165dashboard (same cached upstream entry as `/api/kpi_live`).
     - If available, use `TotalCases` and `TotalLosses` from that source.
     - Fallback: derive `monthly_cases` and `ai_interceptions` from `RECENT_LOGS`.
     """
@@ -521,11 +1078,7 @@ async def api_kpi_data(date: Optional[str] = None):
     try:
         if date is None:
             date = datetime.date.today().isoformat()
-        url = f"https://165dashboard.tw/CIB_DWS_API/api/Dashboard/GetDailyFraudMethodRanking?date={date}T16:00:00Z&sort=case"
-        resp = requests.get(url, timeout=6)
-        resp.raise_for_status()
-        data = resp.json()
-        body = data.get("body") or data.get("Body") or data
+        body = _unwrap_body(await _fetch_fraud_method_ranking(date))
         # TotalCases and TotalLosses may exist in the body
         total_cases = body.get('TotalCases') or body.get('totalCases') or body.get('TotalCases')
         total_losses = body.get('TotalLosses') or body.get('totalLosses') or body.get('TotalLosses')
@@ -552,8 +1105,8 @@ async def api_kpi_data(date: Optional[str] = None):
             # approximate monthly cases using RECENT_LOGS length (no date info stored)
             monthly_cases = len(RECENT_LOGS)
 
-        # compute ai interceptions from RECENT_LOGS (risk > 80)
-        intercepted_count = len([l for l in RECENT_LOGS if isinstance(l.get('risk'), (int, float)) and l.get('risk') > 80])
+        # ai interceptions (risk > 80) are maintained incrementally by RECENT_LOGS
+        intercepted_count = RECENT_LOGS.blocked
     except Exception:
         monthly_cases = monthly_cases or 0
         intercepted_count = 0
@@ -568,96 +1121,51 @@ async def api_kpi_data(date: Optional[str] = None):
 @app.get("/api/kpi_live")
 async def api_kpi_live(date: Optional[str] = None):
     """
-    後端代理：向 165dashboard 取得即時 KPI（避免瀏覽器 CORS 問題）。
+    後端代理：向 165dashboard 取得即時 KPI（避免瀏覽器 CORS 問題），經共用快取層。
     回傳範例：{"TotalCases": 485, "TotalLosses": 22395.6}
-    若失敗則回傳 {"error": "..."}。
+    若失敗且沒有快取則回傳 {"error": "..."}。
     """
     if date is None:
         date = datetime.date.today().isoformat()
-    # API 期望的時間戳格式
-    url = f"https://165dashboard.tw/CIB_DWS_API/api/Dashboard/GetDailyFraudMethodRanking?date={date}T16:00:00Z&sort=case"
     try:
-        resp = requests.get(url, timeout=8)
-        resp.raise_for_status()
-        data = resp.json()
         # 回傳原始 body 以便前端使用 TopFive 與其他欄位
-        body = data.get("body") or data.get("Body") or data
-        return body
+        return _unwrap_body(await _fetch_fraud_method_ranking(date))
     except Exception as e:
         return {"error": str(e)}
 
 
 @app.get("/api/daily_city_fraud")
 async def api_daily_city_fraud(date: Optional[str] = None):
-    """Proxy to 165dashboard's GetDailyCityFraudData endpoint.
+    """Proxy to 165dashboard's GetDailyCityFraudData endpoint (cached).
     Returns a list of city entries like {"CityId":14, "Name":"新竹市", "Cases":2.62, "Losses":516.6}
     """
     if date is None:
         date = datetime.date.today().isoformat()
-    # build timestamp per external API expectation
-    ts = f"{date}T16:00:00Z"
-    url = f"https://165dashboard.tw/CIB_DWS_API/api/Dashboard/GetDailyCityFraudData?date={ts}&standardized=true"
     try:
-        resp = requests.get(url, timeout=8)
-        resp.raise_for_status()
-        data = resp.json()
-        body = data.get('body') or data.get('Body') or data
-
-        # Normalize common wrapper shapes to return a plain list when possible
-        if isinstance(body, list):
-            return body
-
-        if isinstance(body, dict):
-            # common keys that might contain the array
-            for key in ("Data", "data", "Items", "items", "Result", "result", "Cities", "cities", "Body", "body", "TopFive"):
-                val = body.get(key)
-                if isinstance(val, list):
-                    return val
-
-            # sometimes API returns object keyed by numeric strings -> convert values
-            # e.g. { "0": {...}, "1": {...} }
-            numeric_values = [v for k, v in body.items() if k.isdigit() and isinstance(v, dict)]
-            if numeric_values:
-                return numeric_values
-
-        # fallback: return body as-is (front-end will handle non-array)
-        return body
+        data = await DASHBOARD_PROXY.get("GetDailyCityFraudData", date, "date={ts}&standardized=true")
+        return _normalize_city_list(_unwrap_body(data))
     except Exception as e:
         return {"error": str(e)}
 
 
 @app.get("/api/monthly_city_fraud")
 async def api_monthly_city_fraud(date: Optional[str] = None):
-    """Proxy to 165dashboard's GetMonthlyCityFraudData endpoint.
+    """Proxy to 165dashboard's GetMonthlyCityFraudData endpoint (cached).
     Returns a list of city entries like {"CityId":14, "Name":"新竹市", "Cases":81.76, "Losses":4216.4}
     """
     if date is None:
         date = datetime.date.today().isoformat()
-    ts = f"{date}T16:00:00Z"
-    url = f"https://165dashboard.tw/CIB_DWS_API/api/Dashboard/GetMonthlyCityFraudData?date={ts}&standardized=true"
     try:
-        resp = requests.get(url, timeout=8)
-        resp.raise_for_status()
-        data = resp.json()
-        body = data.get('body') or data.get('Body') or data
-
-        if isinstance(body, list):
-            return body
-
-        if isinstance(body, dict):
-            for key in ("Data", "data", "Items", "items", "Result", "result", "Cities", "cities", "Body", "body", "TopFive"):
-                val = body.get(key)
-                if isinstance(val, list):
-                    return val
-
-            numeric_values = [v for k, v in body.items() if k.isdigit() and isinstance(v, dict)]
-            if numeric_values:
-                return numeric_values
-
-        return body
+        data = await DASHBOARD_PROXY.get("GetMonthlyCityFraudData", date, "date={ts}&standardized=true")
+        return _normalize_city_list(_unwrap_body(data))
     except Exception as e:
         return {"error": str(e)}
 
+@app.get("/debug/upstream_cache")
+async def upstream_cache_stats():
+    """165dashboard 代理快取的命中、過期與上游錯誤統計"""
+    return DASHBOARD_PROXY.snapshot()
+
 @app.get("/api/scam_types_data")
 async def api_scam_types_data(): return {"labels": [], "data": []}
 
@@ -679,166 +1187,195 @@ async def api_heatmap_data():
 @app.get("/api/maps_key")
 async def api_maps_key(): return {"key": GOOGLE_MAPS_API_KEY}
 
+def _precompressed_response(request: Request, body: bytes, gzip_body: bytes, etag: str) -> Response:
+    """回傳預先序列化的 JSON；支援 If-None-Match (304) 與 gzip"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=gzip_body, media_type="application/json", headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.get("/api/village_scam_data")
-async def api_village_scam_data():
-    def _load_csv_coords(path: str):
-        """嘗試多種編碼讀取 coordinates CSV，並回傳 (coords_map, used_encoding, key_column)"""
-        last_err = None
-        for enc in ("utf-8", "cp950", "big5"):
-            try:
-                with open(path, mode="r", encoding=enc) as infile:
-                    reader = csv.DictReader(infile)
-                    if not reader.fieldnames:
-                        continue
-                    # 優先找常見的里名欄位，否則使用第一個欄位
-                    key_col = None
-                    for candidate in ["里名", "里", "name"]:
-                        if candidate in reader.fieldnames:
-                            key_col = candidate
-                            break
-                    if not key_col:
-                        key_col = reader.fieldnames[0]
-
-                    coords = {}
-                    for row in reader:
-                        try:
-                            key = row.get(key_col)
-                            if not key:
-                                continue
-                            coords[key] = {"lat": float(row.get("lat") or row.get("LAT") or 0), "lng": float(row.get("lng") or row.get("LON") or row.get("lng") or 0)}
-                        except Exception:
-                            continue
-                    return coords, enc, key_col
-            except Exception as ex:
-                last_err = ex
-                continue
-        raise last_err or FileNotFoundError(path)
+async def api_village_scam_data(request: Request):
+    snap = VILLAGE_DATA.current()
+    if snap is None:
+        return {"error": VILLAGE_DATA.last_error or "里別熱區資料尚未載入"}
+    return _precompressed_response(request, snap.body, snap.gzip_body, snap.etag)
+
+def _village_snapshot():
+    snap = VILLAGE_DATA.current()
+    if snap is None:
+        raise HTTPException(status_code=503, detail=VILLAGE_DATA.last_error or "里別熱區資料尚未載入")
+    return snap
+
+def _village_view(record: dict, category: Optional[str]) -> dict:
+    """指定 category 時只回傳名稱、座標與該類別分數，縮小回應"""
+    if category is None:
+        return record
+    return {"name": record["name"], "location": record["location"], category: record.get(category, 0)}
+
+def _check_category(category: Optional[str]):
+    if category is not None and category not in VILLAGE_CATEGORIES:
+        raise HTTPException(status_code=400, detail=f"category 必須是 {', '.join(VILLAGE_CATEGORIES)} 之一")
+
+@app.get("/api/village_scam_data/bbox")
+async def api_village_bbox(south: float, west: float, north: float, east: float, category: Optional[str] = None, limit: int = 500):
+    """地圖視窗範圍內的里別 (limit 上限 2000)"""
+    _check_category(category)
+    records = _village_snapshot().index.bbox(south, west, north, east)
+    limit = max(1, min(limit, 2000))
+    return {
+        "total": len(records),
+        "truncated": len(records) > limit,
+        "villages": [_village_view(r, category) for r in records[:limit]],
+    }
 
+@app.get("/api/village_scam_data/nearest")
+async def api_village_nearest(lat: float, lng: float, k: int = 5, category: Optional[str] = None):
+    """距離指定座標最近的 k 個里別 (k 上限 50)"""
+    _check_category(category)
+    found = _village_snapshot().index.nearest(lat, lng, max(1, min(k, 50)))
+    return [{**_village_view(r, category), "distance_km": round(d, 3)} for d, r in found]
+
+@app.get("/api/village_scam_data/top")
+async def api_village_top(category: str, n: int = 10, south: Optional[float] = None, west: Optional[float] = None,
+                          north: Optional[float] = None, east: Optional[float] = None):
+    """依類別分數排序的熱區前 N 名；提供完整 bbox 時只看視窗內 (n 上限 100)"""
+    _check_category(category)
+    bounds = (south, west, north, east)
+    bbox = bounds if all(v is not None for v in bounds) else None
+    records = _village_snapshot().index.top(category, max(1, min(n, 100)), bbox)
+    return [_village_view(r, category) for r in records]
+
+@app.get("/debug/village_data")
+async def village_data_stats():
+    """里別熱區資料快照的大小、ETag 與重新載入次數"""
+    return VILLAGE_DATA.snapshot()
+
+def _crime_date(date: Optional[str]) -> datetime.date:
+    if not date:
+        return datetime.date.today()
     try:
-        coords_map, used_enc, key_col = _load_csv_coords("data/village_coordinates.csv")
-    except Exception as e:
-        return {"error": f"無法讀取 village_coordinates.csv: {str(e)}"}
+        return datetime.date.fromisoformat(date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"日期格式錯誤: {date}")
 
+@app.get("/api/crime_data")
+async def api_crime_data(request: Request, date: Optional[str] = None):
+    """
+    模擬案件點 (欄式格式)：lat / lng / day / type / district 為平行陣列，
+    type 與 district 是 types / districts 名稱表的索引。同一天、同一份資料結果固定。
+    """
+    day = _crime_date(date)
     try:
-        scam_data = []
-        # 讀取熱區資料（CSV），這通常是 UTF-8，但我們也容錯
-        last_err = None
-        for enc in ("utf-8", "cp950", "big5"):
-            try:
-                with open("data/熱區地圖_clean.csv", mode="r", encoding=enc) as infile:
-                    reader = csv.DictReader(infile)
-
-                    # build a tolerant header lookup: map normalized keys -> actual header name
-                    def find_header(candidates, fieldnames):
-                        for h in fieldnames or []:
-                            if not h:
-                                continue
-                            hn = h.strip().replace('﻿', '')
-                            for c in candidates:
-                                if c in hn:
-                                    return h
-                        return None
-                    name_col = find_header(["里名", "里", "name"], reader.fieldnames)
-                    inv_col = find_header(["投資"], reader.fieldnames)
-                    shop_col = find_header(["網購", "購物", "shopping"], reader.fieldnames)
-                    auc_col = find_header(["網拍", "拍賣", "假網拍", "auction"], reader.fieldnames)
-                    dating_col = find_header(["交友", "假交友", "dating"], reader.fieldnames)
-                    marriage_col = find_header(["徵婚", "婚", "marriage"], reader.fieldnames)
-
-                    for row in reader:
-                        village_name = row.get(name_col) if name_col else row.get(reader.fieldnames[0])
-                        if not village_name:
-                            continue
-                        coord = coords_map.get(village_name)
-                        if coord:
-                            try:
-                                scam_data.append({
-                                    "name": village_name,
-                                    "location": {"lat": coord["lat"], "lng": coord["lng"]},
-                                    "investment": float(row.get(inv_col, 0) or 0),
-                                    "shopping": float(row.get(shop_col, 0) or 0),
-                                    "auction": float(row.get(auc_col, 0) or 0),
-                                    "dating": float(row.get(dating_col, 0) or 0),
-                                    "marriage": float(row.get(marriage_col, 0) or 0),
-                                })
-                            except (ValueError, TypeError):
-                                continue
-                break
-            except Exception as ex:
-                last_err = ex
-                continue
-
-        if not scam_data and last_err:
-            return {"error": f"讀取熱區資料失敗: {str(last_err)}"}
-
-        return scam_data
+        body, gzip_body, etag = await asyncio.to_thread(CRIME_DATA.points, day)
     except Exception as e:
         return {"error": str(e)}
-
-@app.get("/api/crime_data")
-async def api_crime_data():
+    return _precompressed_response(request, body, gzip_body, etag)
+
+@app.get("/api/crime_data/heatmap")
+async def api_crime_heatmap(request: Request, date: Optional[str] = None, cell: float = 0.005, scam_type: Optional[str] = None):
+    """伺服器端依格子預先分箱的熱區計數 (cell 為格子大小，單位：度)"""
+    day = _crime_date(date)
+    if not 0.001 <= cell <= 0.1:
+        raise HTTPException(status_code=400, detail="cell 必須介於 0.001 與 0.1 之間")
     try:
-        scam_types = []
-        with open("data/scam_types.csv", mode="r", encoding="utf-8") as infile:
-            reader = csv.DictReader(infile)
-            scam_types = [row["type"] for row in reader]
-        if not scam_types: scam_types = ["假投資", "假網拍"]
-
-        districts = []
-        with open("data/heatmap_data.csv", mode="r", encoding="utf-8") as infile:
-            reader = csv.DictReader(infile)
-            for row in reader:
-                districts.append({"name": row["district"], "lat": float(row["lat"]), "lng": float(row["lng"]), "cases": int(row["cases"])})
-
-        crime_points = []
-        for district in districts:
-            for _ in range(district["cases"]):
-                lat_offset = (random.random() - 0.5) * 0.05
-                lng_offset = (random.random() - 0.5) * 0.05
-                day_offset = random.randint(1, 30)
-                crime_points.append({
-                    "lat": district["lat"] + lat_offset,
-                    "lng": district["lng"] + lng_offset,
-                    "type": random.choice(scam_types),
-                    "date": f"2025-04-{day_offset}",
-                    "location": f"{district['name']}某處"
-                })
-        return crime_points
+        type_index = None
+        if scam_type is not None:
+            names = CRIME_DATA.type_names()
+            if scam_type not in names:
+                raise HTTPException(status_code=400, detail=f"未知的詐騙類型: {scam_type}")
+            type_index = names.index(scam_type)
+        body, gzip_body, etag = await asyncio.to_thread(CRIME_DATA.heatmap, day, cell, type_index)
+    except HTTPException:
+        raise
     except Exception as e:
         return {"error": str(e)}
+    return _precompressed_response(request, body, gzip_body, etag)
 
 # --- 模擬互動 API (Simulation) ---
+SCENARIO_NAMES = {"fake_investment": "假投資詐騙"}
+
+def _create_script_prompt(scenario: str, turns: int) -> str:
+    """生成整段演練腳本的 Prompt (詐騙方開場，雙方交替)"""
+    return f"""
+角色：防詐演練腳本作者。情境：{SCENARIO_NAMES.get(scenario, scenario)}。
+請寫一段 {turns} 句的 LINE 對話，由詐騙者 (scammer) 開場，與使用者 (user) 交替發言。
+詐騙者要展現真實話術 (催促、保證獲利、拉群、下載 App 等)，每句 50 字內，繁體中文。
+嚴格回傳 JSON: {{ "script": [{{ "from": "scammer", "text": "..." }}, {{ "from": "user", "text": "..." }}] }}
+"""
+
+def _fallback_simulation_script(turns: int) -> List[Dict[str, str]]:
+    """AI 無法生成時的備用腳本：以預設腳本的句子輪流湊滿回合數"""
+    presets = [p["script"] for p in PRESET_SCRIPTS if isinstance(p, dict) and p.get("script")]
+    lines = random.choice(presets) if presets else [
+        {"from": "scammer", "text": "您好，我是王牌投顧張老師，最近有一檔飆股想跟您分享。"},
+        {"from": "user", "text": "真的假的？怎麼賺？"},
+    ]
+    return [dict(lines[i % len(lines)]) for i in range(turns)]
+
+async def _generate_script(scenario: str, turns: int, priority: str = SIMULATION) -> list:
+    """呼叫 OLLAMA_MODEL 生成一段腳本，回傳原始 script 欄位 (尚未驗證)"""
+    payload = {"model": OLLAMA_MODEL, "prompt": _create_script_prompt(scenario, turns), "format": "json",
+               "stream": False, "keep_alive": OLLAMA_MODEL_KEEP_ALIVE}
+    async with llm_slot(priority, OLLAMA_API_URL, OLLAMA_MODEL, slow_after=60.0):
+        resp = await get_async_client().post(OLLAMA_API_URL, json=payload, timeout=60.0)
+        resp.raise_for_status()
+    return json.loads(resp.json().get("response", "{}")).get("script")
+
+async def _generate_library_script(scenario: str, turns: int) -> list:
+    """腳本庫背景補充 (BACKGROUND 優先權)"""
+    return await _generate_script(scenario, turns, BACKGROUND)
+
+# 持久化腳本庫：背景在 LLM 閒置時預先生成，兩個端點都直接從庫中取用
+SCRIPT_LIBRARY = ScriptLibrary(
+    SCRIPT_LIBRARY_PATH, _generate_library_script, keys=[("fake_investment", t) for t in SCRIPT_LIBRARY_TURNS], scenarios=set(SCENARIO_NAMES),
+    is_idle=LLM_SCHEDULER.idle, target_per_key=SCRIPT_LIBRARY_TARGET, max_per_key=SCRIPT_LIBRARY_MAX,
+    max_age=SCRIPT_LIBRARY_MAX_AGE, refill_interval=SCRIPT_LIBRARY_REFILL_INTERVAL,
+)
+SCRIPT_LIBRARY.load()
+for _preset in PRESET_SCRIPTS:
+    if isinstance(_preset, dict):
+        SCRIPT_LIBRARY.add("fake_investment", len(_preset.get("script", [])), _preset.get("script"),
+                           title=_preset.get("title", "體驗腳本"), persona=_preset.get("persona"), source="preset", pinned=True)
+    else:
+        SCRIPT_LIBRARY.add("fake_investment", len(_preset), _preset, title="體驗腳本", source="preset", pinned=True)
+
 @app.get("/preset_script")
 async def preset_script():
-    if not PRESET_SCRIPTS:
+    entry = SCRIPT_LIBRARY.take_any("fake_investment")
+    if entry is None:
         return {"id": "fallback", "title": "臨時體驗腳本", "persona": None, "script": _fallback_simulation_script(6), "source": "Fallback-Preset"}
-    preset = random.choice(PRESET_SCRIPTS)
-    if isinstance(preset, list):
-        return {"id": "legacy", "title": "體驗腳本", "persona": None, "script": preset, "source": "Preset-Random-legacy"}
     return {
-        "id": preset.get("id", "unknown"),
-        "title": preset.get("title", "體驗腳本"),
-        "persona": preset.get("persona"),
-        "script": preset.get("script", []),
-        "source": "Preset-Random"
+        "id": entry["id"],
+        "title": entry["title"],
+        "persona": entry["persona"],
+        "script": entry["script"],
+        "source": "Preset-Random" if entry["source"] == "preset" else "Script Library",
     }
 
 @app.post("/generate_script")
 async def generate_script(req: ScriptRequest):
     turns = max(4, min(req.turns, 12))
-    prompt = _create_script_prompt(req.scenario or "fake_investment", turns)
-    payload = {"model": OLLAMA_MODEL, "prompt": prompt, "format": "json", "stream": False}
-    
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        try:
-            resp = await client.post(OLLAMA_API_URL, json=payload)
-            data = resp.json()
-            script = json.loads(data.get("response", "{}")).get("script")
-            if script: return {"script": script, "source": "Plan A: Live Gemma"}
+    scenario = req.scenario or "fake_investment"
+    if scenario not in SCENARIO_NAMES:
+        raise HTTPException(status_code=400, detail=f"未知的情境: {scenario}")
+    entry = SCRIPT_LIBRARY.take(scenario, turns)
+    if entry is not None:
+        return {"script": entry["script"], "source": "Script Library"}
+
+    # 庫中沒有這個分組 (已列入背景補充名單)，才即時生成
+    try:
+        script = validate_script(await _generate_script(scenario, turns), turns)
+        if script is None:
             raise ValueError("Invalid script")
-        except Exception as e:
-            print(f"AI 腳本生成失敗: {e}")
-            return {"script": _fallback_simulation_script(turns), "source": "Fallback-Script"}
+        SCRIPT_LIBRARY.add(scenario, turns, script)
+        return {"script": script, "source": "Plan A: Live Gemma"}
+    except Exception as e:
+        print(f"AI 腳本生成失敗: {e}")
+        return {"script": _fallback_simulation_script(turns), "source": "Fallback-Script"}
 # --- 補上遺失的輔助函式 ---
 
 def _fallback_scammer_reply(history: List[Dict[str, str]] | None = None) -> str:
@@ -846,9 +1383,8 @@ def _fallback_scammer_reply(history: List[Dict[str, str]] | None = None) -> str:
     return "名額有限，請盡快下載我們的 App 開始獲利。"
 
 def _create_reply_prompt(scenario: str, history: List[Dict[str, str]], persona: Optional[str] = None) -> str:
-    """將對話紀錄組裝成 Prompt"""
-    # 只取最後 5 句，避免 Prompt 太長
-    hist_str = "\n".join([f"- {m.get('from')}: {m.get('text')}" for m in history[-5:]])
+    """將對話紀錄組裝成 Prompt (較早的對話壓縮成摘要，總長度有上限)"""
+    hist_str = conversation_context(history).transcript()
     
     return f"""
 角色：假投資詐騙者。人設：{persona}。
@@ -865,17 +1401,67 @@ def _create_reply_prompt(scenario: str, history: List[Dict[str, str]], persona:
 @app.post("/chat_reply")
 async def chat_reply(req: ChatReplyRequest):
     prompt = _create_reply_prompt(req.scenario, req.history, req.persona)
-    payload = {"model": OLLAMA_MODEL, "prompt": prompt, "format": "json", "stream": False, "options": {"temperature": 0.9}}
+    payload = {"model": OLLAMA_MODEL, "prompt": prompt, "format": "json", "stream": False, "keep_alive": OLLAMA_MODEL_KEEP_ALIVE, "options": {"temperature": 0.9}}
     
-    async with httpx.AsyncClient(timeout=60.0) as client:
+    try:
+        async with llm_slot(SIMULATION, OLLAMA_API_URL, OLLAMA_MODEL, slow_after=60.0):
+            resp = await get_async_client().post(OLLAMA_API_URL, json=payload, timeout=60.0)
+            resp.raise_for_status()
+        data = resp.json()
+        reply = json.loads(data.get("response", "{}")).get("text")
+        if reply: return {"from": "scammer", "text": reply, "source": "Plan A: Live Gemma"}
+        raise ValueError("Invalid reply")
+    except Exception:
+        return {"from": "scammer", "text": _fallback_scammer_reply(req.history), "source": "Fallback-Reply"}
+
+@app.post("/chat_reply/stream")
+async def chat_reply_stream(req: ChatReplyRequest):
+    """/chat_reply 的 SSE 版本：`token` 事件送出 text 欄位新增的文字，最後送出 `result`"""
+    prompt = _create_reply_prompt(req.scenario, req.history, req.persona)
+    payload = {"model": OLLAMA_MODEL, "prompt": prompt, "format": "json", "keep_alive": OLLAMA_MODEL_KEEP_ALIVE, "options": {"temperature": 0.9}}
+
+    async def event_stream():
+        buffer, shown = "", ""
+        try:
+            async with llm_slot(SIMULATION, OLLAMA_API_URL, OLLAMA_MODEL, slow_after=60.0):
+                async for chunk in iter_ollama_stream(OLLAMA_API_URL, payload, timeout=60.0):
+                    buffer += chunk.get("response", "")
+                    text = partial_json_string(buffer, "text")
+                    if len(text) > len(shown):
+                        yield _sse_event("token", {"delta": text[len(shown):]})
+                        shown = text
+            reply = json.loads(buffer or "{}").get("text")
+            if not reply:
+                raise ValueError("Invalid reply")
+            result = {"from": "scammer", "text": reply, "source": "Plan A: Live Gemma"}
+        except Exception as e:
+            print(f"chat_reply 串流失敗: {e}")
+            result = {"from": "scammer", "text": _fallback_scammer_reply(req.history), "source": "Fallback-Reply"}
+        yield _sse_event("result", result)
+
+    return _sse_response(event_stream())
+
+@app.post("/scammer_reply/stream")
+async def scammer_reply_stream(req: ScammerReplyRequest):
+    """scammer-pro 詐騙模式的 SSE 版本：逐字送出 `token`，最後送出 `result`"""
+    payload = scammer_chat_payload(conversation_context(req.history))
+
+    async def event_stream():
+        reply = ""
         try:
-            resp = await client.post(OLLAMA_API_URL, json=payload)
-            data = resp.json()
-            reply = json.loads(data.get("response", "{}")).get("text")
-            if reply: return {"from": "scammer", "text": reply, "source": "Plan A: Live Gemma"}
-            raise ValueError("Invalid reply")
-        except Exception:
-            return {"from": "scammer", "text": _fallback_scammer_reply(req.history), "source": "Fallback-Reply"}
+            async with llm_slot(SIMULATION, OLLAMA_CHAT_URL, SCAMMER_MODEL):
+                async for chunk in iter_ollama_stream(OLLAMA_CHAT_URL, payload, timeout=20.0):
+                    token = chunk.get("message", {}).get("content", "")
+                    if token:
+                        reply += token
+                        yield _sse_event("token", {"delta": token})
+            result = {"from": "scammer", "text": reply.strip() or "機會不等人，快點加入我們！", "source": f"Plan A: Live ({SCAMMER_MODEL})"}
+        except Exception as e:
+            print(f"Scammer AI 串流錯誤: {e}")
+            result = {"from": "scammer", "text": "名額有限，請盡快下載我們的 App 開始獲利。", "source": "Fallback-Reply"}
+        yield _sse_event("result", result)
+
+    return _sse_response(event_stream())
 
 # --- 靜態頁面路由 ---
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -922,11 +1508,42 @@ async def live_ai_check(q: str = "測試訊息"):
     prompt = f"[USER]\n分析：'{q}'\n[ASSISTANT]\n(回傳 JSON)"
     payload = {"model": LIVE_AI_MODEL, "prompt": prompt, "format": "json", "stream": False}
     try:
-        async with httpx.AsyncClient(timeout=6.0) as client:
-            r = await client.post(LIVE_AI_URL, json=payload)
-            return {"ok": r.status_code == 200, "status": r.status_code, "body": r.text[:300], **info}
+        async with llm_slot(BACKGROUND, LIVE_AI_URL, LIVE_AI_MODEL, timeout=6.0):
+            r = await get_async_client().post(LIVE_AI_URL, json=payload, timeout=6.0)
+            r.raise_for_status()
+        return {"ok": True, "status": r.status_code, "body": r.text[:300], **info, "breakers": LLM_BREAKERS.snapshot()}
     except Exception as e:
-        return {"ok": False, "error": str(e), **info}
+        return {"ok": False, "error": str(e), **info, "breakers": LLM_BREAKERS.snapshot()}
+
+@app.get("/debug/script_library")
+async def script_library_stats():
+    """模擬腳本庫：各 (情境:回合數) 分組的存量、命中率、淘汰與驗證統計"""
+    return SCRIPT_LIBRARY.snapshot()
+
+@app.get("/debug/opener_pool")
+async def opener_pool_stats():
+    """LINE 開場白預生成池：各模式/情境的存量、命中率與生成統計"""
+    return OPENER_POOL.snapshot()
+
+@app.get("/debug/llm_scheduler")
+async def llm_scheduler_stats():
+    """LLM 排程器：各類別排隊數、等待時間與被拒絕 (load shedding) 次數"""
+    return LLM_SCHEDULER.snapshot()
+
+@app.get("/debug/detection_cache")
+async def detection_cache_stats():
+    """偵測結果快取的命中率、容量與淘汰統計 (含 Plan A 並行合併統計)"""
+    return {**DETECTION_CACHE.snapshot(), "singleflight": DETECTOR_FLIGHTS.snapshot(),
+            "classifier": SCAM_CLASSIFIER.snapshot() if SCAM_CLASSIFIER else None,
+            "baked_answers": BAKED_ANSWERS.snapshot(),
+            "routing": DETECTION_LATENCY.snapshot()}
+
+@app.get("/debug/admin_data")
+async def admin_data_stats():
+    """後台資料：紀錄庫寫入佇列 (丟棄/錯誤)、犯罪統計快取與即時推播訂閱統計"""
+    return {"incident_store": INCIDENT_STORE.snapshot() if INCIDENT_STORE else None,
+            "crime_data": CRIME_DATA.snapshot(),
+            "admin_feed": ADMIN_FEED.snapshot()}
 
 @app.get("/play")
 async def play_page(): return FileResponse("play.html")
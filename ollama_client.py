@@ -0,0 +1,106 @@
+# ollama_client.py
+"""
+共用的 Ollama 連線池。
+
+- async 路由 (/analyze、/chat_reply、/generate_script、後台分析) 共用同一個
+  httpx.AsyncClient，保持 keep-alive，不再每個請求都重新建立連線。
+- LINE handler 仍是同步流程，共用同一個 requests.Session。
+- 串流 (SSE) 端點使用 iter_ollama_stream 逐段讀取模型輸出。
+"""
+
+import json
+import re
+from typing import Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import OLLAMA_MAX_CONNECTIONS, OLLAMA_MAX_KEEPALIVE, OLLAMA_KEEPALIVE_EXPIRY
+
+_async_client: Optional[httpx.AsyncClient] = None
+_sync_session: Optional[requests.Session] = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """取得共用的 AsyncClient (第一次呼叫時建立)"""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=OLLAMA_MAX_KEEPALIVE,
+                keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _async_client
+
+
+def get_sync_session() -> requests.Session:
+    """取得共用的 requests.Session (給 LINE handler 等同步流程使用)"""
+    global _sync_session
+    if _sync_session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=OLLAMA_MAX_KEEPALIVE, pool_maxsize=OLLAMA_MAX_CONNECTIONS)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _sync_session = session
+    return _sync_session
+
+
+async def close_clients():
+    """關閉連線池 (FastAPI shutdown 時呼叫)"""
+    global _async_client, _sync_session
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _sync_session is not None:
+        _sync_session.close()
+        _sync_session = None
+
+
+# --- 串流 (stream=True) 輔助函式 ---
+
+async def iter_ollama_stream(url: str, payload: dict, timeout: float = 60.0):
+    """以串流模式呼叫 Ollama，逐行 yield 解析後的 JSON chunk"""
+    async with get_async_client().stream("POST", url, json={**payload, "stream": True}, timeout=timeout) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.strip():
+                yield json.loads(line)
+
+
+_JSON_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", '"': '"', "\\": "\\", "/": "/"}
+
+
+def partial_json_string(buffer: str, field: str) -> str:
+    """從尚未生成完的 JSON 文字中，取出字串欄位 field 目前已生成的部分"""
+    match = re.search(r'"%s"\s*:\s*"' % re.escape(field), buffer)
+    if not match:
+        return ""
+    out = []
+    i = match.end()
+    while i < len(buffer):
+        ch = buffer[i]
+        if ch == "\\":
+            if i + 1 >= len(buffer):
+                break
+            nxt = buffer[i + 1]
+            if nxt == "u":
+                if i + 6 > len(buffer):
+                    break
+                try:
+                    out.append(chr(int(buffer[i + 2:i + 6], 16)))
+                except ValueError:
+                    pass
+                i += 6
+                continue
+            out.append(_JSON_ESCAPES.get(nxt, nxt))
+            i += 2
+            continue
+        if ch == '"':
+            break
+        out.append(ch)
+        i += 1
+    return "".join(out)
@@ -0,0 +1,126 @@
+# opener_pool.py
+"""
+LINE 模式切換 (scammer / 開始模擬) 用的預生成開場白池。
+
+原本輸入「scammer」要先同步呼叫 /api/chat (最長 15 秒) 產生開場白才能回覆，
+是 Bot 最慢的互動。現在每個「模式:情境」各有一個開場白池：
+- 模式切換直接從池中取出 (執行緒安全，不需等待 LLM)；
+  池空時立即使用該情境的備用開場白，不阻塞回覆。
+- 背景 task 每 refill_interval 秒最多生成一句 (速率限制)，
+  只在 LLM 閒置 (is_idle) 時補充最缺的池，補到 target_size 為止。
+- 每個池最多 max_size 句，相同 (正規化後) 的開場白不重複加入。
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from background_refill import BackgroundRefill
+from result_cache import normalize_text
+
+
+class _PoolStats:
+    __slots__ = ("hits", "misses", "generated", "duplicates", "failures")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.failures = 0
+
+
+class OpenerPool(BackgroundRefill):
+    def __init__(self, generate: Callable[[str], Awaitable[str]], fallbacks: Dict[str, List[str]],
+                 is_idle: Callable[[], bool] = lambda: True, target_size: int = 5, max_size: int = 20,
+                 refill_interval: float = 10.0):
+        self._generate = generate
+        self.fallbacks = fallbacks
+        self.is_idle = is_idle
+        self.target_size = target_size
+        self.max_size = max_size
+        self.refill_interval = refill_interval
+        self._pools: Dict[str, deque] = {key: deque(maxlen=max_size) for key in fallbacks}
+        self._stats: Dict[str, _PoolStats] = {key: _PoolStats() for key in fallbacks}
+        self._lock = threading.Lock()
+        self.last_refill_at: Optional[float] = None
+        self.skipped_busy = 0
+
+    def keys(self, prefix: str = "") -> List[str]:
+        return [key for key in self._pools if key.startswith(prefix)]
+
+    def take(self, key: str) -> Tuple[str, bool]:
+        """取出一句開場白，回傳 (開場白, 是否來自預生成池)；池空時回傳備用開場白"""
+        with self._lock:
+            pool = self._pools[key]
+            stats = self._stats[key]
+            if pool:
+                stats.hits += 1
+                return pool.popleft(), True
+            stats.misses += 1
+        return random.choice(self.fallbacks[key]), False
+
+    def add(self, key: str, opener: str) -> bool:
+        opener = opener.strip()
+        if not opener:
+            return False
+        normalized = normalize_text(opener)
+        with self._lock:
+            pool = self._pools[key]
+            stats = self._stats[key]
+            if any(normalize_text(existing) == normalized for existing in pool):
+                stats.duplicates += 1
+                return False
+            pool.append(opener)
+            stats.generated += 1
+            return True
+
+    def _most_needed(self) -> Optional[str]:
+        with self._lock:
+            key, pool = min(self._pools.items(), key=lambda item: len(item[1]))
+            return key if len(pool) < self.target_size else None
+
+    async def refill_once(self) -> bool:
+        """LLM 閒置時替最缺的池生成一句，有生成時回傳 True"""
+        key = self._most_needed()
+        if key is None:
+            return False
+        if not self.is_idle():
+            self.skipped_busy += 1
+            return False
+        self.last_refill_at = time.time()
+        try:
+            opener = await self._generate(key)
+        except Exception as e:
+            print(f"開場白預生成失敗 ({key}): {e}")
+            self._stats[key].failures += 1
+            return False
+        return self.add(key, opener)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pools = {}
+            for key, pool in self._pools.items():
+                stats = self._stats[key]
+                served = stats.hits + stats.misses
+                pools[key] = {
+                    "size": len(pool),
+                    "hits": stats.hits,
+                    "misses": stats.misses,
+                    "hit_rate": round(stats.hits / served, 3) if served else None,
+                    "generated": stats.generated,
+                    "duplicates": stats.duplicates,
+                    "failures": stats.failures,
+                }
+        return {
+            "target_size": self.target_size,
+            "max_size": self.max_size,
+            "refill_interval": self.refill_interval,
+            "running": self.running,
+            "refill_errors": self.refill_errors,
+            "last_refill_at": self.last_refill_at,
+            "skipped_busy": self.skipped_busy,
+            "pools": pools,
+        }
@@ -0,0 +1,187 @@
+# result_cache.py
+"""
+偵測結果快取 (放在 Plan A 之前)。
+
+- 以「正規化後文字」的雜湊為 key：NFKC 全形/半形折疊、去除零寬字元、
+  移除空白、英文轉小寫。轉傳的詐騙訊息即使格式略有不同也能命中。
+- LRU + TTL，並以 bytes 限制總大小。
+- SimHash 近似重複查詢：文字只被改動幾個字時仍可命中 (near hit)。
+  網址只佔 n-gram 的一小部分，換掉網域 (typosquat) 幾乎不影響 hash，
+  因此只有訊息中的網址集合與快取完全相同時才允許 near hit。
+- 提供 hit / near_hit / miss / eviction / expiration 統計。
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Set
+
+_ZERO_WIDTH = re.compile("[\u200b-\u200f\u2060-\u2064\ufeff\u00ad]")
+_WHITESPACE = re.compile(r"\s+")
+# 正規化後的文字已去除空白，網址以 ASCII 可見字元的連續片段擷取 (遇到中文等字元即結束)
+_URL = re.compile(r"(?:[a-z][a-z0-9+.-]*://)?(?:[a-z0-9-]+\.)+[a-z][a-z0-9-]+(?::\d+)?(?:[/?#][\x21-\x7e]*)?")
+
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 8
+_BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+
+def normalize_text(text: str) -> str:
+    """折疊全形/半形、零寬字元與空白，作為快取比對用的文字"""
+    text = unicodedata.normalize("NFKC", text)
+    text = _ZERO_WIDTH.sub("", text)
+    text = _WHITESPACE.sub("", text)
+    return text.lower()
+
+
+def text_key(normalized: str) -> str:
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def extract_urls(normalized: str) -> FrozenSet[str]:
+    """擷取正規化文字中的網址 / 網域 (去除 scheme)，作為 near hit 必須完全一致的部分"""
+    return frozenset(url.split("://", 1)[-1] for url in _URL.findall(normalized))
+
+
+def simhash(normalized: str, ngram: int = 3) -> int:
+    """以字元 n-gram 計算 64-bit SimHash"""
+    weights = [0] * SIMHASH_BITS
+    if len(normalized) < ngram:
+        shingles = [normalized]
+    else:
+        shingles = [normalized[i:i + ngram] for i in range(len(normalized) - ngram + 1)]
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    value = 0
+    for bit, w in enumerate(weights):
+        if w > 0:
+            value |= 1 << bit
+    return value
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "size", "simhash", "urls")
+
+    def __init__(self, value: dict, expires_at: float, size: int, simhash_value: Optional[int], urls: FrozenSet[str]):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+        self.simhash = simhash_value
+        self.urls = urls
+
+
+class DetectionCache:
+    """LRU + TTL 的偵測結果快取，支援 SimHash 近似查詢"""
+
+    def __init__(self, ttl: float = 3600.0, max_bytes: int = 8 * 1024 * 1024,
+                 max_distance: int = 6, min_near_length: int = 20):
+        # 8 個 8-bit band：漢明距離 < 8 的兩個 hash 必定落在同一個桶
+        max_distance = min(max_distance, SIMHASH_BANDS - 1)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_distance = max_distance
+        self.min_near_length = min_near_length
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bands: Dict[tuple, Set[str]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "near_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    # --- 查詢 ---
+    def get(self, text: str) -> Optional[dict]:
+        normalized = normalize_text(text)
+        key = text_key(normalized)
+        near_enabled = self.max_distance > 0 and len(normalized) >= self.min_near_length
+        target = simhash(normalized) if near_enabled else None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.expires_at <= now:
+                self._remove(key)
+                self.stats["expirations"] += 1
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return dict(entry.value)
+
+            near = self._near_lookup(target, extract_urls(normalized), now) if target is not None else None
+            if near:
+                self.stats["near_hits"] += 1
+                return near
+            self.stats["misses"] += 1
+            return None
+
+    def _near_lookup(self, target: int, urls: FrozenSet[str], now: float) -> Optional[dict]:
+        # 以 band 分桶，只比對至少有一個 band 完全相同的候選
+        candidates = set()
+        for band_key in self._band_keys(target):
+            candidates |= self._bands.get(band_key, set())
+        for key in candidates:
+            entry = self._entries.get(key)
+            if entry is None or entry.simhash is None:
+                continue
+            if entry.expires_at <= now or entry.urls != urls:
+                continue
+            if bin(entry.simhash ^ target).count("1") <= self.max_distance:
+                self._entries.move_to_end(key)
+                return dict(entry.value)
+        return None
+
+    # --- 寫入 ---
+    def put(self, text: str, value: dict):
+        normalized = normalize_text(text)
+        key = text_key(normalized)
+        size = len(key) + len(normalized.encode("utf-8")) + len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        sh = simhash(normalized) if len(normalized) >= self.min_near_length else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(dict(value), time.monotonic() + self.ttl, size, sh,
+                                        extract_urls(normalized) if sh is not None else frozenset())
+            self._bytes += size
+            if sh is not None:
+                for band_key in self._band_keys(sh):
+                    self._bands.setdefault(band_key, set()).add(key)
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        if entry.simhash is not None:
+            for band_key in self._band_keys(entry.simhash):
+                bucket = self._bands.get(band_key)
+                if bucket:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._bands[band_key]
+
+    @staticmethod
+    def _band_keys(value: int):
+        return [(i, (value >> (i * _BAND_BITS)) & _BAND_MASK) for i in range(SIMHASH_BANDS)]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["near_hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hit_rate": round((self.stats["hits"] + self.stats["near_hits"]) / lookups, 4) if lookups else 0.0,
+            }
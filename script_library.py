@@ -0,0 +1,284 @@
+# script_library.py
+"""
+/generate_script 與 /preset_script 共用的持久化腳本庫。
+
+原本 /generate_script 每次都要等 OLLAMA_MODEL 生成 JSON (最長 60 秒)，
+/preset_script 只能從五組寫死的 PRESET_SCRIPTS 隨機挑。現在：
+- 腳本依 (情境, 回合數) 分組存放，啟動時從 JSON 檔載入，有變動時寫回 (tmp + replace)。
+- 背景 task 在 LLM 閒置時替最缺的分組生成腳本 (速率限制，每 refill_interval 秒最多一份)；
+  曾被請求但沒有庫存的分組也會列入補充名單。
+- 只接受 scenarios 中的情境，任意字串不會進入補充名單或佔用分組名額。
+- 新腳本先驗證格式 (from/text、句數至少等於回合數、長度)，再以字元 bigram Jaccard 相似度去除近似重複。
+- 超過 max_age 的腳本淘汰；分組超過 max_per_key 時先淘汰使用次數最少、其次最舊的
+  (少有人用的舊腳本價值最低)。預設腳本 (pinned) 不會被淘汰。
+- 取用時優先挑使用次數最少的腳本，同次數隨機，讓使用者看到的腳本盡量不重複。
+"""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from background_refill import BackgroundRefill
+from result_cache import normalize_text
+
+LIBRARY_FORMAT_VERSION = 1
+SPEAKERS = ("scammer", "user")
+
+Key = Tuple[str, int]
+
+
+def validate_script(script, turns: int, max_text_chars: int = 200) -> Optional[List[Dict[str, str]]]:
+    """檢查生成的腳本格式，合格時回傳整理後 (剛好 turns 句) 的腳本，否則回傳 None"""
+    if not isinstance(script, list) or len(script) < turns:
+        return None
+    cleaned = []
+    for msg in script[:turns]:
+        if not isinstance(msg, dict):
+            return None
+        speaker, text = msg.get("from"), msg.get("text")
+        if speaker not in SPEAKERS or not isinstance(text, str) or not text.strip():
+            return None
+        cleaned.append({"from": speaker, "text": text.strip()[:max_text_chars]})
+    if not cleaned or cleaned[0]["from"] != "scammer":
+        return None
+    return cleaned
+
+
+def _fingerprint(script: List[Dict[str, str]]) -> Set[str]:
+    text = normalize_text("".join(msg["text"] for msg in script))
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _similarity(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ScriptEntry:
+    __slots__ = ("id", "script", "title", "persona", "source", "pinned", "created_at", "uses", "fingerprint")
+
+    def __init__(self, script: List[Dict[str, str]], title: str, persona: Optional[str] = None, source: str = "generated",
+                 pinned: bool = False, id: Optional[str] = None, created_at: Optional[float] = None, uses: int = 0):
+        self.id = id or uuid.uuid4().hex[:12]
+        self.script = script
+        self.title = title
+        self.persona = persona
+        self.source = source
+        self.pinned = pinned
+        self.created_at = created_at if created_at is not None else time.time()
+        self.uses = uses
+        self.fingerprint = _fingerprint(script)
+
+    def as_dict(self) -> dict:
+        return {"id": self.id, "script": self.script, "title": self.title, "persona": self.persona, "source": self.source,
+                "pinned": self.pinned, "created_at": self.created_at, "uses": self.uses}
+
+
+class ScriptLibrary(BackgroundRefill):
+    def __init__(self, path: Optional[str], generate: Callable[[str, int], Awaitable[list]], keys: List[Key], scenarios: Set[str],
+                 is_idle: Callable[[], bool] = lambda: True, target_per_key: int = 10, max_per_key: int = 30,
+                 max_age: float = 7 * 86400, similarity: float = 0.8, refill_interval: float = 30.0, max_keys: int = 32):
+        self.path = path
+        self._generate = generate
+        self.is_idle = is_idle
+        self.target_per_key = target_per_key
+        self.max_per_key = max_per_key
+        self.max_age = max_age
+        self.similarity = similarity
+        self.refill_interval = refill_interval
+        self.max_keys = max_keys
+        self.scenarios = frozenset(scenarios)
+        self._entries: Dict[Key, List[ScriptEntry]] = {}
+        self._wanted: List[Key] = list(keys)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.stats = {"hits": 0, "misses": 0, "generated": 0, "rejected_invalid": 0, "rejected_duplicate": 0,
+                      "evicted": 0, "failures": 0, "skipped_busy": 0}
+
+    # --- 持久化 ---
+    def load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, mode="r", encoding="utf-8") as infile:
+                data = json.load(infile)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"腳本庫載入失敗 ({self.path}): {e}")
+            return
+        if data.get("format") != LIBRARY_FORMAT_VERSION:
+            return
+        with self._lock:
+            for group in data.get("groups", []):
+                key = (group["scenario"], int(group["turns"]))
+                if key[0] not in self.scenarios:
+                    continue
+                entries = self._entries.setdefault(key, [])
+                known = {e.id for e in entries}
+                for item in group.get("entries", []):
+                    if item.get("pinned") or item.get("id") in known:
+                        continue   # 預設腳本每次啟動重新植入
+                    if validate_script(item.get("script"), key[1]) is None:
+                        continue   # 舊版驗證規則存下的腳本
+                    entries.append(ScriptEntry(**item))
+                self._want(key)
+            for key in list(self._entries):
+                self._evict(key)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            groups = [{"scenario": scenario, "turns": turns, "entries": [e.as_dict() for e in entries if not e.pinned]}
+                      for (scenario, turns), entries in self._entries.items()]
+            self._dirty = False
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as outfile:
+            json.dump({"format": LIBRARY_FORMAT_VERSION, "groups": groups}, outfile, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    # --- 內部 (需持有 lock) ---
+    def _want(self, key: Key):
+        if key[0] in self.scenarios and key not in self._wanted and len(self._wanted) < self.max_keys:
+            self._wanted.append(key)
+
+    def _evict(self, key: Key):
+        entries = self._entries.get(key)
+        if not entries:
+            return
+        now = time.time()
+        kept = [e for e in entries if e.pinned or now - e.created_at < self.max_age]
+        removable = sorted((e for e in kept if not e.pinned), key=lambda e: (e.uses, e.created_at))
+        while len(kept) > self.max_per_key and removable:
+            kept.remove(removable.pop(0))
+        evicted = len(entries) - len(kept)
+        if evicted:
+            self.stats["evicted"] += evicted
+            self._dirty = True
+        self._entries[key] = kept
+
+    @staticmethod
+    def _pick(entries: List[ScriptEntry]) -> ScriptEntry:
+        fewest = min(e.uses for e in entries)
+        entry = random.choice([e for e in entries if e.uses == fewest])
+        entry.uses += 1
+        return entry
+
+    # --- 對外介面 ---
+    def add(self, scenario: str, turns: int, script, title: str = "AI 生成腳本", persona: Optional[str] = None,
+            source: str = "generated", pinned: bool = False) -> Optional[ScriptEntry]:
+        """驗證並加入一份腳本；格式不符或與既有腳本過於相似時回傳 None"""
+        cleaned = validate_script(script, turns)
+        key = (scenario, turns)
+        with self._lock:
+            if cleaned is None or scenario not in self.scenarios:
+                self.stats["rejected_invalid"] += 1
+                return None
+            if key not in self._entries and len(self._entries) >= self.max_keys:
+                return None   # 分組數有上限，避免任意情境名稱讓腳本庫無限成長
+            entry = ScriptEntry(cleaned, title=title, persona=persona, source=source, pinned=pinned)
+            entries = self._entries.setdefault(key, [])
+            if any(_similarity(entry.fingerprint, e.fingerprint) >= self.similarity for e in entries):
+                self.stats["rejected_duplicate"] += 1
+                return None
+            entries.append(entry)
+            if not pinned:
+                self.stats["generated"] += 1
+                self._dirty = True
+            self._want(key)
+            self._evict(key)
+            return entry
+
+    def take(self, scenario: str, turns: int) -> Optional[dict]:
+        """取出 (情境, 回合數) 的一份腳本；沒有庫存時回傳 None 並列入背景補充名單"""
+        key = (scenario, turns)
+        with self._lock:
+            self._evict(key)
+            entries = self._entries.get(key)
+            if not entries:
+                self.stats["misses"] += 1
+                self._want(key)
+                return None
+            self.stats["hits"] += 1
+            self._dirty = True
+            return self._pick(entries).as_dict()
+
+    def take_any(self, scenario: str) -> Optional[dict]:
+        """不限回合數，從情境的所有腳本中挑一份 (/preset_script 用)"""
+        with self._lock:
+            entries = [e for (s, _), group in self._entries.items() if s == scenario for e in group]
+            if not entries:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            self._dirty = True
+            return self._pick(entries).as_dict()
+
+    def _most_needed(self) -> Optional[Key]:
+        with self._lock:
+            if not self._wanted:
+                return None
+            key = min(self._wanted, key=lambda k: sum(1 for e in self._entries.get(k, []) if not e.pinned))
+            filled = sum(1 for e in self._entries.get(key, []) if not e.pinned)
+            return key if filled < self.target_per_key else None
+
+    async def refill_once(self) -> bool:
+        """LLM 閒置時替最缺的分組生成一份腳本，有加入時回傳 True"""
+        key = self._most_needed()
+        if key is None:
+            return False
+        if not self.is_idle():
+            self.stats["skipped_busy"] += 1
+            return False
+        try:
+            script = await self._generate(*key)
+        except Exception as e:
+            print(f"腳本預生成失敗 {key}: {e}")
+            self.stats["failures"] += 1
+            return False
+        return self.add(key[0], key[1], script) is not None
+
+    async def _after_refill(self):
+        try:
+            await asyncio.to_thread(self.save)
+        except Exception as e:
+            print(f"腳本庫寫入失敗 ({self.path}): {e}")
+
+    async def stop(self):
+        await super().stop()
+        try:
+            self.save()
+        except Exception as e:
+            print(f"腳本庫寫入失敗 ({self.path}): {e}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            groups = {
+                f"{scenario}:{turns}": {
+                    "size": len(entries),
+                    "pinned": sum(1 for e in entries if e.pinned),
+                    "uses": sum(e.uses for e in entries),
+                    "oldest_age_s": round(time.time() - min(e.created_at for e in entries), 1) if entries else None,
+                }
+                for (scenario, turns), entries in self._entries.items()
+            }
+            served = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / served, 3) if served else None,
+                "target_per_key": self.target_per_key,
+                "max_per_key": self.max_per_key,
+                "running": self.running,
+                "refill_errors": self.refill_errors,
+                "wanted": [f"{scenario}:{turns}" for scenario, turns in self._wanted],
+                "groups": groups,
+            }
@@ -0,0 +1,129 @@
+# session_store.py
+"""
+LINE 使用者的 session / 個資暫存區。
+
+- 閒置超過 idle_ttl 秒自動淘汰 (存取時或寫入時順便清理)。
+- 超過 max_sessions 時淘汰最久沒用到的使用者 (LRU)。
+- 每個 session 的對話上下文為 ConversationContext (token 預算 + 滾動摘要，最多 max_history 則原文)，
+  長時間執行的 Bot 記憶體用量維持固定。
+- 紀錄物件使用 __slots__，減少每位使用者的額外記憶體。
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Optional, TypeVar
+
+from conversation_context import ConversationContext
+
+T = TypeVar("T")
+
+
+class UserSession:
+    """LINE 模式狀態 (scamming / detecting / simulating)"""
+    __slots__ = ("status", "context", "turns")
+
+    def __init__(self, status: str, max_history: int = 20, token_budget: int = 600, summary_tokens: int = 200):
+        self.status = status
+        self.context = ConversationContext(token_budget=token_budget, summary_tokens=summary_tokens, max_turns=max_history)
+        self.turns = 0
+
+    def approx_bytes(self) -> int:
+        return sys.getsizeof(self) + self.context.approx_bytes()
+
+
+class UserProfile:
+    """模擬使用者個資 (給後台分析用)"""
+    __slots__ = ("age", "job", "district")
+
+    def __init__(self, age: int, job: str, district: str):
+        self.age = age
+        self.job = job
+        self.district = district
+
+    def as_dict(self) -> dict:
+        return {"age": self.age, "job": self.job, "district": self.district}
+
+    def approx_bytes(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.job) + sys.getsizeof(self.district)
+
+
+class SessionStore(Generic[T]):
+    """閒置 TTL + LRU 上限的 key-value 暫存區 (執行緒安全)"""
+
+    def __init__(self, name: str, idle_ttl: float, max_sessions: int):
+        self.name = name
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._items: "OrderedDict[str, list]" = OrderedDict()  # key -> [value, last_seen]
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "expired": 0, "evicted": 0, "removed": 0}
+
+    def _expire(self, now: float):
+        # OrderedDict 依最後存取時間排序，只需從最舊的一端開始清
+        while self._items:
+            key, (_, last_seen) = next(iter(self._items.items()))
+            if now - last_seen < self.idle_ttl:
+                break
+            del self._items[key]
+            self.stats["expired"] += 1
+
+    def get(self, key: str) -> Optional[T]:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            item = self._items.get(key)
+            if item is None:
+                return None
+            item[1] = now
+            self._items.move_to_end(key)
+            return item[0]
+
+    def get_or_create(self, key: str, factory: Callable[[], T]) -> T:
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def set(self, key: str, value: T):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if key not in self._items:
+                self.stats["created"] += 1
+            self._items[key] = [value, now]
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_sessions:
+                self._items.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def pop(self, key: str) -> Optional[T]:
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                self.stats["removed"] += 1
+            return item[0] if item else None
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._items)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._expire(time.monotonic())
+            values = [v for v, _ in self._items.values()]
+            stats = dict(self.stats)
+        approx = sum(v.approx_bytes() if hasattr(v, "approx_bytes") else sys.getsizeof(v) for v in values)
+        return {
+            **stats,
+            "size": len(values),
+            "max_sessions": self.max_sessions,
+            "idle_ttl": self.idle_ttl,
+            "approx_bytes": approx,
+        }
@@ -0,0 +1,123 @@
+# singleflight.py
+"""
+Single-flight：相同 key 的並行呼叫只執行一次，其餘呼叫等待並共用結果。
+
+同一個 SingleFlight 可同時給 async 路由 (/analyze) 與
+LINE 的同步 handler (執行緒) 使用：兩邊都等待同一個
+concurrent.futures.Future。
+
+timeout 只限制「這個呼叫者」願意等多久：逾時的呼叫者拋出 TimeoutError 先行離開，
+共用的工作仍會完成 (結果照樣寫入快取)，不影響其他等待者。
+
+StreamProgress 讓串流的 leader 把目前為止生成的文字分享給同一 key 的其他 SSE 連線。
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Executor, Future
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        """回傳 (future, 是否為 leader)"""
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.stats["coalesced"] += 1
+                return fut, False
+            fut = Future()
+            self._inflight[key] = fut
+            self.stats["leaders"] += 1
+            return fut, True
+
+    def _finish(self, key: str):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def do(self, key: str, fn: Callable[[], object], timeout: Optional[float] = None, executor: Optional[Executor] = None):
+        """
+        同步版本：leader 執行 fn，其餘執行緒阻塞等待結果。
+        未指定 executor 時 leader 在自己的執行緒中執行，timeout 只套用在等待者；
+        指定 executor 時 fn 交給 executor 執行，leader 也只等 timeout 秒，逾時後工作仍繼續完成。
+        """
+        fut, leader = self._join(key)
+        if leader and executor is not None:
+            executor.submit(self._run_sync, key, fut, fn)
+        elif leader:
+            return self._run_sync(key, fut, fn, reraise=True)
+        return fut.result(timeout)
+
+    def _run_sync(self, key: str, fut: Future, fn: Callable[[], object], reraise: bool = False):
+        try:
+            result = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            if reraise:
+                raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            self._finish(key)
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[object]], timeout: Optional[float] = None):
+        """async 版本：leader 以背景 task 執行 fn，所有協程 (含 leader) await 同一個結果"""
+        fut, leader = self._join(key)
+        if leader:
+            task = asyncio.ensure_future(self._run_async(key, fut, fn))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        # shield：呼叫者被取消或逾時都不會取消共用的工作
+        waiter = asyncio.shield(asyncio.wrap_future(fut))
+        if timeout is None:
+            return await waiter
+        return await asyncio.wait_for(waiter, timeout)
+
+    async def _run_async(self, key: str, fut: Future, fn: Callable[[], Awaitable[object]]):
+        try:
+            result = await fn()
+        except BaseException as e:
+            fut.set_exception(e)
+        else:
+            fut.set_result(result)
+        finally:
+            self._finish(key)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "inflight": len(self._inflight)}
+
+
+class StreamProgress:
+    """串流 leader 目前已生成的文字 (只在 event loop 中使用)；follower 從頭重播再接著收新的部分"""
+    __slots__ = ("text", "started", "_changed")
+
+    def __init__(self):
+        self.text = ""
+        self.started = False
+        self._changed = asyncio.Event()
+
+    def update(self, text: str):
+        self.text = text
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def follow(self, result: "asyncio.Future"):
+        """在 result 完成前，每當文字變長就 yield 目前的完整文字"""
+        shown = 0
+        while True:
+            if len(self.text) > shown:
+                shown = len(self.text)
+                yield self.text
+            if result.done():
+                return
+            changed = asyncio.ensure_future(self._changed.wait())
+            await asyncio.wait({changed, result}, return_when=asyncio.FIRST_COMPLETED)
+            changed.cancel()
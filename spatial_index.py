@@ -0,0 +1,126 @@
+# spatial_index.py
+"""
+里別熱區資料的空間索引 (均勻網格)。
+
+地圖前端原本下載全部里別再自行篩選；資料擴充到整個新竹縣或其他縣市後，
+改由後端依視窗範圍 (bbox)、最近 k 個里、或視窗內某類別前 N 名回傳少量結果。
+網格以經緯度切成固定大小的格子，查詢只需掃描相關格子，
+成本與查詢範圍內的點數成正比，而不是整份資料。
+"""
+
+import heapq
+import math
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 里別資料中可排序的詐騙類別分數欄位
+CATEGORIES = ("investment", "shopping", "auction", "dating", "marriage")
+
+_KM_PER_DEG_LAT = 111.32
+
+
+def distance_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """等距圓柱投影近似距離 (城市尺度下誤差可忽略)"""
+    x = (lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = lat2 - lat1
+    return math.hypot(x, y) * _KM_PER_DEG_LAT
+
+
+class GridIndex:
+    """以 (lat, lng) 格子分桶的靜態索引；建立後不再修改"""
+
+    def __init__(self, records: Sequence[dict], cell_deg: float = 0.01):
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], List[dict]] = defaultdict(list)
+        self._size = 0
+        for record in records:
+            loc = record.get("location") or {}
+            lat, lng = loc.get("lat"), loc.get("lng")
+            if lat is None or lng is None:
+                continue
+            self._cells[self._cell(lat, lng)].append(record)
+            self._size += 1
+        self._cells = dict(self._cells)
+        if self._cells:
+            rows = [r for r, _ in self._cells]
+            cols = [c for _, c in self._cells]
+            self._bounds = (min(rows), max(rows), min(cols), max(cols))
+        else:
+            self._bounds = (0, -1, 0, -1)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def bbox(self, south: float, west: float, north: float, east: float) -> List[dict]:
+        """回傳落在 [south, north] x [west, east] 內的里別"""
+        if south > north or west > east:
+            return []
+        r0, c0 = self._cell(south, west)
+        r1, c1 = self._cell(north, east)
+        min_r, max_r, min_c, max_c = self._bounds
+        r0, r1 = max(r0, min_r), min(r1, max_r)
+        c0, c1 = max(c0, min_c), min(c1, max_c)
+        if r0 > r1 or c0 > c1:
+            return []
+        # 範圍比有資料的格子還大時，直接掃描有資料的格子
+        if (r1 - r0 + 1) * (c1 - c0 + 1) > len(self._cells):
+            buckets = (b for (r, c), b in self._cells.items() if r0 <= r <= r1 and c0 <= c <= c1)
+        else:
+            buckets = (self._cells.get((r, c)) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1))
+        result = []
+        for bucket in buckets:
+            if not bucket:
+                continue
+            for record in bucket:
+                loc = record["location"]
+                if south <= loc["lat"] <= north and west <= loc["lng"] <= east:
+                    result.append(record)
+        return result
+
+    def nearest(self, lat: float, lng: float, k: int = 5) -> List[Tuple[float, dict]]:
+        """回傳距離 (lat, lng) 最近的 k 個里別 [(距離 km, 紀錄)]，由近到遠"""
+        if k <= 0 or not self._cells:
+            return []
+        k = min(k, self._size)
+        r, c = self._cell(lat, lng)
+        min_r, max_r, min_c, max_c = self._bounds
+        max_ring = max(abs(r - min_r), abs(r - max_r), abs(c - min_c), abs(c - max_c))
+        # 一格在緯度 / 經度方向的最短公里數，用來判斷外圈是否還可能更近
+        cell_km = self.cell_deg * _KM_PER_DEG_LAT * min(1.0, math.cos(math.radians(min(abs(lat) + self.cell_deg * max_ring, 89.0))))
+        best: List[Tuple[float, int, dict]] = []  # max-heap (負距離)
+        for ring in range(max_ring + 1):
+            if len(best) == k and (ring - 1) * cell_km > -best[0][0]:
+                break
+            for cell in self._ring_cells(r, c, ring):
+                for record in self._cells.get(cell, ()):
+                    loc = record["location"]
+                    d = distance_km(lat, lng, loc["lat"], loc["lng"])
+                    item = (-d, id(record), record)
+                    if len(best) < k:
+                        heapq.heappush(best, item)
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, item)
+        return [(-neg_d, record) for neg_d, _, record in sorted(best, reverse=True)]
+
+    @staticmethod
+    def _ring_cells(r: int, c: int, ring: int):
+        if ring == 0:
+            yield (r, c)
+            return
+        for dc in range(-ring, ring + 1):
+            yield (r - ring, c + dc)
+            yield (r + ring, c + dc)
+        for dr in range(-ring + 1, ring):
+            yield (r + dr, c - ring)
+            yield (r + dr, c + ring)
+
+    def top(self, category: str, n: int = 10, bbox: Optional[Tuple[float, float, float, float]] = None) -> List[dict]:
+        """視窗內 (或全部) 依某類別分數排序的前 n 個里別"""
+        if bbox is not None:
+            candidates = self.bbox(*bbox)
+        else:
+            candidates = (record for bucket in self._cells.values() for record in bucket)
+        return heapq.nlargest(n, candidates, key=lambda record: record.get(category, 0))
@@ -37,21 +37,39 @@ document.addEventListener("DOMContentLoaded", () => {
             analyzeButton.disabled = true; // 防止重複點擊
 
             try {
-                // 關鍵！呼叫我們在 "同一個" 伺服器上的 /analyze API
-                const response = await fetch(`${API_BASE}/analyze`, { // 支援相對或跨網域
-                    method: "POST",
-                    headers: {
-                        "Content-Type": "application/json",
-                    },
-                    body: JSON.stringify({ text: textToAnalyze })
-                });
+                let llmResult;
+                try {
+                    // 優先使用串流版本：AI 分析邊生成邊顯示
+                    let streamText = null;
+                    llmResult = await postSSE(`${API_BASE}/analyze/stream`, { text: textToAnalyze }, (event, data) => {
+                        if (event !== "token") return;
+                        if (!streamText) {
+                            loadingIndicator.style.display = "none";
+                            resultBox.className = "result-box";
+                            resultBox.innerHTML = `<p><strong>AI 分析：</strong> <span></span></p>`;
+                            streamText = resultBox.querySelector("span");
+                            resultContainer.style.display = "block";
+                        }
+                        streamText.textContent += data.delta;
+                    });
+                } catch (streamError) {
+                    console.warn("串流分析失敗，改用 /analyze：", streamError);
+                    // 關鍵！呼叫我們在 "同一個" 伺服器上的 /analyze API
+                    const response = await fetch(`${API_BASE}/analyze`, { // 支援相對或跨網域
+                        method: "POST",
+                        headers: {
+                            "Content-Type": "application/json",
+                        },
+                        body: JSON.stringify({ text: textToAnalyze })
+                    });
 
-                if (!response.ok) {
-                    throw new Error(`API 請求失敗 (HTTP ${response.status})`);
-                }
+                    if (!response.ok) {
+                        throw new Error(`API 請求失敗 (HTTP ${response.status})`);
+                    }
 
-                // 後端已確保回傳的是格式正確的 JSON 物件
-                const llmResult = await response.json();
+                    // 後端已確保回傳的是格式正確的 JSON 物件
+                    llmResult = await response.json();
+                }
                 
                 // 直接顯示格式化的結果
                 displayResult(llmResult);
@@ -198,12 +216,25 @@ document.addEventListener("DOMContentLoaded", () => {
                                 history: historyPayload.slice(-10)
                             };
 
-                            const replyResp = await fetch(`${API_BASE}/chat_reply`, {
-                                method: "POST",
-                                headers: { "Content-Type": "application/json" },
-                                body: JSON.stringify(payload)
-                            });
-                            let replyData = await replyResp.json();
+                            // 優先使用串流版本，詐騙者的回覆逐字出現
+                            let streamEl = null;
+                            let replyData;
+                            try {
+                                replyData = await postSSE(`${API_BASE}/chat_reply/stream`, payload, (event, data) => {
+                                    if (event !== "token") return;
+                                    if (!streamEl) streamEl = appendSimMessage("scammer", "", false);
+                                    streamEl.textContent += data.delta;
+                                    simBody.scrollTop = simBody.scrollHeight;
+                                });
+                            } catch (streamError) {
+                                console.warn("串流續聊失敗，改用 /chat_reply：", streamError);
+                                const replyResp = await fetch(`${API_BASE}/chat_reply`, {
+                                    method: "POST",
+                                    headers: { "Content-Type": "application/json" },
+                                    body: JSON.stringify(payload)
+                                });
+                                replyData = await replyResp.json();
+                            }
 
                             const recentScammers = [...chatHistory].filter(m => m.from === "scammer").slice(-3);
                             const isDup = replyData && replyData.text && recentScammers.some(m => m.text.trim() === replyData.text.trim());
@@ -228,7 +259,14 @@ document.addEventListener("DOMContentLoaded", () => {
                             }
 
                             if (replyData && replyData.from === "scammer" && replyData.text) {
-                                appendSimMessage("scammer", replyData.text);
+                                if (streamEl) {
+                                    streamEl.textContent = replyData.text;
+                                    chatHistory.push({ from: "scammer", text: replyData.text });
+                                } else {
+                                    appendSimMessage("scammer", replyData.text);
+                                }
+                            } else if (streamEl) {
+                                streamEl.remove();
                             }
                         } catch (err) {
                             console.error("/chat_reply 失敗：", err);
@@ -260,6 +298,7 @@ document.addEventListener("DOMContentLoaded", () => {
             if (record && (from === "user" || from === "scammer")) {
                 chatHistory.push({ from, text });
             }
+            return msgElement;
         }
     }
 
@@ -310,6 +349,46 @@ document.addEventListener("DOMContentLoaded", () => {
 
 }); // 確保 DOMContentLoaded 是最外層的括號
 
+// ------------- SSE 串流：POST 後逐一處理事件 -------------
+// 每收到一個事件就呼叫 onEvent(event, data)，最後回傳 `result` 事件的內容
+async function postSSE(url, payload, onEvent) {
+    const response = await fetch(url, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(payload)
+    });
+    if (!response.ok || !response.body) {
+        throw new Error(`串流請求失敗 (HTTP ${response.status})`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let result = null;
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf("\n\n")) !== -1) {
+            const rawEvent = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+            let event = "message";
+            let data = "";
+            rawEvent.split("\n").forEach(line => {
+                if (line.startsWith("event:")) event = line.slice(6).trim();
+                else if (line.startsWith("data:")) data += line.slice(5).trim();
+            });
+            if (!data) continue;
+            const parsed = JSON.parse(data);
+            if (event === "result") result = parsed;
+            if (onEvent) onEvent(event, parsed);
+        }
+    }
+    if (!result) throw new Error("串流未回傳結果");
+    return result;
+}
+
 // ------------- 儀表板：載入資料與繪圖 -------------
 async function loadDashboardData() {
     // 如果沒有 Chart.js，則不執行任何操作
@@ -0,0 +1,46 @@
+import random
+
+from incident_store import IncidentStore
+
+
+def _fill(store, n=600):
+    random.seed(7)
+    rows = []
+    for i in range(n):
+        # 寫入順序與 ts 有些微交錯 (多執行緒 add 的情況)
+        ts = 1_700_000_000 + i * 10 + random.uniform(-0.5, 0.5)
+        log = {"source": random.choice(["Web", "LINE"]), "text": f"msg {i}", "type": random.choice(["假投資詐騙", "正常訊息"]),
+               "risk": random.randint(0, 100)}
+        store.add(log, ts)
+        rows.append((i + 1, ts, log))
+    store.close()
+    return rows
+
+
+def _all_pages(store, **filters):
+    ids, cursor = [], None
+    while True:
+        page = store.query(limit=37, cursor=cursor, **filters)
+        ids.extend(log["id"] for log in page["logs"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_time_and_risk_filters_match_full_scan(tmp_path):
+    store = IncidentStore(str(tmp_path / "incidents.db"))
+    rows = _fill(store)
+    since, until = 1_700_000_000 + 1234.2, 1_700_000_000 + 4321.7
+    cases = [
+        ({"since": since, "until": until}, lambda ts, log: since <= ts < until),
+        ({"since": since}, lambda ts, log: ts >= since),
+        ({"until": until}, lambda ts, log: ts < until),
+        ({"min_risk": 10, "max_risk": 90}, lambda ts, log: 10 <= log["risk"] <= 90),
+        ({"min_risk": 50, "max_risk": 50}, lambda ts, log: log["risk"] == 50),
+        ({"scam_type": "假投資詐騙", "since": since, "until": until, "min_risk": 30},
+         lambda ts, log: log["type"] == "假投資詐騙" and since <= ts < until and log["risk"] >= 30),
+        ({"since": 1_800_000_000}, lambda ts, log: False),
+    ]
+    for filters, keep in cases:
+        expected = [row_id for row_id, ts, log in reversed(rows) if keep(ts, log)]
+        assert _all_pages(store, **filters) == expected, filters
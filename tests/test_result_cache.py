@@ -0,0 +1,30 @@
+from result_cache import DetectionCache, extract_urls, normalize_text
+
+SAFE = {"risk_score": 5, "scam_type": "正常訊息", "analysis": "官方物流通知"}
+NOTICE = "您好，您的訂單已出貨，預計明天下午送達，請至 {} 查詢配送進度，如有問題請聯繫客服，謝謝您的購買。"
+
+
+def test_extract_urls_ignores_scheme():
+    urls = extract_urls(normalize_text("查詢 HTTPS://www.KerryTJ.com/track?no=1 或 kerrytj.com"))
+    assert urls == {"www.kerrytj.com/track?no=1", "kerrytj.com"}
+
+
+def test_near_hit_for_small_text_change():
+    cache = DetectionCache()
+    cache.put(NOTICE.format("https://www.kerrytj.com/track"), SAFE)
+    assert cache.get(NOTICE.format("https://www.kerrytj.com/track") + "!") == SAFE
+    assert cache.stats["near_hits"] == 1
+
+
+def test_typosquat_url_is_not_a_near_hit():
+    cache = DetectionCache()
+    cache.put(NOTICE.format("https://www.kerrytj.com/track"), SAFE)
+    for url in ("https://www.kerrytj.cc/track", "https://www.kerrtj.com/track", "www.kerrytj.com.tw-track.cc/track"):
+        assert cache.get(NOTICE.format(url)) is None
+    assert cache.stats["near_hits"] == 0
+
+
+def test_url_added_to_cached_text_is_not_a_near_hit():
+    cache = DetectionCache()
+    cache.put(NOTICE.format("官網"), SAFE)
+    assert cache.get(NOTICE.format("http://kerrytj-track.top")) is None
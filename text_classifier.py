@@ -0,0 +1,222 @@
+# text_classifier.py
+"""
+Plan C：本地輕量分類器 (字元 n-gram TF-IDF + 最近類別中心的線性模型)。
+
+位於 Plan B (關鍵字) 與 Plan A (detector-pro) 之間：
+關鍵字沒命中、但內容與已知詐騙話術高度相似時直接回傳，
+只有不確定的訊息才升級給 LLM。
+
+- 離線以 data/scam_dataset.csv 訓練 (詐騙類型 + 話術欄位)：
+      python text_classifier.py train [--data data/scam_dataset.csv] [--out data/scam_classifier.json]
+- 模型檔為 JSON：每個 n-gram 對應 [idf, 各類別權重...]，載入即可使用，不需重新訓練。
+- 評分只需查表累加訊息本身的 n-gram，一則訊息遠低於 1 ms。
+
+資料集只有詐騙樣本 (沒有正常訊息)，因此分類器不會判定「安全」；
+只有「與某類別中心的相似度夠高」且「與第二名的差距夠大」時才視為有把握。
+資料集的類型名稱在輸出時換成 Plan B / 預烘焙答案使用的名稱 (SCAM_TYPE_ALIASES)，
+後台統計與紀錄查詢不會因為同一類型有兩種寫法而分成兩組；
+對應到同一名稱的類別 (例如假網拍與解除分期) 仍各自保留類別中心，比較時取其中最高分。
+"""
+
+import argparse
+import csv
+import json
+import math
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from result_cache import normalize_text
+
+MODEL_FORMAT_VERSION = 1
+
+# scam_dataset.csv 的類型名稱 -> 全系統統一的 scam_type (與 keyword_rules.csv、baked_results.py 一致)
+SCAM_TYPE_ALIASES = {
+    "假網路購物/拍賣": "網路購物詐騙",
+    "解除分期付款": "網路購物詐騙",
+    "假冒親友/公務機關": "假冒機構（公務員）詐騙",
+    "假交友（愛情詐騙）": "假交友（徵婚詐財）詐騙",
+}
+
+
+def char_ngrams(normalized: str, n_min: int, n_max: int) -> Counter:
+    grams = Counter()
+    for n in range(n_min, n_max + 1):
+        for i in range(len(normalized) - n + 1):
+            grams[normalized[i:i + n]] += 1
+    return grams
+
+
+def _tfidf(grams: Counter, idf: Dict[str, float]) -> Dict[str, float]:
+    """sublinear TF x IDF，L2 正規化；不在詞彙表中的 n-gram 忽略"""
+    vec = {g: (1.0 + math.log(c)) * idf[g] for g, c in grams.items() if g in idf}
+    norm = math.sqrt(sum(v * v for v in vec.values()))
+    if norm == 0:
+        return {}
+    return {g: v / norm for g, v in vec.items()}
+
+
+def load_training_rows(path: str) -> List[Tuple[str, str]]:
+    """讀取 scam_dataset.csv，回傳 [(詐騙類型, 話術)]"""
+    rows = []
+    with open(path, mode="r", encoding="utf-8") as infile:
+        reader = csv.reader(infile)
+        header = next(reader, None)
+        if not header:
+            return rows
+        type_col = next((i for i, h in enumerate(header) if "Scam Type" in h or "詐騙類型" in h), 1)
+        text_col = next((i for i, h in enumerate(header) if "Input" in h or "訓練輸入" in h), 2)
+        for row in reader:
+            if len(row) <= max(type_col, text_col):
+                continue
+            scam_type, text = row[type_col].strip(), row[text_col].strip()
+            if scam_type and text:
+                rows.append((scam_type, text))
+    return rows
+
+
+def train(rows: List[Tuple[str, str]], n_min: int = 1, n_max: int = 3, min_df: int = 2) -> dict:
+    """訓練模型並回傳可序列化的 dict"""
+    docs = [(scam_type, char_ngrams(normalize_text(text), n_min, n_max)) for scam_type, text in rows]
+    df = Counter()
+    for _, grams in docs:
+        df.update(grams.keys())
+    n_docs = len(docs)
+    idf = {g: math.log((1 + n_docs) / (1 + d)) + 1.0 for g, d in df.items() if d >= min_df}
+
+    classes = sorted({scam_type for scam_type, _ in docs})
+    class_index = {c: i for i, c in enumerate(classes)}
+    centroids = [defaultdict(float) for _ in classes]
+    counts = Counter()
+    for scam_type, grams in docs:
+        k = class_index[scam_type]
+        counts[k] += 1
+        for g, v in _tfidf(grams, idf).items():
+            centroids[k][g] += v
+    # 類別中心 = 平均向量再做 L2 正規化
+    for k, centroid in enumerate(centroids):
+        norm = math.sqrt(sum(v * v for v in centroid.values())) or 1.0
+        for g in centroid:
+            centroid[g] /= norm
+
+    vocab = {}
+    for g, w in idf.items():
+        weights = [round(centroids[k].get(g, 0.0), 6) for k in range(len(classes))]
+        if any(weights):
+            vocab[g] = [round(w, 6)] + weights
+    return {
+        "format": MODEL_FORMAT_VERSION,
+        "ngram": [n_min, n_max],
+        "classes": classes,
+        "class_counts": [counts[k] for k in range(len(classes))],
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "vocab": vocab,
+    }
+
+
+class ScamClassifier:
+    """載入訓練好的模型檔並評分"""
+
+    def __init__(self, model: dict, min_similarity: float = 0.35, min_margin: float = 0.08):
+        if model.get("format") != MODEL_FORMAT_VERSION:
+            raise ValueError(f"不支援的模型格式: {model.get('format')}")
+        self.n_min, self.n_max = model["ngram"]
+        self.classes: List[str] = model["classes"]
+        self.labels: List[str] = [SCAM_TYPE_ALIASES.get(c, c) for c in self.classes]
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        vocab = model["vocab"]
+        self._idf = {g: row[0] for g, row in vocab.items()}
+        self._weights = {g: row[1:] for g, row in vocab.items()}
+        self.stats = {"scored": 0, "confident": 0}
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "ScamClassifier":
+        with open(path, mode="r", encoding="utf-8") as infile:
+            return cls(json.load(infile), **kwargs)
+
+    def __len__(self) -> int:
+        return len(self._idf)
+
+    def scores(self, text: str) -> List[float]:
+        """各類別的 cosine 相似度"""
+        vec = _tfidf(char_ngrams(normalize_text(text), self.n_min, self.n_max), self._idf)
+        totals = [0.0] * len(self.classes)
+        for g, v in vec.items():
+            for k, w in enumerate(self._weights[g]):
+                if w:
+                    totals[k] += v * w
+        return totals
+
+    def label_scores(self, text: str) -> Dict[str, float]:
+        """依統一後的 scam_type 彙整相似度 (同名類別取最高分)"""
+        best: Dict[str, float] = {}
+        for label, score in zip(self.labels, self.scores(text)):
+            if score > best.get(label, float("-inf")):
+                best[label] = score
+        return best
+
+    def best_guess(self, text: str) -> Optional[dict]:
+        """不套用門檻，回傳相似度最高的類別 (延遲預算不足時的暫定判斷用)"""
+        totals = self.label_scores(text)
+        if not totals:
+            return None
+        label = max(totals, key=totals.__getitem__)
+        if totals[label] <= 0:
+            return None
+        return {"scam_type": label, "similarity": round(totals[label], 3)}
+
+    def classify(self, text: str) -> Optional[dict]:
+        """
+        有把握時回傳 {"scam_type", "similarity", "margin"}，否則回傳 None (交給 LLM)。
+        """
+        self.stats["scored"] += 1
+        totals = self.label_scores(text)
+        if not totals:
+            return None
+        ranked = sorted(totals, key=totals.__getitem__, reverse=True)
+        best = totals[ranked[0]]
+        margin = best - (totals[ranked[1]] if len(ranked) > 1 else 0.0)
+        if best < self.min_similarity or margin < self.min_margin:
+            return None
+        self.stats["confident"] += 1
+        return {"scam_type": ranked[0], "similarity": round(best, 3), "margin": round(margin, 3)}
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "classes": len(self.classes), "labels": sorted(set(self.labels)), "vocab": len(self),
+                "min_similarity": self.min_similarity, "min_margin": self.min_margin}
+
+
+def load_classifier(path: str, **kwargs) -> Optional[ScamClassifier]:
+    """載入模型檔；檔案不存在或格式錯誤時回傳 None (略過 Plan C)"""
+    try:
+        classifier = ScamClassifier.load(path, **kwargs)
+    except FileNotFoundError:
+        print(f"--- 找不到分類器模型 {path}，略過 Plan C (可執行 python text_classifier.py train) ---")
+        return None
+    except Exception as e:
+        print(f"分類器模型載入失敗 ({path}): {e}")
+        return None
+    print(f"--- Plan C 分類器已載入 ({len(classifier.classes)} 類, {len(classifier)} 個 n-gram) ---")
+    return classifier
+
+
+def main():
+    parser = argparse.ArgumentParser(description="訓練 Plan C 字元 n-gram 分類器")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_cmd = sub.add_parser("train", help="從資料集訓練並輸出模型檔")
+    train_cmd.add_argument("--data", default="data/scam_dataset.csv")
+    train_cmd.add_argument("--out", default="data/scam_classifier.json")
+    train_cmd.add_argument("--ngram-max", type=int, default=3)
+    train_cmd.add_argument("--min-df", type=int, default=2)
+    args = parser.parse_args()
+
+    rows = load_training_rows(args.data)
+    model = train(rows, n_max=args.ngram_max, min_df=args.min_df)
+    with open(args.out, mode="w", encoding="utf-8") as outfile:
+        json.dump(model, outfile, ensure_ascii=False, separators=(",", ":"))
+    print(f"已訓練 {len(rows)} 筆樣本、{len(model['classes'])} 類、{len(model['vocab'])} 個 n-gram -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
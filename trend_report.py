@@ -0,0 +1,71 @@
+# trend_report.py
+"""
+後台 AI 趨勢報告的快取與背景更新。
+
+原本每次呼叫 /api/admin/analysis 都會重新請 LLM 生成報告；
+多位管理者同時重新整理就會產生多個相同的生成請求。
+現在報告依紀錄版本號快取，只有在「距離上次生成超過 interval 秒」
+或「新增紀錄達 min_new_logs 筆」時才在背景重新生成 (同時最多一個)；
+後者也必須距離上次生成至少 min_gap 秒，持續有流量時不會連續呼叫 LLM。
+請求一律立即拿到最新一份已完成的報告與其產生時間。
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+
+class TrendReporter:
+    def __init__(self, generate: Callable[[], Awaitable[str]], interval: float = 60.0, min_new_logs: int = 5,
+                 min_gap: float = 15.0):
+        self._generate = generate
+        self.interval = interval
+        self.min_new_logs = min_new_logs
+        self.min_gap = min(min_gap, interval)
+        self.report: Optional[str] = None
+        self.generated_at: Optional[float] = None
+        self.based_on_version = -1
+        self._task: Optional[asyncio.Task] = None
+        self._last_started = 0.0
+        self._retry_after = 0.0
+        self.stats = {"generations": 0, "failures": 0}
+
+    @property
+    def refreshing(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def maybe_refresh(self, version: int):
+        """依版本號判斷是否需要在背景重新生成 (需在 event loop 中呼叫)"""
+        if self.refreshing or version == self.based_on_version:
+            return
+        now = time.monotonic()
+        if now < self._retry_after:
+            return
+        new_logs = version - self.based_on_version
+        elapsed = now - self._last_started
+        if self.report is None or elapsed >= self.interval or (new_logs >= self.min_new_logs and elapsed >= self.min_gap):
+            self._last_started = now
+            self._task = asyncio.create_task(self._run(version))
+
+    async def _run(self, version: int):
+        try:
+            report = await self._generate()
+        except Exception as e:
+            print(f"AI 趨勢報告生成失敗: {e}")
+            self.stats["failures"] += 1
+            self._retry_after = time.monotonic() + self.interval
+            return
+        self.report = report
+        self.generated_at = time.time()
+        self.based_on_version = version
+        self.stats["generations"] += 1
+
+    def view(self, pending_text: str) -> dict:
+        """回傳最新完成的報告；尚未有任何報告時回傳 pending_text"""
+        return {
+            "trend_report": self.report if self.report is not None else pending_text,
+            "report_generated_at": self.generated_at,
+            "report_age_seconds": round(time.time() - self.generated_at, 1) if self.generated_at else None,
+            "report_version": self.based_on_version,
+            "refreshing": self.refreshing,
+        }
@@ -0,0 +1,171 @@
+# upstream_proxy.py
+"""
+165dashboard 上游代理 (KPI / 縣市詐騙數據) 的共用快取層。
+
+- 共用一個 httpx.AsyncClient (連線池)，不再在 async 路由中呼叫 requests.get。
+- 以 (endpoint, date) 為 key 快取；過去日期的資料不會再變，永久快取；
+  當天資料在 fresh_ttl 秒內直接回傳。
+- stale-while-revalidate：資料過期時先回傳舊資料，背景更新 (同一 key 同時只更新一次)。
+- 上游故障時持續回傳最後一次成功的資料 (last-known-good)。
+- 某個 key 更新失敗後 error_backoff 秒內不再呼叫上游：有舊資料就回傳舊資料，
+  沒有時直接拋出 UpstreamUnavailable，避免每個請求都去打已經掛掉的上游。
+- 設定 fixture_dir 時改讀本地 JSON (測試 / 離線展示用)；
+  base_url 也可指向替身上游服務。
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+
+class UpstreamUnavailable(Exception):
+    """上游最近更新失敗、仍在退避期間，且沒有任何快取可回傳"""
+
+
+class _CacheEntry:
+    __slots__ = ("data", "fetched_at", "permanent")
+
+    def __init__(self, data, fetched_at: float, permanent: bool):
+        self.data = data
+        self.fetched_at = fetched_at
+        self.permanent = permanent
+
+
+def _is_past_date(date: str) -> bool:
+    try:
+        return datetime.date.fromisoformat(date) < datetime.date.today()
+    except ValueError:
+        return False
+
+
+class UpstreamProxy:
+    def __init__(self, base_url: str, fresh_ttl: float = 300.0, timeout: float = 8.0,
+                 fixture_dir: Optional[str] = None, max_entries: int = 2000, error_backoff: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        self.fresh_ttl = fresh_ttl
+        self.timeout = timeout
+        self.fixture_dir = fixture_dir
+        self.max_entries = max_entries
+        self.error_backoff = error_backoff
+        self._cache: "OrderedDict[Tuple[str, str], _CacheEntry]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._failed_at: "OrderedDict[Tuple[str, str], float]" = OrderedDict()   # 最近一次更新失敗的時間
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats = {"fresh_hits": 0, "stale_hits": 0, "misses": 0, "upstream_calls": 0, "upstream_errors": 0, "served_stale_on_error": 0,
+                      "backoff_skips": 0}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get(self, endpoint: str, date: str, params: str) -> dict:
+        """
+        取得 {base_url}/{endpoint}?{params} 的 JSON。
+        params 中的 {ts} 會被替換成該日期的 API 時間戳。
+        上游失敗且沒有任何快取時拋出例外。
+        """
+        key = (endpoint, date)
+        entry = self._cache.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            self._cache.move_to_end(key)
+            if entry.permanent or now - entry.fetched_at < self.fresh_ttl:
+                self.stats["fresh_hits"] += 1
+                return entry.data
+            # 過期：先回傳舊資料，背景更新 (最近失敗過就先不更新)
+            self.stats["stale_hits"] += 1
+            if self._backing_off(key, now):
+                self.stats["backoff_skips"] += 1
+            else:
+                self._refresh(key, params)
+            return entry.data
+
+        self.stats["misses"] += 1
+        if self._backing_off(key, now):
+            self.stats["backoff_skips"] += 1
+            raise UpstreamUnavailable(f"165dashboard 暫時無法連線 ({endpoint}, {date})")
+        try:
+            return await asyncio.shield(self._refresh(key, params))
+        except Exception:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self.stats["served_stale_on_error"] += 1
+                return entry.data
+            raise
+
+    def _backing_off(self, key: Tuple[str, str], now: float) -> bool:
+        failed_at = self._failed_at.get(key)
+        return failed_at is not None and now - failed_at < self.error_backoff
+
+    def _refresh(self, key: Tuple[str, str], params: str) -> asyncio.Task:
+        """同一個 key 同時只會有一個更新任務 (single-flight)"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_and_store(key, params))
+            task.add_done_callback(lambda t: self._on_refresh_done(key, t))
+            self._inflight[key] = task
+        return task
+
+    def _on_refresh_done(self, key: Tuple[str, str], task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            # 背景更新失敗時保留 last-known-good，不讓例外變成未處理警告
+            print(f"165dashboard 更新失敗 {key}: {task.exception()}")
+
+    async def _fetch_and_store(self, key: Tuple[str, str], params: str):
+        endpoint, date = key
+        self.stats["upstream_calls"] += 1
+        try:
+            data = await self._fetch(endpoint, date, params)
+        except Exception:
+            self.stats["upstream_errors"] += 1
+            self._failed_at[key] = time.monotonic()
+            self._failed_at.move_to_end(key)
+            while len(self._failed_at) > self.max_entries:
+                self._failed_at.popitem(last=False)
+            raise
+        self._failed_at.pop(key, None)
+        self._cache[key] = _CacheEntry(data, time.monotonic(), _is_past_date(date))
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return data
+
+    async def _fetch(self, endpoint: str, date: str, params: str):
+        if self.fixture_dir:
+            for name in (f"{endpoint}_{date}.json", f"{endpoint}.json"):
+                path = os.path.join(self.fixture_dir, name)
+                if os.path.exists(path):
+                    with open(path, mode="r", encoding="utf-8") as infile:
+                        return json.load(infile)
+            raise FileNotFoundError(f"找不到 fixture: {endpoint} ({date})")
+        url = f"{self.base_url}/{endpoint}?{params.format(ts=f'{date}T16:00:00Z')}"
+        resp = await self._get_client().get(url)
+        resp.raise_for_status()
+        return resp.json()
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "entries": len(self._cache),
+            "permanent_entries": sum(1 for e in self._cache.values() if e.permanent),
+            "inflight": len(self._inflight),
+            "fresh_ttl": self.fresh_ttl,
+            "backing_off": sum(1 for t in self._failed_at.values() if time.monotonic() - t < self.error_backoff),
+            "fixture_dir": self.fixture_dir,
+        }
@@ -0,0 +1,195 @@
+# village_data.py
+"""
+里別詐騙熱區資料 (/api/village_scam_data) 的預載與快取。
+
+原本每次請求都重新開啟兩個 CSV、嘗試多種編碼、重建欄位對照並逐列合併。
+現在啟動時合併一次，存成不可變的快照：
+- records：合併後的里別資料 (tuple)
+- body / gzip_body：預先序列化與壓縮好的 JSON bytes
+- etag：內容雜湊 (strong ETag)
+- index：空間網格索引 (bbox / 最近里別 / 類別前 N 名查詢)
+只有在來源檔案 mtime 變動時才重新建立，請求路徑只剩記憶體複製。
+"""
+
+import csv
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from spatial_index import GridIndex
+
+_ENCODINGS = ("utf-8", "cp950", "big5")
+
+
+def _load_csv_coords(path: str) -> Dict[str, dict]:
+    """嘗試多種編碼讀取 coordinates CSV，回傳 {里名: {"lat", "lng"}}"""
+    last_err = None
+    for enc in _ENCODINGS:
+        try:
+            with open(path, mode="r", encoding=enc) as infile:
+                reader = csv.DictReader(infile)
+                if not reader.fieldnames:
+                    continue
+                # 優先找常見的里名欄位，否則使用第一個欄位
+                key_col = None
+                for candidate in ["里名", "里", "name"]:
+                    if candidate in reader.fieldnames:
+                        key_col = candidate
+                        break
+                if not key_col:
+                    key_col = reader.fieldnames[0]
+
+                coords = {}
+                for row in reader:
+                    try:
+                        key = row.get(key_col)
+                        if not key:
+                            continue
+                        coords[key] = {"lat": float(row.get("lat") or row.get("LAT") or 0), "lng": float(row.get("lng") or row.get("LON") or 0)}
+                    except Exception:
+                        continue
+                return coords
+        except Exception as ex:
+            last_err = ex
+            continue
+    raise last_err or FileNotFoundError(path)
+
+
+def _find_header(candidates, fieldnames) -> Optional[str]:
+    """容錯的欄位對照：去除 BOM / 空白後，包含任一候選字即視為該欄位"""
+    for h in fieldnames or []:
+        if not h:
+            continue
+        hn = h.strip().replace('﻿', '')
+        for c in candidates:
+            if c in hn:
+                return h
+    return None
+
+
+def _load_scam_rows(path: str, coords_map: Dict[str, dict]) -> List[dict]:
+    """讀取熱區資料 CSV 並與座標合併"""
+    last_err = None
+    for enc in _ENCODINGS:
+        try:
+            scam_data = []
+            with open(path, mode="r", encoding=enc) as infile:
+                reader = csv.DictReader(infile)
+                name_col = _find_header(["里名", "里", "name"], reader.fieldnames)
+                inv_col = _find_header(["投資"], reader.fieldnames)
+                shop_col = _find_header(["網購", "購物", "shopping"], reader.fieldnames)
+                auc_col = _find_header(["網拍", "拍賣", "假網拍", "auction"], reader.fieldnames)
+                dating_col = _find_header(["交友", "假交友", "dating"], reader.fieldnames)
+                marriage_col = _find_header(["徵婚", "婚", "marriage"], reader.fieldnames)
+
+                for row in reader:
+                    village_name = row.get(name_col) if name_col else row.get(reader.fieldnames[0])
+                    if not village_name:
+                        continue
+                    coord = coords_map.get(village_name)
+                    if coord:
+                        try:
+                            scam_data.append({
+                                "name": village_name,
+                                "location": {"lat": coord["lat"], "lng": coord["lng"]},
+                                "investment": float(row.get(inv_col, 0) or 0),
+                                "shopping": float(row.get(shop_col, 0) or 0),
+                                "auction": float(row.get(auc_col, 0) or 0),
+                                "dating": float(row.get(dating_col, 0) or 0),
+                                "marriage": float(row.get(marriage_col, 0) or 0),
+                            })
+                        except (ValueError, TypeError):
+                            continue
+            return scam_data
+        except Exception as ex:
+            last_err = ex
+            continue
+    raise last_err or FileNotFoundError(path)
+
+
+class VillageSnapshot:
+    """一次合併結果 (建立後不再修改)"""
+    __slots__ = ("records", "body", "gzip_body", "etag", "index", "loaded_at")
+
+    def __init__(self, records: List[dict]):
+        self.records: Tuple[dict, ...] = tuple(records)
+        self.body = json.dumps(records, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.gzip_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.etag = f'"{hashlib.blake2b(self.body, digest_size=16).hexdigest()}"'
+        self.index = GridIndex(self.records)
+        self.loaded_at = time.time()
+
+
+class VillageDataset:
+    """里別座標 + 熱區資料的預載快照，來源檔案 mtime 變動時重新建立"""
+
+    def __init__(self, coords_path: str, scam_path: str, check_interval: float = 2.0):
+        self.coords_path = coords_path
+        self.scam_path = scam_path
+        self.check_interval = check_interval
+        self.snapshot_data: Optional[VillageSnapshot] = None
+        self.last_error: Optional[str] = None
+        self._mtimes: Optional[Tuple[float, float]] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"reloads": 0, "reload_errors": 0}
+        self.reload()
+
+    def _current_mtimes(self) -> Tuple[float, float]:
+        return os.path.getmtime(self.coords_path), os.path.getmtime(self.scam_path)
+
+    def reload(self) -> bool:
+        """重新合併兩個 CSV；失敗時保留上一份快照"""
+        try:
+            mtimes = self._current_mtimes()
+            try:
+                coords_map = _load_csv_coords(self.coords_path)
+            except Exception as e:
+                raise RuntimeError(f"無法讀取 village_coordinates.csv: {e}") from e
+            try:
+                records = _load_scam_rows(self.scam_path, coords_map)
+            except Exception as e:
+                raise RuntimeError(f"讀取熱區資料失敗: {e}") from e
+            snapshot = VillageSnapshot(records)
+        except Exception as e:
+            print(f"里別熱區資料載入失敗: {e}")
+            with self._lock:
+                self.last_error = str(e)
+                self._mtimes = None
+            self.stats["reload_errors"] += 1
+            return False
+        with self._lock:
+            self.snapshot_data = snapshot
+            self.last_error = None
+            self._mtimes = mtimes
+        self.stats["reloads"] += 1
+        print(f"--- 里別熱區資料已載入 {len(snapshot.records)} 筆 ---")
+        return True
+
+    def current(self) -> Optional[VillageSnapshot]:
+        """回傳最新快照 (必要時依 mtime 重新載入)；從未成功載入時回傳 None"""
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            try:
+                changed = self._current_mtimes() != self._mtimes
+            except OSError:
+                changed = False
+            if changed:
+                self.reload()
+        return self.snapshot_data
+
+    def snapshot(self) -> dict:
+        snap = self.snapshot_data
+        return {
+            **self.stats,
+            "records": len(snap.records) if snap else 0,
+            "bytes": len(snap.body) if snap else 0,
+            "gzip_bytes": len(snap.gzip_body) if snap else 0,
+            "etag": snap.etag if snap else None,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,101 @@
+# worker_pool.py
+"""
+有上限的背景工作池 (執行緒 + 固定長度佇列)。
+
+LINE Webhook 只負責驗證簽章並把事件丟進佇列，立即回傳 200；
+真正耗時的偵測 / 詐騙模型生成由背景執行緒處理後再 reply。
+佇列滿時直接丟棄並記錄，避免請求堆積拖垮整台伺服器。
+
+每個執行緒有自己的佇列；submit 帶 key (例如 LINE user_id) 時依 key 雜湊固定分到同一個執行緒，
+同一使用者的事件依序處理，不會互相超車，也不會有兩個執行緒同時修改同一個 session。
+"""
+
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Hashable, Optional
+
+from latency_stats import summarize_ms
+
+
+class BoundedWorkerPool:
+    def __init__(self, name: str, workers: int = 4, maxsize: int = 200):
+        self.name = name
+        self.workers = workers
+        self.maxsize = maxsize
+        per_worker = max(1, -(-maxsize // workers))
+        self._queues = [queue.Queue(maxsize=per_worker) for _ in range(workers)]
+        self._round_robin = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=500)  # 最近的排隊等待時間 (秒)
+        self.stats = {"submitted": 0, "processed": 0, "failed": 0, "dropped": 0}
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, args=(self._queues[i],), name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for q in self._queues[:len(threads)]:
+            try:
+                q.put_nowait(None)
+            except queue.Full:
+                pass
+        for t in threads:
+            t.join(timeout=timeout)
+
+    def submit(self, fn: Callable, *args, key: Optional[Hashable] = None) -> bool:
+        """
+        放入佇列；佇列已滿時回傳 False (工作被丟棄)。
+        相同 key 的工作由同一個執行緒依序執行；沒有 key 時輪流分配。
+        """
+        self.start()
+        index = hash(key) if key is not None else next(self._round_robin)
+        try:
+            self._queues[index % self.workers].put_nowait((time.monotonic(), fn, args))
+        except queue.Full:
+            with self._lock:
+                self.stats["dropped"] += 1
+            print(f"⚠️ [{self.name}] 佇列已滿，丟棄一筆工作")
+            return False
+        with self._lock:
+            self.stats["submitted"] += 1
+        return True
+
+    def _run(self, jobs: "queue.Queue"):
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            enqueued_at, fn, args = job
+            wait = time.monotonic() - enqueued_at
+            try:
+                fn(*args)
+                ok = True
+            except Exception as e:
+                print(f"❌ [{self.name}] 背景工作失敗: {e}")
+                ok = False
+            with self._lock:
+                self._waits.append(wait)
+                self.stats["processed" if ok else "failed"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            waits = list(self._waits)
+            stats = dict(self.stats)
+        return {
+            **stats,
+            "workers": self.workers,
+            "queue_depth": sum(q.qsize() for q in self._queues),
+            "queue_max": self.maxsize,
+            **summarize_ms(waits, "wait_"),
+        }